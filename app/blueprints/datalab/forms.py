@@ -2,30 +2,84 @@
 Formularios de DataLab
 """
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, BooleanField
-from wtforms.validators import DataRequired, Length
+from flask_wtf.file import FileField, FileAllowed, MultipleFileField
+from wtforms import StringField, BooleanField, SelectField, HiddenField
+from wtforms.validators import DataRequired, Length, ValidationError
 from flask import current_app
 
 
-class UploadDatasetForm(FlaskForm):
-    """Formulario para subir dataset"""
+# Extensiones aceptadas por cada formulario de carga
+EXTENSIONES_DATASET = ['xlsx', 'xlsm', 'csv']
+EXTENSIONES_DENUNCIAS = ['xlsx', 'xlsm']
+
+
+class ArchivoOSubidaMixin:
+    """
+    El archivo llega en el formulario o, si es grande, ya subido por partes
+    (datalab.js envía entonces solo el id de la subida).
+    """
+    subida_id = HiddenField()
+    
+    def validate_file(self, field):
+        if not field.data and not self.subida_id.data:
+            raise ValidationError('Debe seleccionar un archivo')
+    
+    def validate_subida_id(self, field):
+        if field.data and not field.data.isdigit():
+            raise ValidationError('Subida inválida')
+
+
+class UploadDatasetForm(ArchivoOSubidaMixin, FlaskForm):
+    """
+    Formulario para subir dataset: uno o varios archivos (los grandes, por
+    partes: subida_id lleva entonces los ids separados por coma)
+    """
     name = StringField('Nombre del dataset', validators=[
         DataRequired(), 
         Length(min=3, max=200, message='El nombre debe tener entre 3 y 200 caracteres')
     ])
-    file = FileField('Archivo', validators=[
-        FileRequired(message='Debe seleccionar un archivo'),
-        FileAllowed(['xlsx', 'xlsm', 'csv'], message='Solo se permiten archivos Excel (.xlsx, .xlsm) o CSV')
+    file = MultipleFileField('Archivos', validators=[
+        FileAllowed(EXTENSIONES_DATASET, message='Solo se permiten archivos Excel (.xlsx, .xlsm) o CSV')
+    ])
+    hojas = SelectField('Hojas de Excel', choices=[
+        ('primera', 'Solo la primera hoja'),
+        ('todas', 'Todas las hojas')
+    ], default='primera')
+    combinar = SelectField('Varias hojas o archivos', choices=[
+        ('separados', 'Un dataset por hoja o archivo'),
+        ('concatenar', 'Un solo dataset con todas las filas (columna "origen")')
+    ], default='separados')
+    
+    def validate_subida_id(self, field):
+        if field.data and not all(parte.isdigit() for parte in field.data.split(',')):
+            raise ValidationError('Subida inválida')
+    
+    def subida_ids(self):
+        """Ids de las subidas por partes del formulario"""
+        return [int(parte) for parte in self.subida_id.data.split(',')] if self.subida_id.data else []
+
+
+class AgregarFilasForm(ArchivoOSubidaMixin, FlaskForm):
+    """Formulario para agregar filas a un dataset (mismas columnas que el dataset)"""
+    file = FileField('Archivo con las filas nuevas', validators=[
+        FileAllowed(EXTENSIONES_DATASET, message='Solo se permiten archivos Excel (.xlsx, .xlsm) o CSV')
     ])
 
 
-class UploadDenunciasForm(FlaskForm):
+class UploadDenunciasForm(ArchivoOSubidaMixin, FlaskForm):
     """Formulario para subir archivo de denuncias web"""
     file = FileField('Archivo Excel de Denuncias', validators=[
-        FileRequired(message='Debe seleccionar un archivo'),
-        FileAllowed(['xlsx', 'xlsm'], message='Solo se permiten archivos Excel (.xlsx, .xlsm)')
+        FileAllowed(EXTENSIONES_DENUNCIAS, message='Solo se permiten archivos Excel (.xlsx, .xlsm)')
     ])
-    confirmar_eliminacion = BooleanField('Confirmo que deseo eliminar todos los datos actuales', 
-                                        validators=[DataRequired(message='Debe confirmar la eliminación')])
+    modo = SelectField('Modo de carga', choices=[
+        ('reemplazar', 'Reemplazar todos los datos actuales'),
+        ('sincronizar', 'Sincronizar (actualizar por ID, solo cambios)')
+    ], default='reemplazar')
+    retirar_faltantes = BooleanField('Eliminar denuncias cuyo ID ya no figura en el archivo')
+    confirmar_eliminacion = BooleanField('Confirmo que deseo eliminar los datos indicados')
+    
+    def validate_confirmar_eliminacion(self, field):
+        """La confirmación solo es obligatoria si la carga elimina datos"""
+        if (self.modo.data == 'reemplazar' or self.retirar_faltantes.data) and not field.data:
+            raise ValidationError('Debe confirmar la eliminación')
 
@@ -1,40 +1,266 @@
 """
 Rutas de DataLab
 """
-from flask import render_template, redirect, url_for, flash, request, jsonify
+import json
+from flask import (
+    render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, current_app
+)
 from flask_login import login_required, current_user
 from datetime import datetime
 from app.blueprints.datalab import bp
-from app.blueprints.datalab.forms import UploadDatasetForm, UploadDenunciasForm
-from app.blueprints.datalab.services import process_uploaded_file, get_user_datasets, get_dataset_by_id
-from app.blueprints.datalab.services_denuncias import procesar_archivo_denuncias, obtener_datos_graficos, aplicar_filtros
+from app.blueprints.datalab.forms import (
+    UploadDatasetForm, AgregarFilasForm, UploadDenunciasForm, EXTENSIONES_DATASET, EXTENSIONES_DENUNCIAS
+)
+from app.blueprints.datalab.services import (
+    get_user_datasets, get_dataset_by_id, serie_temporal, listar_filas, buscar_dataset_por_contenido
+)
+from app.blueprints.datalab.services_denuncias import (
+    obtener_datos_graficos, aplicar_filtros, consulta_denuncias, carga_publicada, carga_anterior,
+    revertir_carga, listar_denuncias, opciones_cascada, CursorInvalido, SliceInvalido, exportar_csv, exportar_xlsx
+)
 from app.services.rbac import require_permission
 from app.services.audit import audit_log
+from app.services.file_storage import save_uploaded_file, save_content_addressed
+from app.services.subidas import (
+    iniciar_subida, obtener_subida, agregar_bloque, finalizar_subida, descartar_subida,
+    SubidaInvalida, PosicionIncorrecta
+)
+from app.services.trabajos import encolar_trabajo, obtener_trabajo, trabajo_activo, trabajo_pendiente_con
+from app.services.datalab_rows import encode_cursor
+from app.services.datalab_sql import execute_query, describe_tables, ConsultaInvalida
 from app.models.denuncia_web import DenunciaWeb
+from app.models.trabajo import Trabajo
+
+
+# Formatos de exportación de denuncias: formato -> (generador, mimetype)
+FORMATOS_EXPORTACION = {
+    'csv': (exportar_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (exportar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def _es_ajax():
+    """El formulario se envió con fetch desde datalab.js (espera JSON)"""
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def _guardar_archivo(form, extensiones):
+    """Guarda el archivo subido (o la subida por partes) para procesarlo en segundo plano"""
+    try:
+        if form.subida_id.data:
+            file_path = _archivo_subido(int(form.subida_id.data), extensiones, por_contenido=False)[0]
+        else:
+            file_path, safe_filename = save_uploaded_file(form.file.data, current_user.unidad_id)
+    except Exception as e:
+        return None, f'Error al guardar el archivo: {str(e)}'
+    return file_path, None
+
+
+def _archivo_subido(subida_id, extensiones, por_contenido=True):
+    """
+    Archivo del formulario que llegó por partes (ver subidas).
+    
+    Returns:
+        tuple: (ruta_completa, sha256 o None, ya_existia, nombre_original)
+    """
+    subida = obtener_subida(subida_id, current_user.unidad_id, current_user.id)
+    if not subida:
+        raise SubidaInvalida('La subida no existe o ya fue utilizada')
+    original_filename = subida.filename
+    return finalizar_subida(subida, extensiones, por_contenido) + (original_filename,)
+
+
+def _archivos_dataset(form):
+    """
+    Guarda los archivos del formulario de datasets: los enviados en el
+    formulario y los subidos por partes.
+    
+    Returns:
+        list: (ruta_completa, sha256, ya_existia, nombre_original) por archivo
+    """
+    archivos = [_archivo_subido(subida_id, EXTENSIONES_DATASET) for subida_id in form.subida_ids()]
+    for archivo in form.file.data or []:
+        archivos.append(save_content_addressed(archivo, current_user.unidad_id) + (archivo.filename,))
+    return archivos
+
+
+def _url_resultado(trabajo):
+    """Página a la que se dirige al usuario cuando el trabajo termina bien"""
+    if trabajo.tipo in ('dataset', 'dataset_agregar'):
+        return url_for('datalab.dataset_view', dataset_id=trabajo.get_resultado().get('dataset_id'))
+    if trabajo.tipo == 'dataset_lote':
+        dataset_ids = trabajo.get_resultado().get('dataset_ids') or []
+        if len(dataset_ids) == 1:
+            return url_for('datalab.dataset_view', dataset_id=dataset_ids[0])
+        return url_for('datalab.datasets')
+    return url_for('datalab.denuncias_dashboard')
+
+
+def _respuesta_trabajo(trabajo, url_formulario):
+    """
+    Respuesta al lanzar un trabajo: JSON con la URL de estado para que
+    datalab.js consulte el avance, o redirección al formulario (que muestra
+    el avance del trabajo activo) si el envío no fue por fetch.
+    """
+    if _es_ajax():
+        return jsonify({
+            'success': True,
+            'trabajo': trabajo.to_dict(),
+            'url_estado': url_for('datalab.trabajo_estado', trabajo_id=trabajo.id)
+        }), 202
+    
+    if trabajo.estado == Trabajo.COMPLETADO:
+        resultado = trabajo.get_resultado()
+        flash(f"✅ {resultado.get('mensaje', 'Proceso completado')}", 'success')
+        if resultado.get('advertencia'):
+            flash(f"⚠️ {resultado['advertencia']}", 'warning')
+        return redirect(_url_resultado(trabajo))
+    if trabajo.estado == Trabajo.FALLIDO:
+        flash(f'❌ Error: {trabajo.error}', 'danger')
+    else:
+        flash('Archivo recibido: se está procesando en segundo plano.', 'info')
+    return redirect(url_formulario)
+
+
+def _respuesta_duplicado(dataset):
+    """Respuesta cuando el archivo subido ya estaba cargado en la unidad: se reutiliza el dataset"""
+    mensaje = f'El archivo ya estaba cargado como "{dataset.name}": se reutiliza ese dataset'
+    url = url_for('datalab.dataset_view', dataset_id=dataset.id)
+    if _es_ajax():
+        return jsonify({'success': True, 'duplicado': True, 'message': mensaje, 'url': url})
+    flash(f'ℹ️ {mensaje}', 'info')
+    return redirect(url)
+
+
+def _error_formulario(mensaje, plantilla, **contexto):
+    """Error de validación o al guardar: JSON para fetch o la página con el mensaje"""
+    if _es_ajax():
+        return jsonify({'success': False, 'message': mensaje}), 400
+    flash(f'❌ Error: {mensaje}', 'danger')
+    return render_template(plantilla, **contexto)
+
+
+def _errores_formulario(form):
+    """Errores de validación del formulario en un solo texto"""
+    return '; '.join(error for errores in form.errors.values() for error in errores)
 
 
 @bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 @require_permission('DATALAB_UPLOAD')
 def upload():
-    """Subir archivo al DataLab"""
+    """
+    Subir archivos al DataLab (se procesan en segundo plano). Un archivo
+    con su primera hoja da un dataset; varios archivos o todas las hojas de
+    un Excel se procesan juntos en paralelo (un dataset por hoja o archivo,
+    o uno concatenado).
+    """
     form = UploadDatasetForm()
+    contexto = {'form': form, 'trabajo': trabajo_activo(current_user.id, ['dataset', 'dataset_lote'])}
     
     if form.validate_on_submit():
-        dataset, error = process_uploaded_file(
-            file=form.file.data,
-            name=form.name.data,
-            unidad_id=current_user.unidad_id,
-            user_id=current_user.id
-        )
+        try:
+            archivos = _archivos_dataset(form)
+        except Exception as e:
+            return _error_formulario(f'Error al guardar el archivo: {str(e)}', 'datalab/upload.html', **contexto)
         
-        if dataset:
-            flash(f'Dataset "{dataset.name}" subido correctamente ({dataset.rows_count} filas, {dataset.columns_count} columnas)', 'success')
-            return redirect(url_for('datalab.dataset_view', dataset_id=dataset.id))
-        else:
-            flash(error, 'danger')
+        todas_las_hojas = form.hojas.data == 'todas'
+        if len(archivos) > 1 or (todas_las_hojas and not archivos[0][3].lower().endswith('.csv')):
+            trabajo = encolar_trabajo('dataset_lote', current_user.unidad_id, current_user.id,
+                                      archivos=[{'file_path': ruta, 'original_filename': nombre,
+                                                 'content_hash': content_hash}
+                                                for ruta, content_hash, _, nombre in archivos],
+                                      name=form.name.data,
+                                      todas_las_hojas=todas_las_hojas,
+                                      concatenar=form.combinar.data == 'concatenar')
+            return _respuesta_trabajo(trabajo, url_for('datalab.upload'))
+        
+        file_path, content_hash, ya_existia, original_filename = archivos[0]
+        
+        # Archivo idéntico ya procesado en la unidad: no se vuelve a procesar
+        existente = buscar_dataset_por_contenido(current_user.unidad_id, content_hash)
+        if existente:
+            audit_log('DATASET_REUSED', f'Subida repetida de {existente.name} (dataset {existente.id})')
+            return _respuesta_duplicado(existente)
+        
+        # El mismo archivo ya se está procesando: se sigue ese trabajo
+        trabajo = ya_existia and trabajo_pendiente_con(current_user.unidad_id, 'dataset', file_path=file_path)
+        if not trabajo:
+            trabajo = encolar_trabajo('dataset', current_user.unidad_id, current_user.id,
+                                      file_path=file_path,
+                                      original_filename=original_filename,
+                                      name=form.name.data,
+                                      content_hash=content_hash)
+        return _respuesta_trabajo(trabajo, url_for('datalab.upload'))
+    
+    if request.method == 'POST' and _es_ajax():
+        return jsonify({'success': False, 'message': _errores_formulario(form)}), 400
+    
+    return render_template('datalab/upload.html', **contexto)
+
+
+@bp.route('/subidas', methods=['POST'])
+@login_required
+@require_permission('DATALAB_UPLOAD')
+def subida_iniciar():
+    """Inicia una subida por partes: JSON {filename, size}"""
+    datos = request.get_json(silent=True) or {}
+    try:
+        subida = iniciar_subida(current_user.unidad_id, current_user.id, datos.get('filename'), datos.get('size'))
+    except SubidaInvalida as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'subida': subida.to_dict(),
+        'url': url_for('datalab.subida_estado', subida_id=subida.id),
+        'tamano_bloque': current_app.config['DATALAB_SUBIDA_BLOQUE_MB'] * 1024 * 1024
+    }), 201
+
+
+@bp.route('/subidas/<int:subida_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+@require_permission('DATALAB_UPLOAD')
+def subida_estado(subida_id):
+    """
+    GET: bytes recibidos (para retomar); PUT ?offset=N: agrega el bloque
+    del cuerpo en esa posición; DELETE: descarta la subida.
+    """
+    subida = obtener_subida(subida_id, current_user.unidad_id, current_user.id)
+    if not subida:
+        return jsonify({'success': False, 'message': 'Subida no encontrada'}), 404
+    
+    if request.method == 'DELETE':
+        descartar_subida(subida)
+        return jsonify({'success': True})
+    
+    if request.method == 'PUT':
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'success': False, 'message': 'Falta la posición del bloque (offset)'}), 400
+        try:
+            agregar_bloque(subida, offset, request.stream)
+        except PosicionIncorrecta as e:
+            return jsonify({'success': False, 'message': str(e), 'recibido': e.recibido}), 409
+        except SubidaInvalida as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({'success': True, 'subida': subida.to_dict()})
+
+
+@bp.route('/trabajos/<int:trabajo_id>')
+@login_required
+@require_permission('DATALAB_UPLOAD')
+def trabajo_estado(trabajo_id):
+    """Estado y avance de un trabajo en segundo plano (JSON, para polling)"""
+    trabajo = obtener_trabajo(trabajo_id, current_user.unidad_id, current_user.id)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
     
-    return render_template('datalab/upload.html', form=form)
+    datos = trabajo.to_dict()
+    if trabajo.estado == Trabajo.COMPLETADO:
+        datos['url'] = _url_resultado(trabajo)
+    return jsonify(datos)
 
 
 @bp.route('/datasets')
@@ -76,10 +302,139 @@ def dataset_view(dataset_id):
         dataset=dataset,
         preview=preview,
         profile=profile,
-        charts=charts
+        charts=charts,
+        cursor_filas=encode_cursor(len(preview))
     )
 
 
+@bp.route('/datasets/<int:dataset_id>/agregar', methods=['GET', 'POST'])
+@login_required
+@require_permission('DATALAB_UPLOAD')
+def dataset_agregar(dataset_id):
+    """Agregar filas de un archivo (mismas columnas) a un dataset, en segundo plano"""
+    dataset = get_dataset_by_id(dataset_id, current_user.unidad_id)
+    if not dataset:
+        flash('Dataset no encontrado o sin permisos', 'danger')
+        return redirect(url_for('datalab.datasets'))
+    
+    form = AgregarFilasForm()
+    contexto = {'form': form, 'dataset': dataset, 'trabajo': trabajo_activo(current_user.id, ['dataset_agregar'])}
+    
+    if form.validate_on_submit():
+        # Dos agregados a la vez sobre el mismo dataset escribirían la misma parte
+        if trabajo_pendiente_con(current_user.unidad_id, 'dataset_agregar', dataset_id=dataset.id):
+            return _error_formulario('Ya se están agregando filas a este dataset; espere a que termine',
+                                     'datalab/dataset_append.html', **contexto)
+        try:
+            if form.subida_id.data:
+                file_path, _, _, original_filename = _archivo_subido(
+                    int(form.subida_id.data), EXTENSIONES_DATASET, por_contenido=False
+                )
+            else:
+                original_filename = form.file.data.filename
+                file_path, _ = save_uploaded_file(form.file.data, current_user.unidad_id)
+        except Exception as e:
+            return _error_formulario(f'Error al guardar el archivo: {str(e)}', 'datalab/dataset_append.html',
+                                     **contexto)
+        
+        trabajo = encolar_trabajo('dataset_agregar', current_user.unidad_id, current_user.id,
+                                  dataset_id=dataset.id,
+                                  file_path=file_path,
+                                  original_filename=original_filename)
+        return _respuesta_trabajo(trabajo, url_for('datalab.dataset_agregar', dataset_id=dataset.id))
+    
+    if request.method == 'POST' and _es_ajax():
+        return jsonify({'success': False, 'message': _errores_formulario(form)}), 400
+    
+    return render_template('datalab/dataset_append.html', **contexto)
+
+
+@bp.route('/datasets/<int:dataset_id>/serie')
+@login_required
+@require_permission('DATALAB_VIEW')
+def dataset_serie(dataset_id):
+    """Serie temporal de un gráfico de línea, para otro rango o resolución (JSON)"""
+    dataset = get_dataset_by_id(dataset_id, current_user.unidad_id)
+    if not dataset:
+        return jsonify({'success': False, 'message': 'Dataset no encontrado'}), 404
+    
+    try:
+        serie = serie_temporal(
+            dataset,
+            request.args.get('fecha', ''),
+            request.args.get('valor', ''),
+            resolucion=request.args.get('resolucion') or None,
+            desde=request.args.get('desde') or None,
+            hasta=request.args.get('hasta') or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(serie)
+
+
+@bp.route('/datasets/<int:dataset_id>/filas')
+@login_required
+@require_permission('DATALAB_VIEW')
+def dataset_filas(dataset_id):
+    """
+    Filas de un dataset por páginas (JSON).
+    
+    Parámetros: columnas (separadas por coma), orden ('col,-col2'),
+    filtros (JSON: [{"column", "op": eq|in|range|contains, "value"}]),
+    limit y cursor (el 'siguiente' de la página anterior).
+    """
+    dataset = get_dataset_by_id(dataset_id, current_user.unidad_id)
+    if not dataset:
+        return jsonify({'success': False, 'message': 'Dataset no encontrado'}), 404
+    
+    try:
+        filtros = json.loads(request.args['filtros']) if request.args.get('filtros') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Filtros mal formados (se espera JSON)'}), 400
+    
+    try:
+        columnas = [c for c in request.args.get('columnas', '').split(',') if c] or None
+        limite = min(max(int(request.args.get('limit', 100)), 1),
+                     current_app.config.get('DATALAB_FILAS_MAX_PAGINA', 1000))
+        pagina = listar_filas(dataset, columnas, filtros, request.args.get('orden'),
+                              limite, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(pagina)
+
+
+@bp.route('/sql')
+@login_required
+@require_permission('DATALAB_VIEW')
+def sql():
+    """Consola SQL sobre los datasets de la unidad"""
+    return render_template('datalab/sql.html', tablas=describe_tables(current_user.unidad_id))
+
+
+@bp.route('/sql', methods=['POST'])
+@login_required
+@require_permission('DATALAB_VIEW')
+def sql_ejecutar():
+    """
+    Ejecuta una consulta SELECT (JSON {"sql": ...}) sobre los datasets de
+    la unidad; el resultado se envía por partes como JSON.
+    """
+    datos = request.get_json(silent=True) or {}
+    consulta = datos.get('sql') or request.form.get('sql', '')
+    
+    try:
+        resultado = execute_query(current_user.unidad_id, consulta)
+    except ConsultaInvalida as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    audit_log('DATALAB_SQL_QUERY', f'Consulta SQL: {consulta[:500]}')
+    
+    respuesta = Response(resultado.iter_json(), mimetype='application/json')
+    # Si el cliente se va antes de leer el resultado, se cierra igual la conexión
+    respuesta.call_on_close(resultado.cerrar)
+    return respuesta
+
+
 # ==================== RUTAS DE DENUNCIAS WEB ====================
 
 @bp.route('/denuncias/upload', methods=['GET', 'POST'])
@@ -90,29 +445,50 @@ def denuncias_upload():
     form = UploadDenunciasForm()
     
     # Obtener estadísticas actuales
-    total_actual = DenunciaWeb.query.filter_by(unidad_id=current_user.unidad_id).count()
-    ultima_carga = DenunciaWeb.query.filter_by(unidad_id=current_user.unidad_id).order_by(DenunciaWeb.created_at.desc()).first()
+    query_actual = consulta_denuncias(current_user.unidad_id)
+    total_actual = query_actual.count()
+    ultima_carga = carga_publicada(current_user.unidad_id) or \
+        query_actual.order_by(DenunciaWeb.created_at.desc()).first()
+    anterior = carga_anterior(current_user.unidad_id)
+    contexto = {
+        'form': form,
+        'total_actual': total_actual,
+        'ultima_carga': ultima_carga,
+        'carga_anterior': anterior,
+        'trabajo': trabajo_activo(current_user.id, ['denuncias_reemplazar', 'denuncias_sincronizar'])
+    }
     
     if form.validate_on_submit():
-        cantidad, error = procesar_archivo_denuncias(
-            file=form.file.data,
-            unidad_id=current_user.unidad_id,
-            user_id=current_user.id,
-            eliminar_existentes=True
-        )
+        file_path, error = _guardar_archivo(form, EXTENSIONES_DENUNCIAS)
+        if error:
+            return _error_formulario(error, 'datalab/denuncias/upload.html', **contexto)
         
-        if cantidad is not None:
-            flash(f'✅ {cantidad} denuncias cargadas correctamente', 'success')
-            if error:
-                flash(f'⚠️ {error}', 'warning')
-            return redirect(url_for('datalab.denuncias_upload'))
+        if form.modo.data == 'sincronizar':
+            trabajo = encolar_trabajo('denuncias_sincronizar', current_user.unidad_id, current_user.id,
+                                      file_path=file_path,
+                                      retirar_faltantes=form.retirar_faltantes.data)
         else:
-            flash(f'❌ Error: {error}', 'danger')
+            trabajo = encolar_trabajo('denuncias_reemplazar', current_user.unidad_id, current_user.id,
+                                      file_path=file_path)
+        return _respuesta_trabajo(trabajo, url_for('datalab.denuncias_upload'))
     
-    return render_template('datalab/denuncias/upload.html', 
-                         form=form, 
-                         total_actual=total_actual,
-                         ultima_carga=ultima_carga)
+    if request.method == 'POST' and _es_ajax():
+        return jsonify({'success': False, 'message': _errores_formulario(form)}), 400
+    
+    return render_template('datalab/denuncias/upload.html', **contexto)
+
+
+@bp.route('/denuncias/revertir', methods=['POST'])
+@login_required
+@require_permission('DATALAB_UPLOAD')
+def denuncias_revertir():
+    """Vuelve a publicar la carga anterior de denuncias"""
+    carga, error = revertir_carga(current_user.unidad_id)
+    if carga:
+        flash(f'✅ Se restauró la carga del {carga.created_at.strftime("%d/%m/%Y %H:%M")} ({carga.filas} denuncias)', 'success')
+    else:
+        flash(f'❌ {error}', 'danger')
+    return redirect(url_for('datalab.denuncias_upload'))
 
 
 @bp.route('/denuncias/dashboard', methods=['GET', 'POST'])
@@ -172,97 +548,86 @@ def denuncias_dashboard():
                          filtros_aplicados=filtros)
 
 
-@bp.route('/denuncias/dashboard/api', methods=['GET'])
-@login_required
-@require_permission('DATALAB_VIEW')
-def denuncias_dashboard_api():
-    """API para obtener datos de gráficos (AJAX)"""
-    from app.models.denuncia_web import DenunciaWeb
-    
-    # Si solo se piden opciones de filtros
-    if request.args.get('opciones'):
-        opcion = request.args.get('opciones')
-        query = DenunciaWeb.query.filter_by(unidad_id=current_user.unidad_id)
-
-        # Filtrar por departamentos si se proporcionan
-        departamentos = request.args.getlist('departamentos[]')
-        if departamentos and '' not in departamentos:
-            query = query.filter(DenunciaWeb.departamento.in_(departamentos))
-
-        # Filtrar por divisiones si se proporcionan
-        divisiones = request.args.getlist('divisiones[]')
-        if divisiones and '' not in divisiones:
-            query = query.filter(DenunciaWeb.division.in_(divisiones))
-        
-        if opcion == 'divisiones':
-            divisiones = sorted([d[0] for d in query.with_entities(DenunciaWeb.division).distinct().all() if d[0]])
-            return jsonify({'divisiones': divisiones})
-        elif opcion == 'secciones':
-            secciones = sorted([s[0] for s in query.with_entities(DenunciaWeb.sinar_a_cargo).distinct().all() if s[0]])
-            return jsonify({'secciones': secciones})
-    
-    # Procesar filtros normales
+def _filtros_desde_args():
+    """Filtros del dashboard enviados por query string (API del dashboard, drill-down y exportación)"""
     filtros = {}
 
-    # Procesar parámetros GET
-    # OJO: en el frontend se envían como `tipos[]`, `departamentos[]`, etc.
-    # por lo que debemos usar getlist('nombre[]') y comprobar esa lista.
     tipos = request.args.getlist('tipos[]')
     if tipos and '' not in tipos:
         filtros['tipos'] = tipos
-
     departamentos = request.args.getlist('departamentos[]')
     if departamentos and '' not in departamentos:
         filtros['departamentos'] = departamentos
-
     divisiones = request.args.getlist('divisiones[]')
     if divisiones and '' not in divisiones:
         filtros['divisiones'] = divisiones
-
     secciones = request.args.getlist('secciones[]')
     if secciones and '' not in secciones:
         filtros['secciones'] = secciones
-
     estados = request.args.getlist('estados[]')
     if estados and '' not in estados:
         filtros['estados'] = estados
     actuarios = request.args.getlist('actuarios[]')
-    if actuarios:
-        if actuarios and '' not in actuarios:
-            filtros['actuarios'] = actuarios
+    if actuarios and '' not in actuarios:
+        filtros['actuarios'] = actuarios
+
     if request.args.get('fecha_desde'):
         try:
             filtros['fecha_desde'] = datetime.strptime(request.args.get('fecha_desde'), '%Y-%m-%d')
-        except:
+        except Exception:
             pass
     if request.args.get('fecha_hasta'):
         try:
             filtros['fecha_hasta'] = datetime.strptime(request.args.get('fecha_hasta'), '%Y-%m-%d')
-        except:
+        except Exception:
             pass
     if request.args.get('dias_desde'):
         try:
             filtros['dias_desde'] = int(request.args.get('dias_desde'))
-        except:
+        except Exception:
             pass
     if request.args.get('dias_hasta'):
         try:
             filtros['dias_hasta'] = int(request.args.get('dias_hasta'))
-        except:
+        except Exception:
             pass
     if request.args.get('avance_desde'):
         try:
             filtros['avance_desde'] = float(request.args.get('avance_desde'))
-        except:
+        except Exception:
             pass
     if request.args.get('avance_hasta'):
         try:
             filtros['avance_hasta'] = float(request.args.get('avance_hasta'))
-        except:
+        except Exception:
             pass
+
+    return filtros
+
+
+@bp.route('/denuncias/dashboard/api', methods=['GET'])
+@login_required
+@require_permission('DATALAB_VIEW')
+def denuncias_dashboard_api():
+    """API para obtener datos de gráficos (AJAX)"""
+    # Si solo se piden opciones de filtros
+    if request.args.get('opciones'):
+        opcion = request.args.get('opciones')
+
+        # Filtrar por departamentos/divisiones si se proporcionan
+        departamentos = request.args.getlist('departamentos[]')
+        if '' in departamentos:
+            departamentos = []
+        divisiones = request.args.getlist('divisiones[]')
+        if '' in divisiones:
+            divisiones = []
+        
+        if opcion in ('divisiones', 'secciones'):
+            valores = opciones_cascada(current_user.unidad_id, opcion, departamentos, divisiones)
+            return jsonify({opcion: valores})
     
-    datos = obtener_datos_graficos(current_user.unidad_id, filtros if filtros else None)
-    return jsonify(datos)
+    filtros = _filtros_desde_args()
+    return jsonify(obtener_datos_graficos(current_user.unidad_id, filtros or None))
 
 
 @bp.route('/denuncias/lista', methods=['GET'])
@@ -274,116 +639,49 @@ def denuncias_lista():
     Respeta todos los filtros del dashboard y permite aplicar un \"slice\" adicional
     según el gráfico (estado, rango de días, rango de avance, actuario).
     """
-    filtros = {}
-
-    tipos = request.args.getlist('tipos[]')
-    if tipos and '' not in tipos:
-        filtros['tipos'] = tipos
-    departamentos = request.args.getlist('departamentos[]')
-    if departamentos and '' not in departamentos:
-        filtros['departamentos'] = departamentos
-    divisiones = request.args.getlist('divisiones[]')
-    if divisiones and '' not in divisiones:
-        filtros['divisiones'] = divisiones
-    secciones = request.args.getlist('secciones[]')
-    if secciones and '' not in secciones:
-        filtros['secciones'] = secciones
-    estados = request.args.getlist('estados[]')
-    if estados and '' not in estados:
-        filtros['estados'] = estados
-    actuarios = request.args.getlist('actuarios[]')
-    if actuarios and '' not in actuarios:
-        filtros['actuarios'] = actuarios
-
-    if request.args.get('fecha_desde'):
-        try:
-            filtros['fecha_desde'] = datetime.strptime(request.args.get('fecha_desde'), '%Y-%m-%d')
-        except Exception:
-            pass
-    if request.args.get('fecha_hasta'):
-        try:
-            filtros['fecha_hasta'] = datetime.strptime(request.args.get('fecha_hasta'), '%Y-%m-%d')
-        except Exception:
-            pass
-    if request.args.get('dias_desde'):
-        try:
-            filtros['dias_desde'] = int(request.args.get('dias_desde'))
-        except Exception:
-            pass
-    if request.args.get('dias_hasta'):
-        try:
-            filtros['dias_hasta'] = int(request.args.get('dias_hasta'))
-        except Exception:
-            pass
-    if request.args.get('avance_desde'):
-        try:
-            filtros['avance_desde'] = float(request.args.get('avance_desde'))
-        except Exception:
-            pass
-    if request.args.get('avance_hasta'):
-        try:
-            filtros['avance_hasta'] = float(request.args.get('avance_hasta'))
-        except Exception:
-            pass
-
-    # Query base y aplicación de filtros
-    query = DenunciaWeb.query.filter_by(unidad_id=current_user.unidad_id)
-    query = aplicar_filtros(query, filtros if filtros else None)
+    filtros = _filtros_desde_args()
 
     # Slice adicional según el gráfico
     slice_tipo = request.args.get('slice_tipo')  # estados|dias|avance|actuarios
     slice_label = request.args.get('slice_label')
 
-    if slice_tipo and slice_label:
-        if slice_tipo == 'estados':
-            query = query.filter(DenunciaWeb.estado_nombre == slice_label)
-        elif slice_tipo == 'actuarios':
-            query = query.filter(DenunciaWeb.nombre_actuario == slice_label)
-        elif slice_tipo == 'dias':
-            # Mapear rangos de texto a limites numéricos de dias_investigacion
-            if slice_label.startswith('0-100'):
-                query = query.filter(DenunciaWeb.dias_investigacion >= 0,
-                                     DenunciaWeb.dias_investigacion < 100)
-            elif slice_label.startswith('100-200'):
-                query = query.filter(DenunciaWeb.dias_investigacion >= 100,
-                                     DenunciaWeb.dias_investigacion < 200)
-            elif slice_label.startswith('200-300'):
-                query = query.filter(DenunciaWeb.dias_investigacion >= 200,
-                                     DenunciaWeb.dias_investigacion < 300)
-            elif '+300' in slice_label:
-                query = query.filter(DenunciaWeb.dias_investigacion >= 300)
-        elif slice_tipo == 'avance':
-            # Rango de avance en porcentaje
-            if slice_label == '10-20':
-                query = query.filter(DenunciaWeb.avance >= 10, DenunciaWeb.avance <= 20)
-            elif slice_label == '30-50':
-                query = query.filter(DenunciaWeb.avance >= 30, DenunciaWeb.avance <= 50)
-            elif slice_label == '60-70':
-                query = query.filter(DenunciaWeb.avance >= 60, DenunciaWeb.avance <= 70)
-            elif slice_label == '80-100':
-                query = query.filter(DenunciaWeb.avance >= 80, DenunciaWeb.avance <= 100)
-            elif slice_label == 'Vacías':
-                query = query.filter(DenunciaWeb.avance.is_(None))
-
-    # Limitar resultados para no saturar la UI
-    limite = min(int(request.args.get('limit', 200)), 1000)
-    registros = query.order_by(DenunciaWeb.fecha_registro.desc()).limit(limite).all()
-
-    def serialize(d):
-        return {
-            'id': d.id,
-            'numero_ap': d.numero_ap,
-            'fecha_registro': d.fecha_registro.isoformat() if d.fecha_registro else None,
-            'estado': d.estado_nombre,
-            'actuario': d.nombre_actuario,
-            'avance': d.avance,
-            'departamento': d.departamento,
-            'division': d.division,
-            'tipo_origen': d.tipo_origen
-        }
+    # Tamaño de página acotado para no saturar la UI; las siguientes páginas se piden con el cursor
+    try:
+        limite = min(max(int(request.args.get('limit', 200)), 1), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'El parámetro limit debe ser un número entero'}), 400
+    cursor = request.args.get('cursor')
+
+    try:
+        return jsonify(listar_denuncias(current_user.unidad_id, filtros or None,
+                                        slice_tipo, slice_label, limite, cursor))
+    except (CursorInvalido, SliceInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
 
-    data = [serialize(d) for d in registros]
-    return jsonify({'total': query.count(), 'registros': data})
+
+@bp.route('/denuncias/exportar', methods=['GET'])
+@login_required
+@require_permission('DATALAB_VIEW')
+def denuncias_exportar():
+    """
+    Exporta las denuncias filtradas a CSV o XLSX. El archivo se genera y se
+    envía por partes, sin armar el resultado completo en memoria.
+    """
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({'success': False, 'message': 'Formato de exportación no soportado'}), 400
+
+    filtros = _filtros_desde_args()
+    generar, mimetype = FORMATOS_EXPORTACION[formato]
+    nombre = f"denuncias_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+
+    audit_log('DENUNCIAS_EXPORTED', f'Exportación {formato.upper()} de denuncias (filtros: {filtros or "ninguno"})')
+
+    return Response(
+        stream_with_context(generar(current_user.unidad_id, filtros or None)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={nombre}'}
+    )
 
 
 @bp.route('/denuncias/detalle/<int:denuncia_id>', methods=['GET'])
@@ -393,7 +691,7 @@ def denuncias_detalle(denuncia_id):
     """
     Devuelve el detalle de una denuncia en JSON para mostrar en un modal.
     """
-    denuncia = DenunciaWeb.query.filter_by(unidad_id=current_user.unidad_id, id=denuncia_id).first_or_404()
+    denuncia = consulta_denuncias(current_user.unidad_id).filter(DenunciaWeb.id == denuncia_id).first_or_404()
 
     def serialize_detalle(d):
         return {
@@ -2,101 +2,794 @@
 Servicios de DataLab
 """
 import pandas as pd
+import numpy as np
+import hashlib
+import json
 import os
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
 from app.extensions import db
 from app.models.dataset import Dataset
 from app.services.file_storage import save_uploaded_file
-from app.services.utils import normalize_column_name, detect_date_columns
-from app.services.datalab_profiler import profile_dataset
-from app.services.datalab_charts import generate_charts
+from app.services.utils import normalize_column_name
+from app.services.datalab_types import parse_dates, source_key, compact_dtypes
+from app.services.datalab_profiler import (
+    profile_dataset, sketch_dataset, bloques_dataframe, profile_from_sketches
+)
+from app.services.datalab_excel import read_excel_chunked, sheet_names
+from app.services.datalab_sketches import sketches_path_for, save_sketches, load_sketches, SketchDataset
+from app.services.datalab_charts import (
+    generate_charts, time_series, RESOLUCIONES, merge_charts, time_series_columns, series_state, merge_series_state
+)
+from app.services.datalab_parquet import (
+    parquet_dir_for, write_parquet, remove_parquet, read_parquet, append_parquet, iter_parquet_frames,
+    list_parts, sidecar_path, close_parquet_handle, EsquemaIncompatible
+)
+from app.services.datalab_rows import browse_rows, decode_cursor, parse_sort
 from app.services.audit import audit_log
+from app.services.trabajos import tarea, sin_avance, en_paralelo, TrabajoFallido, MENSAJE_SIN_MEMORIA
 
 
-def process_uploaded_file(file, name, unidad_id, user_id):
+# Columna que identifica la hoja o el archivo de cada fila en un dataset concatenado
+COLUMNA_ORIGEN = 'origen'
+
+
+def _leer_archivo(file_path, source_type, hoja=0):
+    """DataFrame de un CSV (UTF-8 o latin-1) o de una hoja de Excel (por índice)"""
+    if source_type == 'csv':
+        # Intentar UTF-8 primero, luego latin-1
+        try:
+            return pd.read_csv(file_path, encoding='utf-8')
+        except UnicodeDecodeError:
+            return pd.read_csv(file_path, encoding='latin-1')
+    # Excel, leído por bloques para acotar la memoria
+    return read_excel_chunked(
+        file_path, chunk_rows=current_app.config.get('DATALAB_EXCEL_FILAS_BLOQUE', 50_000), sheet=hoja
+    )
+
+
+def _tipar(df, unidad_id, avance=sin_avance):
     """
-    Procesa un archivo subido y crea el dataset.
+    Normaliza los nombres de columna, convierte las fechas y compacta los
+    tipos del DataFrame (en el lugar).
     
     Returns:
-        tuple: (dataset, error_message)
+        dict: memoria antes y después (ver compact_dtypes)
     """
+    df.columns = [normalize_column_name(col) for col in df.columns]
+    
+    # Detectar fechas por contenido y convertirlas con un formato explícito por columna
+    avance(40, 'Detectando fechas')
+    parse_dates(df, fuente=source_key(unidad_id, df.columns))
+    
+    # Tipos compactos: el perfil, los gráficos y la copia Parquet trabajan sobre este frame
+    avance(43, 'Optimizando tipos de datos')
+    return compact_dtypes(df)
+
+
+def _ruta_propia(file_path):
+    """
+    Ruta de referencia propia de un dataset para su copia Parquet, sus
+    sketches y sus series: el archivo original puede ser compartido (se
+    guarda por contenido) y cada dataset agrega filas solo a su copia.
+    """
+    raiz, extension = os.path.splitext(file_path)
+    return f'{raiz}_{uuid.uuid4().hex[:12]}{extension}'
+
+
+def _guardar_series(estados, filas, ruta):
+    """Guarda los estados de las series con la cantidad de filas que resumen"""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'filas': filas, 'series': [[fecha, valor, estado] for (fecha, valor), estado in estados.items()]}, f)
+    return ruta
+
+
+def _descartar_analisis(analisis):
+    """Elimina la copia Parquet, los sketches y las series de un análisis que no llegó a guardarse"""
+    remove_parquet(analisis.get('parquet_path'))
+    for clave in ('sketches_path', 'series_path'):
+        ruta = analisis.get(clave)
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def _analizar(df, memoria, base_path, avance=sin_avance, sketch=None):
+    """
+    Copia Parquet, vista previa, perfil y gráficos de un DataFrame ya tipado.
+    
+    Args:
+        memoria: resultado de compact_dtypes (se informa en el perfil)
+        base_path: ruta de referencia de la copia Parquet y los sketches,
+            propia del dataset (ver _ruta_propia; una por hoja en los lotes)
+        sketch: sketches ya calculados por partes, para el perfil aproximado
+    
+    Los sketches de todas las columnas y las sumas por día de las series
+    temporales se guardan siempre junto a la copia Parquet, para que
+    agregar filas (agregar_filas) solo resuma las filas nuevas.
+    
+    Returns:
+        dict: parquet_path, schema, preview, profile, charts, sketches_path,
+        series_path, rows_count y columns_count (serializable, para
+        devolverlo desde un proceso del pool)
+    """
+    analisis = {'parquet_path': None, 'sketches_path': None, 'series_path': None}
     try:
-        # Guardar archivo
-        file_path, safe_filename = save_uploaded_file(file, unidad_id)
+        # Copia columnar tipada (si falla, el dataset queda solo con el original)
+        avance(45, 'Guardando copia Parquet')
+        schema = None
+        try:
+            analisis['parquet_path'] = parquet_dir_for(base_path)
+            ruta, schema = write_parquet(df, analisis['parquet_path'])
+        except Exception as e:
+            print(f"Error al guardar la copia Parquet: {e}")
+            remove_parquet(analisis['parquet_path'])
+            analisis['parquet_path'] = None
+        
+        # Generar preview (primeras 100 filas)
+        preview_df = df.head(100)
+        preview_data = preview_df.astype(object).where(preview_df.notna(), None).to_dict('records')
         
+        # Generar perfil (desde los sketches si el dataset es muy grande)
+        avance(50, 'Generando perfil')
+        sketch = sketch or sketch_dataset(bloques_dataframe(df))
+        if len(df) >= current_app.config.get('DATALAB_PERFIL_APROXIMADO_FILAS', 1_000_000):
+            profile = profile_from_sketches(sketch)
+        else:
+            profile = profile_dataset(df)
+            # Fechas reconocidas por contenido: mismo tipo que en el perfil exacto
+            for col, col_sketch in sketch.columnas.items():
+                col_sketch.tipo = profile['columns'][col]['type']
+        profile['summary']['memory'] = memoria
+        if analisis['parquet_path']:
+            analisis['sketches_path'] = save_sketches(sketch, sketches_path_for(base_path))
+            estados = {(fecha, valor): series_state(df[fecha], df[valor])
+                       for fecha, valor in time_series_columns(df)}
+            analisis['series_path'] = _guardar_series(estados, len(df),
+                                                      sidecar_path(analisis['parquet_path'], 'series'))
+        
+        # Generar gráficos
+        avance(75, 'Generando gráficos')
+        charts = generate_charts(df, profile)
+    except BaseException:
+        _descartar_analisis(analisis)
+        raise
+    
+    analisis.update({
+        'schema': schema,
+        'preview': preview_data,
+        'profile': profile,
+        'charts': charts,
+        'rows_count': len(df),
+        'columns_count': len(df.columns)
+    })
+    return analisis
+
+
+def _crear_dataset(analisis, unidad_id, user_id, name, source_type, original_filename, stored_path,
+                   content_hash=None):
+    """Dataset con los resultados del análisis (se agrega a la sesión, sin commit)"""
+    dataset = Dataset(
+        unidad_id=unidad_id,
+        user_id=user_id,
+        name=name,
+        source_type=source_type,
+        original_filename=original_filename[:255],
+        stored_path=stored_path,
+        content_hash=content_hash,
+        parquet_path=analisis['parquet_path'],
+        rows_count=analisis['rows_count'],
+        columns_count=analisis['columns_count']
+    )
+    
+    if analisis['schema']:
+        dataset.set_schema(analisis['schema'])
+    
+    dataset.set_preview(analisis['preview'])
+    dataset.set_profile(analisis['profile'])
+    dataset.set_charts(analisis['charts'])
+    
+    db.session.add(dataset)
+    return dataset
+
+
+def procesar_dataset(file_path, original_filename, name, unidad_id, user_id, avance=sin_avance,
+                     content_hash=None):
+    """
+    Lee un archivo ya guardado, lo perfila y crea el dataset.
+    
+    Args:
+        avance: callback (progreso, etapa) para informar el avance del trabajo
+        content_hash: SHA-256 del archivo, para reconocer subidas repetidas
+    
+    Returns:
+        tuple: (dataset, error_message)
+    """
+    analisis = None
+    try:
         # Detectar tipo
-        source_type = file.filename.rsplit('.', 1)[1].lower()
+        source_type = original_filename.rsplit('.', 1)[1].lower()
         
-        # Leer con pandas
+        # Leer con pandas (primera hoja si es Excel)
+        avance(10, 'Leyendo archivo')
         try:
-            if source_type == 'csv':
-                # Intentar UTF-8 primero, luego latin-1
-                try:
-                    df = pd.read_csv(file_path, encoding='utf-8')
-                except UnicodeDecodeError:
-                    df = pd.read_csv(file_path, encoding='latin-1')
-            else:
-                # Excel
-                df = pd.read_excel(file_path, sheet_name=0)  # Primera hoja
+            df = _leer_archivo(file_path, source_type)
+        except MemoryError:
+            _descartar_archivos_sin_uso([file_path])
+            return None, MENSAJE_SIN_MEMORIA
         except Exception as e:
-            # Limpiar archivo si falla la lectura
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # Limpiar archivo si falla la lectura (salvo que otro dataset use el mismo contenido)
+            _descartar_archivos_sin_uso([file_path])
             return None, f"Error al leer el archivo: {str(e)}"
         
-        # Normalizar nombres de columnas
-        df.columns = [normalize_column_name(col) for col in df.columns]
+        memoria = _tipar(df, unidad_id, avance)
+        analisis = _analizar(df, memoria, _ruta_propia(file_path), avance)
         
-        # Detectar y parsear fechas
-        date_columns = detect_date_columns(df)
-        for col in date_columns:
+        # Crear dataset
+        avance(90, 'Guardando dataset')
+        dataset = _crear_dataset(analisis, unidad_id, user_id, name, source_type, original_filename,
+                                 file_path, content_hash)
+        db.session.commit()
+        
+        # Auditoría
+        audit_log('DATASET_UPLOADED', f'Dataset {name} subido ({len(df)} filas, {len(df.columns)} columnas)',
+                  user_id=user_id)
+        
+        return dataset, None
+        
+    except Exception as e:
+        db.session.rollback()
+        # Limpiar archivos si existen
+        if analisis:
+            _descartar_analisis(analisis)
+        _descartar_archivos_sin_uso([file_path])
+        if isinstance(e, MemoryError):
+            return None, MENSAJE_SIN_MEMORIA
+        return None, f"Error al procesar el archivo: {str(e)}"
+
+
+def _descartar_subidas(trabajo):
+    """Acción al vencer de las tareas de datasets: descarta los archivos subidos que ningún dataset usa"""
+    parametros = trabajo.get_parametros()
+    rutas = [archivo['file_path'] for archivo in parametros.get('archivos', [])]
+    if parametros.get('file_path'):
+        rutas.append(parametros['file_path'])
+    _descartar_archivos_sin_uso(rutas)
+
+
+@tarea('dataset', al_vencer=_descartar_subidas)
+def tarea_dataset(trabajo, avance, file_path, original_filename, name, content_hash=None):
+    """Tarea en segundo plano: procesar un dataset subido"""
+    dataset, error = procesar_dataset(file_path, original_filename, name,
+                                      trabajo.unidad_id, trabajo.user_id, avance, content_hash)
+    if not dataset:
+        raise TrabajoFallido(error)
+    return {
+        'dataset_id': dataset.id,
+        'mensaje': f'Dataset "{dataset.name}" subido correctamente '
+                   f'({dataset.rows_count} filas, {dataset.columns_count} columnas)'
+    }
+
+
+# ==================== VARIAS HOJAS O ARCHIVOS ====================
+
+def _fuentes_lote(archivos, todas_las_hojas):
+    """
+    Hojas o archivos a procesar, cada uno con una ruta base propia para su
+    copia Parquet y sus sketches (un mismo archivo puede dar varios datasets)
+    y su hash de contenido: el del archivo para la primera hoja (el mismo
+    dataset que daría subirlo solo) y uno derivado para las demás.
+    
+    Returns:
+        tuple: (fuentes, errores de los archivos que no se pudieron abrir)
+    """
+    sello = uuid.uuid4().hex[:12]
+    varios = len(archivos) > 1
+    fuentes, errores = [], []
+    for archivo in archivos:
+        file_path, original_filename = archivo['file_path'], archivo['original_filename']
+        content_hash = archivo.get('content_hash')
+        source_type = original_filename.rsplit('.', 1)[1].lower()
+        hojas = [None]
+        if source_type != 'csv' and todas_las_hojas:
             try:
-                df[col] = pd.to_datetime(df[col], errors='coerce', infer_datetime_format=True)
-            except:
+                hojas = sheet_names(file_path)
+            except Exception as e:
+                errores.append(f'{original_filename}: no se pudo abrir ({e})')
+                continue
+        for indice, hoja in enumerate(hojas):
+            if hoja is None:
+                etiqueta = original_filename
+            else:
+                etiqueta = f'{original_filename} / {hoja}' if varios else hoja
+            raiz, extension = os.path.splitext(file_path)
+            fuentes.append({
+                'file_path': file_path,
+                'original_filename': original_filename,
+                'source_type': source_type,
+                'hoja': indice,
+                'etiqueta': etiqueta,
+                'base_path': f'{raiz}_{sello}_{len(fuentes)}{extension}',
+                'content_hash': _hash_combinado(content_hash, str(indice)) if content_hash and indice else content_hash
+            })
+    return fuentes, errores
+
+
+def _hash_combinado(*partes):
+    """SHA-256 que identifica una combinación de contenidos (hojas, concatenaciones)"""
+    return hashlib.sha256('\0'.join(partes).encode('utf-8')).hexdigest()
+
+
+def _mensaje_error(error):
+    """Texto para el usuario del error de una hoja o archivo procesado en el pool"""
+    if isinstance(error, MemoryError):
+        return MENSAJE_SIN_MEMORIA
+    if isinstance(error, BrokenProcessPool):
+        return f'el proceso terminó inesperadamente (posiblemente por falta de memoria). {MENSAJE_SIN_MEMORIA}'
+    return str(error)
+
+
+def _dataset_de_fuente(fuente, unidad_id):
+    """
+    Lee, tipa y analiza una hoja o archivo para un dataset propio (se
+    ejecuta en un proceso del pool de en_paralelo).
+    
+    Returns:
+        dict | None: análisis (ver _analizar), o None si no tiene filas
+    """
+    df = _leer_archivo(fuente['file_path'], fuente['source_type'], fuente['hoja'])
+    if df.empty:
+        return None
+    memoria = _tipar(df, unidad_id)
+    return _analizar(df, memoria, fuente['base_path'])
+
+
+def _parte_de_fuente(fuente, unidad_id):
+    """
+    Lee y tipa una hoja o archivo para concatenarlo, con la columna de
+    origen y los sketches de sus filas (se ejecuta en un proceso del pool).
+    
+    Returns:
+        tuple | None: (df, memoria, sketch), o None si no tiene filas
+    """
+    df = _leer_archivo(fuente['file_path'], fuente['source_type'], fuente['hoja'])
+    if df.empty:
+        return None
+    memoria = _tipar(df, unidad_id)
+    columna = COLUMNA_ORIGEN
+    while columna in df.columns:
+        columna = f'{columna}_'
+    df[columna] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [fuente['etiqueta']])
+    return df, memoria, sketch_dataset(bloques_dataframe(df))
+
+
+def _procesar_fuentes(funcion, fuentes, unidad_id, avance, desde, hasta):
+    """
+    Ejecuta `funcion` para cada fuente en paralelo e informa el avance
+    entre `desde` y `hasta` a medida que terminan.
+    
+    Returns:
+        tuple: (resultados en el orden de las fuentes, errores, omitidas)
+    """
+    resultados = [None] * len(fuentes)
+    errores, omitidas = [], []
+    llamadas = [(fuente, unidad_id) for fuente in fuentes]
+    for terminadas, (indice, resultado, error) in enumerate(en_paralelo(funcion, llamadas), 1):
+        etiqueta = fuentes[indice]['etiqueta']
+        avance(desde + (hasta - desde) * terminadas / len(fuentes),
+               f'Procesando hojas y archivos ({terminadas} de {len(fuentes)})')
+        if error is not None:
+            errores.append(f'{etiqueta}: {_mensaje_error(error)}')
+        elif resultado is None:
+            omitidas.append(etiqueta)
+        else:
+            resultados[indice] = resultado
+    return resultados, errores, omitidas
+
+
+def _lote_separado(fuentes, name, unidad_id, user_id, avance):
+    """
+    Un dataset por hoja o archivo; las que fallan se informan y no impiden
+    las demás. Las hojas o archivos idénticos a un dataset ya creado en la
+    unidad no se vuelven a procesar: se reutiliza ese dataset.
+    
+    Returns:
+        tuple: (datasets creados, datasets reutilizados, errores, omitidas)
+    """
+    reutilizados, nuevas = [], []
+    for fuente in fuentes:
+        existente = buscar_dataset_por_contenido(unidad_id, fuente['content_hash'])
+        if existente:
+            reutilizados.append(existente)
+        else:
+            nuevas.append(fuente)
+    analisis, errores, omitidas = _procesar_fuentes(_dataset_de_fuente, nuevas, unidad_id, avance, 10, 90)
+    
+    avance(90, 'Guardando datasets')
+    datasets = []
+    try:
+        for fuente, resultado in zip(nuevas, analisis):
+            if resultado is None:
+                continue
+            nombre = name if len(fuentes) == 1 else f"{name} - {fuente['etiqueta']}"
+            datasets.append(_crear_dataset(resultado, unidad_id, user_id, nombre[:200], fuente['source_type'],
+                                           fuente['original_filename'], fuente['file_path'],
+                                           fuente['content_hash']))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for resultado in analisis:
+            if resultado:
+                _descartar_analisis(resultado)
+        raise
+    return datasets, reutilizados, errores, omitidas
+
+
+def _lote_concatenado(fuentes, name, unidad_id, user_id, avance):
+    """
+    Un solo dataset con las filas de todas las hojas o archivos. Cada parte
+    se lee, tipa y resume (sketches) en paralelo; acá se concatenan y los
+    sketches combinados dan el perfil aproximado sin recorrer de nuevo las
+    filas. Si una parte falla no se crea el dataset (quedaría incompleto).
+    La misma concatenación (mismos contenidos y etiquetas, en el mismo
+    orden) ya creada en la unidad se reutiliza.
+    
+    Returns:
+        tuple: (datasets creados, datasets reutilizados, errores, omitidas)
+    """
+    content_hash = None
+    if all(fuente['content_hash'] for fuente in fuentes):
+        content_hash = _hash_combinado('concatenar', *(f"{fuente['content_hash']}:{fuente['etiqueta']}"
+                                                       for fuente in fuentes))
+        existente = buscar_dataset_por_contenido(unidad_id, content_hash)
+        if existente:
+            return [], [existente], [], []
+    
+    partes, errores, omitidas = _procesar_fuentes(_parte_de_fuente, fuentes, unidad_id, avance, 10, 70)
+    if errores:
+        return [], [], errores, omitidas
+    partes = [parte for parte in partes if parte is not None]
+    if not partes:
+        return [], [], errores, omitidas
+    
+    avance(70, 'Concatenando')
+    df = pd.concat([parte[0] for parte in partes], ignore_index=True, copy=False)
+    sketch = SketchDataset()
+    for parte in partes:
+        sketch.combinar(parte[2])
+    
+    # Columnas con tipos distintos entre partes (fechas en una hoja y texto
+    # en otra, categorías distintas) quedan como object: se vuelven a tipar
+    parse_dates(df)
+    memoria = compact_dtypes(df)
+    memoria['bytes_before'] = sum(parte[1]['bytes_before'] for parte in partes)
+    convertidas = set(memoria['columns']).union(*(parte[1]['columns'] for parte in partes))
+    memoria['columns'] = {col: str(df[col].dtype) for col in df.columns if col in convertidas}
+    for col, col_sketch in sketch.columnas.items():
+        col_sketch.tipo = str(df[col].dtype)
+    del partes
+    
+    avance(75, 'Generando perfil y gráficos')
+    primera = fuentes[0]
+    analisis = _analizar(df, memoria, primera['base_path'], sketch=sketch)
+    
+    avance(90, 'Guardando dataset')
+    nombres = list(dict.fromkeys(fuente['original_filename'] for fuente in fuentes))
+    try:
+        dataset = _crear_dataset(analisis, unidad_id, user_id, name, primera['source_type'],
+                                 ', '.join(nombres), primera['file_path'], content_hash)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _descartar_analisis(analisis)
+        raise
+    return [dataset], [], errores, omitidas
+
+
+def _descartar_archivos_sin_uso(rutas):
+    """Elimina los archivos subidos que no quedaron como original de ningún dataset"""
+    for ruta in rutas:
+        if os.path.exists(ruta) and not Dataset.query.filter_by(stored_path=ruta).first():
+            try:
+                os.remove(ruta)
+            except OSError:
                 pass
+
+
+def procesar_lote(archivos, name, unidad_id, user_id, todas_las_hojas=True, concatenar=False,
+                  avance=sin_avance):
+    """
+    Crea datasets a partir de varias hojas de Excel y/o varios archivos:
+    uno por hoja o archivo, o uno solo con todas las filas concatenadas.
+    Las hojas y archivos se leen, tipan y perfilan en paralelo en los
+    núcleos disponibles (ver en_paralelo), de modo que el tiempo total
+    depende de la cantidad de procesos y no de la cantidad de hojas.
+    
+    Args:
+        archivos: [{'file_path', 'original_filename', 'content_hash'}] ya guardados
+        todas_las_hojas: todas las hojas de cada Excel (o solo la primera)
+        concatenar: un solo dataset con la columna `origen` (hoja o archivo)
+    
+    Returns:
+        tuple: (datasets creados o reutilizados, advertencias, error_message)
+    """
+    rutas = list(dict.fromkeys(archivo['file_path'] for archivo in archivos))
+    try:
+        avance(5, 'Preparando hojas y archivos')
+        # El mismo archivo dos veces (mismo contenido) se procesa una sola vez
+        archivos = list({archivo['file_path']: archivo for archivo in archivos}.values())
+        fuentes, errores = _fuentes_lote(archivos, todas_las_hojas)
+        omitidas = []
+        datasets, reutilizados = [], []
+        if fuentes:
+            procesar = _lote_concatenado if concatenar else _lote_separado
+            datasets, reutilizados, errores_fuentes, omitidas = procesar(fuentes, name, unidad_id, user_id, avance)
+            errores += errores_fuentes
+    except Exception as e:
+        db.session.rollback()
+        _descartar_archivos_sin_uso(rutas)
+        if isinstance(e, MemoryError):
+            return [], [], MENSAJE_SIN_MEMORIA
+        return [], [], f"Error al procesar los archivos: {str(e)}"
+    
+    _descartar_archivos_sin_uso(rutas)
+    advertencias = errores + [f'{etiqueta}: sin filas, se omitió' for etiqueta in omitidas]
+    if not datasets and not reutilizados:
+        return [], advertencias, '; '.join(advertencias) or 'Los archivos no tienen datos'
+    
+    for dataset in datasets:
+        audit_log('DATASET_UPLOADED', f'Dataset {dataset.name} subido ({dataset.rows_count} filas, '
+                                      f'{dataset.columns_count} columnas)', user_id=user_id)
+    for dataset in reutilizados:
+        audit_log('DATASET_REUSED', f'Subida repetida de {dataset.name} (dataset {dataset.id})', user_id=user_id)
+    return reutilizados + datasets, advertencias, None
+
+
+@tarea('dataset_lote', al_vencer=_descartar_subidas)
+def tarea_dataset_lote(trabajo, avance, archivos, name, todas_las_hojas=True, concatenar=False):
+    """Tarea en segundo plano: procesar varias hojas o archivos subidos juntos"""
+    datasets, advertencias, error = procesar_lote(archivos, name, trabajo.unidad_id, trabajo.user_id,
+                                                  todas_las_hojas, concatenar, avance)
+    if not datasets:
+        raise TrabajoFallido(error)
+    filas = sum(dataset.rows_count for dataset in datasets)
+    if len(datasets) == 1:
+        mensaje = f'Dataset "{datasets[0].name}" subido correctamente ({filas} filas, ' \
+                  f'{datasets[0].columns_count} columnas)'
+    else:
+        mensaje = f'{len(datasets)} datasets subidos correctamente ({filas} filas en total)'
+    resultado = {'dataset_ids': [dataset.id for dataset in datasets], 'mensaje': mensaje}
+    if advertencias:
+        resultado['advertencia'] = '; '.join(advertencias)
+    return resultado
+
+
+# ==================== AGREGAR FILAS ====================
+
+def _sketch_actual(dataset, profile, partes):
+    """
+    Sketches de las filas actuales del dataset: los guardados al crearlo o,
+    en datasets anteriores a que se guardaran siempre, se construyen una
+    sola vez desde las primeras `partes` partes Parquet, con los tipos del
+    perfil.
+    """
+    sketch = load_sketches(sidecar_path(dataset.parquet_path, 'sketches'))
+    if sketch is not None and sketch.filas == dataset.rows_count:
+        return sketch
+    sketch = sketch_dataset(iter_parquet_frames(dataset.parquet_path, partes=partes))
+    for col, col_sketch in sketch.columnas.items():
+        col_sketch.tipo = profile.get('columns', {}).get(col, {}).get('type', col_sketch.tipo)
+    return sketch
+
+
+def _series_actuales(dataset, pares, partes):
+    """
+    Estados de las series temporales (ver series_state) de las filas
+    actuales: los guardados al crear el dataset o, para los pares que
+    faltan (datasets anteriores), construidos desde las primeras `partes`
+    partes Parquet.
+    
+    Returns:
+        dict: {(fecha, valor): estado}
+    """
+    estados = {}
+    ruta = sidecar_path(dataset.parquet_path, 'series')
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            guardado = json.load(f)
+        if guardado.get('filas') == dataset.rows_count:
+            estados = {(fecha, valor): estado for fecha, valor, estado in guardado['series']}
+    
+    for fecha, valor in pares:
+        if (fecha, valor) in estados:
+            continue
+        estado = series_state(pd.Series(dtype='datetime64[ns]'), pd.Series(dtype=float))
+        for bloque in iter_parquet_frames(dataset.parquet_path, [fecha, valor], partes=partes):
+            estado = merge_series_state(estado, series_state(bloque[fecha], bloque[valor]))
+        estados[(fecha, valor)] = estado
+    return estados
+
+
+def _combinar_memoria(anterior, nueva, cambiadas):
+    """
+    Memoria antes y después de compactar (compact_dtypes) de todas las
+    filas; los tipos son los del dataset salvo en las columnas `cambiadas`
+    ({columna: dtype nuevo}).
+    """
+    if not anterior:
+        return None
+    return {
+        'bytes_before': anterior['bytes_before'] + nueva['bytes_before'],
+        'bytes_after': anterior['bytes_after'] + nueva['bytes_after'],
+        'columns': dict(anterior.get('columns', {}), **cambiadas)
+    }
+
+
+def agregar_filas(dataset, file_path, original_filename, unidad_id, user_id, avance=sin_avance):
+    """
+    Agrega las filas de un archivo a un dataset existente. Solo se leen,
+    tipan y escriben las filas nuevas (una parte Parquet más); el perfil y
+    los gráficos se actualizan combinando los resúmenes guardados con los
+    de las filas nuevas: sketches (conteos, sumas, distintos, cuantiles,
+    frecuentes), conteos de los histogramas y sumas por día de las series.
+    
+    Desde el primer agregado el perfil es el aproximado (por sketches).
+    
+    Returns:
+        tuple: (dataset, filas agregadas, error_message)
+    """
+    ruta_parte = None
+    try:
+        if not dataset.parquet_path or not list_parts(dataset.parquet_path):
+            return None, 0, 'El dataset no tiene copia Parquet; vuelva a subirlo para agregarle filas'
         
-        # Generar preview (primeras 100 filas)
-        preview_df = df.head(100)
-        preview_data = preview_df.to_dict('records')
+        source_type = original_filename.rsplit('.', 1)[1].lower()
+        avance(10, 'Leyendo archivo')
+        try:
+            df = _leer_archivo(file_path, source_type)
+        except MemoryError:
+            return None, 0, MENSAJE_SIN_MEMORIA
+        except Exception as e:
+            return None, 0, f"Error al leer el archivo: {str(e)}"
+        if df.empty:
+            return None, 0, 'El archivo no tiene filas'
         
-        # Generar perfil
-        profile = profile_dataset(df)
+        memoria = _tipar(df, unidad_id, avance)
         
-        # Generar gráficos
-        charts = generate_charts(df, profile)
+        # Solo las filas nuevas se escriben, como una parte más
+        avance(45, 'Guardando filas nuevas')
+        partes = len(list_parts(dataset.parquet_path))
+        esquema_anterior = {campo['name']: campo['type'] for campo in dataset.get_schema()}
+        try:
+            ruta_parte, schema, df = append_parquet(df, dataset.parquet_path)
+        except EsquemaIncompatible as e:
+            return None, 0, str(e)
         
-        # Crear dataset
-        dataset = Dataset(
-            unidad_id=unidad_id,
-            user_id=user_id,
-            name=name,
-            source_type=source_type,
-            original_filename=file.filename,
-            stored_path=file_path,
-            rows_count=len(df),
-            columns_count=len(df.columns)
-        )
-        
-        dataset.set_preview(preview_data)
+        # Perfil: sketches guardados + sketches de las filas nuevas
+        avance(55, 'Actualizando perfil')
+        profile_anterior = dataset.get_profile()
+        sketch = _sketch_actual(dataset, profile_anterior, partes)
+        sketch.combinar(sketch_dataset(bloques_dataframe(df)))
+        # Columnas que cambiaron de tipo (enteros más grandes, decimales)
+        cambiadas = {
+            campo['name']: str(df[campo['name']].dtype) for campo in schema
+            if esquema_anterior.get(campo['name']) not in (None, campo['type'])
+        }
+        for col, tipo in cambiadas.items():
+            sketch.columnas[col].tipo = tipo
+        profile = profile_from_sketches(sketch)
+        memoria = _combinar_memoria(profile_anterior.get('summary', {}).get('memory'), memoria, cambiadas)
+        if memoria:
+            profile['summary']['memory'] = memoria
+        
+        # Gráficos: conteos de histogramas y sumas por día de las series
+        avance(75, 'Actualizando gráficos')
+        pares = time_series_columns(df)
+        estados = _series_actuales(dataset, pares, partes)
+        for fecha, valor in pares:
+            estados[(fecha, valor)] = merge_series_state(estados[(fecha, valor)],
+                                                         series_state(df[fecha], df[valor]))
+        charts = merge_charts(dataset.get_charts(), profile, df, estados)
+        
+        avance(90, 'Guardando dataset')
+        filas = len(df)
+        save_sketches(sketch, sidecar_path(dataset.parquet_path, 'sketches'))
+        _guardar_series(estados, dataset.rows_count + filas, sidecar_path(dataset.parquet_path, 'series'))
+        dataset.rows_count += filas
+        dataset.set_schema(schema)
         dataset.set_profile(profile)
         dataset.set_charts(charts)
-        
-        db.session.add(dataset)
+        # El contenido ya no es el del archivo original
+        dataset.content_hash = None
         db.session.commit()
         
-        # Auditoría
-        audit_log('DATASET_UPLOADED', f'Dataset {name} subido ({len(df)} filas, {len(df.columns)} columnas)')
-        
-        return dataset, None
+        audit_log('DATASET_APPENDED', f'{filas} filas agregadas al dataset {dataset.name} desde {original_filename}',
+                  user_id=user_id)
+        return dataset, filas, None
         
     except Exception as e:
         db.session.rollback()
-        # Limpiar archivo si existe
-        if 'file_path' in locals() and os.path.exists(file_path):
+        if ruta_parte and os.path.exists(ruta_parte):
+            close_parquet_handle(dataset.parquet_path)
+            os.remove(ruta_parte)
+        if isinstance(e, MemoryError):
+            return None, 0, MENSAJE_SIN_MEMORIA
+        return None, 0, f"Error al agregar las filas: {str(e)}"
+    finally:
+        # Las filas quedan en la copia Parquet: el archivo subido no se conserva
+        if os.path.exists(file_path):
             try:
                 os.remove(file_path)
-            except:
+            except OSError:
                 pass
-        return None, f"Error al procesar el archivo: {str(e)}"
+
+
+@tarea('dataset_agregar', al_vencer=_descartar_subidas)
+def tarea_dataset_agregar(trabajo, avance, dataset_id, file_path, original_filename):
+    """Tarea en segundo plano: agregar las filas de un archivo a un dataset"""
+    dataset = get_dataset_by_id(dataset_id, trabajo.unidad_id)
+    if not dataset:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise TrabajoFallido('El dataset ya no existe')
+    dataset, filas, error = agregar_filas(dataset, file_path, original_filename,
+                                          trabajo.unidad_id, trabajo.user_id, avance)
+    if not dataset:
+        raise TrabajoFallido(error)
+    return {
+        'dataset_id': dataset.id,
+        'mensaje': f'Se agregaron {filas} filas al dataset "{dataset.name}" ({dataset.rows_count} filas en total)'
+    }
+
+
+def serie_temporal(dataset, fecha, valor, resolucion=None, desde=None, hasta=None):
+    """
+    Serie temporal de un dataset para ampliar un gráfico de línea (otro
+    rango o una resolución más fina), leyendo solo las dos columnas de la
+    copia Parquet.
+    
+    Raises:
+        ValueError: columnas, resolución o fechas inválidas, o dataset sin copia Parquet
+    
+    Returns:
+        dict: {'x', 'y', 'resolution', 'points_total'}
+    """
+    columnas = dataset.get_profile().get('columns', {})
+    if fecha not in columnas or valor not in columnas or fecha == valor:
+        raise ValueError('Columnas inválidas')
+    if resolucion and resolucion not in RESOLUCIONES:
+        raise ValueError('Resolución inválida')
+    if not dataset.parquet_path:
+        raise ValueError('El dataset no tiene copia Parquet; vuelva a subirlo para ampliar gráficos')
+    
+    try:
+        desde = pd.Timestamp(desde) if desde else None
+        hasta = pd.Timestamp(hasta) if hasta else None
+    except ValueError:
+        raise ValueError('Rango de fechas inválido')
+    
+    df = read_parquet(dataset.parquet_path, [fecha, valor])
+    return time_series(df[fecha], df[valor], resolucion,
+                       max_puntos=current_app.config.get('DATALAB_SERIE_MAX_PUNTOS', 500),
+                       desde=desde, hasta=hasta, minima='H')
+
+
+def listar_filas(dataset, columnas=None, filtros=None, orden=None, limite=100, cursor=None):
+    """
+    Página de filas de un dataset desde su copia Parquet, con proyección
+    de columnas, orden ('col,-col2') y filtros (ver datalab_rows.build_filter).
+    
+    Raises:
+        ValueError: parámetros inválidos o dataset sin copia Parquet
+    
+    Returns:
+        dict: {'columnas', 'registros', 'total', 'siguiente'}
+    """
+    if not dataset.parquet_path:
+        raise ValueError('El dataset no tiene copia Parquet; vuelva a subirlo para explorar sus filas')
+    
+    return browse_rows(dataset.parquet_path, columnas, filtros, parse_sort(orden),
+                       offset=decode_cursor(cursor), limit=limite)
 
 
 def get_user_datasets(user_id, unidad_id):
@@ -109,6 +802,17 @@ def get_user_datasets(user_id, unidad_id):
     return Dataset.query.filter_by(unidad_id=unidad_id).order_by(Dataset.created_at.desc())
 
 
+def buscar_dataset_por_contenido(unidad_id, content_hash):
+    """
+    Dataset de la unidad creado a partir de un archivo idéntico (mismo
+    SHA-256), o None.
+    """
+    if not content_hash:
+        return None
+    return Dataset.query.filter_by(unidad_id=unidad_id, content_hash=content_hash) \
+        .order_by(Dataset.id.desc()).first()
+
+
 def get_dataset_by_id(dataset_id, unidad_id):
     """
     Obtiene un dataset por ID, verificando que pertenezca a la unidad.
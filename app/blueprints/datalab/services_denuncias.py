@@ -2,66 +2,104 @@
 Servicios para el módulo de Denuncias Web
 """
 import pandas as pd
+import numpy as np
 import os
+import json
 from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, case, literal, or_
 from app.extensions import db
-from app.models.denuncia_web import DenunciaWeb
+from app.models.denuncia_web import (
+    DenunciaWeb, DenunciaCarga, DenunciaResumen, DenunciaDimension, DenunciaDependencia,
+    RANGOS_DIAS, RANGO_DIAS_SIN_DATOS, inicio_mes
+)
 from app.services.file_storage import save_uploaded_file
 from app.services.utils import normalize_column_name
 from app.services.audit import audit_log
+from app.services.cache import cacheado, cache_compartida
+from app.services.trabajos import tarea, sin_avance, TrabajoFallido, MENSAJE_SIN_MEMORIA
+from app.services.datalab_excel import iter_excel_chunks
+from app.services.datalab_types import infer_date_format, parse_date_column
+import hashlib
+import base64
+import csv
+import io
+import tempfile
+
+
+# Mapeo de columnas del Excel a campos del modelo
+COLUMNAS_EXCEL = {
+    'ID': 'id_excel',
+    'Nº AP': 'numero_ap',
+    'FECHA DE CARGA': 'fecha_carga',
+    'FECHA DE REGISTRO': 'fecha_registro',
+    'FECHA DEL HECHO': 'fecha_hecho',
+    'HORA': 'hora_hecho',
+    'DIA': 'dia',
+    'MES': 'mes',
+    'DEPARTAMENTO': 'departamento',
+    'DIVISION': 'division',
+    'SINAR A CARGO AP': 'sinar_a_cargo_ap',
+    'SINAR A CARGO': 'sinar_a_cargo',
+    'CARATULA': 'caratula',
+    'TIPO/ORIGEN': 'tipo_origen',
+    'LUGAR DEL HECHO': 'lugar_hecho',
+    'LATITUD - LONGITUD': 'latitud_longitud',
+    'BARRIO': 'barrio_id',
+    'NOMBRE DE BARRIO': 'nombre_barrio',
+    'JURISDICCION (DSTO/SCRIA/CRIA)': 'jurisdiccion',
+    'SECTOR': 'sector',
+    'DISTRITO DE PREVENCION': 'distrito_prevencion',
+    'LOCALIDAD': 'localidad',
+    'MUNICIPIO': 'municipio',
+    'T.DEPARTAMENTAL': 't_departamental',
+    'RELATO DEL HECHO': 'relato_hecho',
+    'FISCALIA': 'fiscalia',
+    'JUZGADO': 'juzgado',
+    'CAUSA Nº': 'causa_numero',
+    'ACUSADO': 'acusado',
+    'EDAD': 'edad',
+    'DNI': 'dni',
+    'DLIO': 'dlio',
+    'ALIAS': 'alias',
+    'ESTADOS': 'estados',
+    'ESTADO': 'estado',
+    'ESTADO_NOMBRE': 'estado_nombre',
+    'VINCULADA A': 'vinculada_a',
+    'VINCULADA CON AP': 'vinculada_con_ap',
+    'ACCIONES DESPLEGADAS': 'acciones_desplegadas',
+    'ARCHIVO ADJUNTO': 'archivo_adjunto',
+    'AVANCE': 'avance',
+    'FECHA ELEVACION': 'fecha_elevacion',
+    'OBSERVACIONES': 'observaciones',
+    'ACTUARIO': 'actuario_id',
+    'NOMBRE DEL ACTUARIO': 'nombre_actuario',
+    'FECHA DE ULTIMA ACTUALIZACION': 'fecha_ultima_actualizacion'
+}
+
+# Columnas de acusados adicionales (se guardan como JSON)
+COLUMNAS_ACUSADOS = [
+    'ACUSADO2', 'EDAD2', 'DNI2', 'DLIO2', 'ALIAS2',
+    'ACUSADO3', 'EDAD3', 'DNI3', 'DLIO3', 'ALIAS3'
+]
+
+CAMPOS_NUMERICOS = ['numero_ap', 'barrio_id', 'actuario_id', 'edad', 'estado', 'avance']
+
+# Campos que pueden ser largos
+CAMPOS_LARGOS = ['relato_hecho', 'acciones_desplegadas', 'observaciones', 'lugar_hecho', 'caratula']
+# Campos de tamaño medio
+CAMPOS_MEDIOS = ['dlio', 'nombre_barrio', 'departamento', 'division', 'sinar_a_cargo', 'jurisdiccion']
+
+# Filas por cada INSERT multi-fila (executemany)
+TAMANO_LOTE = 5000
+
+# Marca de valor nulo en el texto canónico del hash de fila
+NULO_HASH = '\x00'
 
 
 def mapear_columna_excel(col_name):
     """Mapea nombres de columnas del Excel a campos del modelo"""
-    mapeo = {
-        'ID': 'id_excel',
-        'Nº AP': 'numero_ap',
-        'FECHA DE CARGA': 'fecha_carga',
-        'FECHA DE REGISTRO': 'fecha_registro',
-        'FECHA DEL HECHO': 'fecha_hecho',
-        'HORA': 'hora_hecho',
-        'DIA': 'dia',
-        'MES': 'mes',
-        'DEPARTAMENTO': 'departamento',
-        'DIVISION': 'division',
-        'SINAR A CARGO AP': 'sinar_a_cargo_ap',
-        'SINAR A CARGO': 'sinar_a_cargo',
-        'CARATULA': 'caratula',
-        'TIPO/ORIGEN': 'tipo_origen',
-        'LUGAR DEL HECHO': 'lugar_hecho',
-        'LATITUD - LONGITUD': 'latitud_longitud',
-        'BARRIO': 'barrio_id',
-        'NOMBRE DE BARRIO': 'nombre_barrio',
-        'JURISDICCION (DSTO/SCRIA/CRIA)': 'jurisdiccion',
-        'SECTOR': 'sector',
-        'DISTRITO DE PREVENCION': 'distrito_prevencion',
-        'LOCALIDAD': 'localidad',
-        'MUNICIPIO': 'municipio',
-        'T.DEPARTAMENTAL': 't_departamental',
-        'RELATO DEL HECHO': 'relato_hecho',
-        'FISCALIA': 'fiscalia',
-        'JUZGADO': 'juzgado',
-        'CAUSA Nº': 'causa_numero',
-        'ACUSADO': 'acusado',
-        'EDAD': 'edad',
-        'DNI': 'dni',
-        'DLIO': 'dlio',
-        'ALIAS': 'alias',
-        'ESTADOS': 'estados',
-        'ESTADO': 'estado',
-        'ESTADO_NOMBRE': 'estado_nombre',
-        'VINCULADA A': 'vinculada_a',
-        'VINCULADA CON AP': 'vinculada_con_ap',
-        'ACCIONES DESPLEGADAS': 'acciones_desplegadas',
-        'ARCHIVO ADJUNTO': 'archivo_adjunto',
-        'AVANCE': 'avance',
-        'FECHA ELEVACION': 'fecha_elevacion',
-        'OBSERVACIONES': 'observaciones',
-        'ACTUARIO': 'actuario_id',
-        'NOMBRE DEL ACTUARIO': 'nombre_actuario',
-        'FECHA DE ULTIMA ACTUALIZACION': 'fecha_ultima_actualizacion'
-    }
-    return mapeo.get(col_name, None)
+    return COLUMNAS_EXCEL.get(col_name, None)
 
 
 def parsear_fecha(valor):
@@ -84,179 +122,720 @@ def parsear_fecha(valor):
         return None
 
 
-def procesar_archivo_denuncias(file, unidad_id, user_id, eliminar_existentes=True):
+def parsear_columna_fecha(serie):
+    """
+    Versión vectorizada de parsear_fecha para una columna completa: el
+    formato se infiere una vez sobre una muestra y se aplica a toda la
+    columna; si no hay un formato único, se interpreta valor por valor.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    formato = infer_date_format(serie)
+    if formato is not None:
+        return parse_date_column(serie, formato)
+    try:
+        return pd.to_datetime(serie, errors='coerce', format='mixed')
+    except Exception:
+        return serie.map(parsear_fecha).astype('datetime64[ns]')
+
+
+def longitud_maxima(campo):
+    """Longitud máxima de texto para un campo (regla de carga acotada al tamaño de la columna)"""
+    if campo in CAMPOS_LARGOS or campo in CAMPOS_MEDIOS:
+        max_length = 500
+    else:
+        max_length = 200
+    
+    longitud_columna = getattr(DenunciaWeb.__table__.c[campo].type, 'length', None)
+    if longitud_columna:
+        max_length = min(max_length, longitud_columna)
+    return max_length
+
+
+def _valor_canonico(valor):
+    """Texto de un valor suelto: enteros sin '.0' y fechas en ISO"""
+    if isinstance(valor, (float, np.floating)) and np.isfinite(valor) and float(valor).is_integer():
+        return str(int(valor))
+    if isinstance(valor, (datetime, pd.Timestamp)):
+        return pd.Timestamp(valor).strftime('%Y-%m-%dT%H:%M:%S')
+    return str(valor)
+
+
+def texto_canonico(serie):
+    """
+    Texto de cada valor de la columna que no depende del dtype con que la
+    leyó pandas: 7, 7.0 y '7' dan '7' (una celda vacía convierte la columna
+    a float64), las fechas van en ISO y los nulos quedan como None.
+    
+    Returns:
+        np.ndarray: valores de texto (object) o None
+    """
+    nulos = serie.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        texto = serie.dt.strftime('%Y-%m-%dT%H:%M:%S').to_numpy(dtype=object)
+    elif pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = serie.to_numpy(dtype=float, na_value=np.nan)
+        enteros = np.isfinite(valores) & (valores == np.round(valores)) & (np.abs(valores) < 2 ** 53)
+        texto = valores.astype(str).astype(object)
+        texto[enteros] = valores[enteros].astype(np.int64).astype(str)
+    elif pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty'):
+        texto = serie.to_numpy(dtype=object).copy()
+    else:
+        # Tipos mezclados (números y textos en la misma columna del Excel)
+        texto = np.array([_valor_canonico(v) for v in serie.tolist()], dtype=object)
+    texto[nulos] = None
+    return texto
+
+
+def _columna_texto(serie, max_length):
+    """
+    Convierte una columna a texto: strip, vacíos a nulo y truncado. Los
+    números se escriben sin '.0' (ver texto_canonico), de modo que un ID
+    o un DNI no cambia si una celda vacía convirtió la columna a float64.
+    """
+    texto = pd.Series(texto_canonico(serie), index=serie.index, dtype=object).str.strip()
+    texto = texto.where(texto != '', None)
+    return texto.str.slice(0, max_length)
+
+
+def _a_float(valor):
+    """Convierte a float sin fallar (None si no es numérico)"""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _valores_opcionales(df, columna, conversor):
+    """Lista de valores convertidos de una columna opcional (None si falta o es nulo)"""
+    if columna not in df.columns:
+        return [None] * len(df)
+    return [conversor(v) if not pd.isna(v) else None for v in df[columna].tolist()]
+
+
+def _acusados_adicionales(df):
+    """Construye la columna acusados_json a partir de ACUSADO2/ACUSADO3"""
+    resultado = pd.Series(None, index=df.index, dtype=object)
+    acusados = [[] for _ in range(len(df))]
+    hay_acusados = False
+    
+    for sufijo in ('2', '3'):
+        col_nombre = f'ACUSADO{sufijo}'
+        if col_nombre not in df.columns:
+            continue
+        
+        mascara = df[col_nombre].notna().to_numpy()
+        if not mascara.any():
+            continue
+        hay_acusados = True
+        
+        nombres = df[col_nombre].tolist()
+        edades = _valores_opcionales(df, f'EDAD{sufijo}', _a_float)
+        dnis = _valores_opcionales(df, f'DNI{sufijo}', str)
+        dlios = _valores_opcionales(df, f'DLIO{sufijo}', str)
+        alias = _valores_opcionales(df, f'ALIAS{sufijo}', str)
+        
+        for pos in mascara.nonzero()[0]:
+            acusados[pos].append({
+                'nombre': str(nombres[pos]),
+                'edad': edades[pos],
+                'dni': dnis[pos],
+                'dlio': dlios[pos],
+                'alias': alias[pos]
+            })
+    
+    if hay_acusados:
+        resultado[:] = [json.dumps(a, ensure_ascii=False) if a else None for a in acusados]
+    return resultado
+
+
+def normalizar_dataframe_denuncias(df, unidad_id, user_id):
+    """
+    Convierte el DataFrame del Excel en columnas del modelo con operaciones
+    vectorizadas (una conversión por columna, no por celda). El índice de
+    `df` es el número de fila en la hoja (iter_excel_chunks) y se conserva
+    para los mensajes de error.
+    
+    Returns:
+        tuple: (DataFrame con columnas de DenunciaWeb, lista de errores por fila)
+    """
+    datos = pd.DataFrame(index=df.index)
+    
+    for col_excel, campo in COLUMNAS_EXCEL.items():
+        if col_excel not in df.columns:
+            # Columna ausente: nula, para que el hash de fila sea estable
+            datos[campo] = pd.Series(pd.NaT if 'fecha' in campo else None, index=df.index)
+            continue
+        serie = df[col_excel]
+        if 'fecha' in campo:
+            datos[campo] = parsear_columna_fecha(serie)
+        elif campo in CAMPOS_NUMERICOS:
+            datos[campo] = pd.to_numeric(serie, errors='coerce')
+        else:
+            datos[campo] = _columna_texto(serie, longitud_maxima(campo))
+    
+    datos['acusados_json'] = _acusados_adicionales(df)
+    datos['hash_fila'] = calcular_hash_filas(datos)
+    
+    # Validar filas: ID (clave de sincronización) y fecha de registro obligatorios
+    errores = []
+    sin_id = datos['id_excel'].isna()
+    for idx in datos.index[sin_id]:
+        errores.append(f"Fila {idx}: ID vacío")
+    invalidas = ~sin_id & datos['fecha_registro'].isna()
+    for idx in datos.index[invalidas]:
+        errores.append(f"Fila {idx}: FECHA DE REGISTRO vacía o inválida")
+    datos = datos[~sin_id & ~invalidas]
+    
+    # Calcular días de investigación
+    ahora = datetime.utcnow()
+    fecha_fin = datos['fecha_elevacion'].fillna(pd.Timestamp(ahora))
+    datos['dias_investigacion'] = (fecha_fin - datos['fecha_registro']).dt.days.clip(lower=0)
+    
+    datos['unidad_id'] = unidad_id
+    datos['user_id'] = user_id
+    
+    return datos, errores
+
+
+def calcular_hash_filas(datos):
+    """
+    Hash de contenido por fila (vectorizado) sobre los campos del Excel.
+    
+    Se usa para detectar filas modificadas al sincronizar sin comparar
+    campo por campo contra la base de datos. Se calcula sobre el texto
+    canónico de cada valor (ver texto_canonico), de modo que la misma fila
+    da el mismo hash aunque su columna llegue como int64 en un archivo y
+    como float64 en otro.
+    """
+    campos = list(COLUMNAS_EXCEL.values()) + ['acusados_json']
+    canonico = {}
+    for campo in campos:
+        texto = texto_canonico(datos[campo])
+        texto[pd.isna(texto)] = NULO_HASH
+        canonico[campo] = texto
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(canonico, index=datos.index), index=False)
+    return pd.Series([format(h, '016x') for h in hashes.tolist()], index=datos.index, dtype=object)
+
+
+def _valores_python(serie):
+    """Convierte una columna a una lista de valores Python (NaN/NaT -> None)"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return [None if pd.isna(v) else v.to_pydatetime() for v in serie.tolist()]
+    return [None if pd.isna(v) else v for v in serie.astype(object).tolist()]
+
+
+def dataframe_a_registros(datos):
+    """Convierte el DataFrame normalizado en una lista de dicts para executemany"""
+    nombres = list(datos.columns)
+    columnas = [_valores_python(datos[c]) for c in nombres]
+    return [dict(zip(nombres, fila)) for fila in zip(*columnas)]
+
+
+def insertar_registros(registros, carga_id=None, tamano_lote=TAMANO_LOTE, al_insertar=None):
+    """
+    Inserta registros con INSERT multi-fila (Core executemany) en lotes.
+    
+    Args:
+        al_insertar: callback opcional (insertadas, total) después de cada lote
+    """
+    tabla = DenunciaWeb.__table__
+    for inicio in range(0, len(registros), tamano_lote):
+        lote = registros[inicio:inicio + tamano_lote]
+        for registro in lote:
+            registro['carga_id'] = carga_id
+        db.session.execute(tabla.insert(), lote)
+        db.session.commit()
+        if al_insertar:
+            al_insertar(inicio + len(lote), len(registros))
+
+
+# ==================== GENERACIONES (CARGAS) ====================
+
+def carga_publicada(unidad_id):
+    """Carga (generación) publicada de la unidad, o None si solo hay datos previos a las cargas"""
+    return DenunciaCarga.query.filter_by(unidad_id=unidad_id, estado=DenunciaCarga.PUBLICADA).first()
+
+
+def carga_anterior(unidad_id):
+    """Carga anterior conservada para revertir, o None"""
+    return DenunciaCarga.query.filter_by(unidad_id=unidad_id, estado=DenunciaCarga.ANTERIOR) \
+        .order_by(DenunciaCarga.id.desc()).first()
+
+
+def consulta_denuncias(unidad_id, carga=None):
+    """
+    Query base de las denuncias visibles de la unidad.
+    
+    Solo incluye la generación publicada, de modo que una carga en curso
+    nunca se ve a medias. Si la unidad todavía no tiene cargas, se usan
+    las filas sin carga asignada (datos previos).
+    
+    Args:
+        carga: Carga publicada ya obtenida (evita volver a consultarla)
+    """
+    query = DenunciaWeb.query.filter(DenunciaWeb.unidad_id == unidad_id)
+    if carga is None:
+        carga = carga_publicada(unidad_id)
+    if carga:
+        return query.filter(DenunciaWeb.carga_id == carga.id)
+    return query.filter(DenunciaWeb.carga_id.is_(None))
+
+
+def asegurar_carga_publicada(unidad_id, user_id):
+    """
+    Devuelve la carga publicada de la unidad; si no existe, publica una con
+    los datos previos (sin carga) para que los cambios incrementales tengan
+    una versión que incrementar.
+    """
+    carga = carga_publicada(unidad_id)
+    if carga:
+        return carga
+    
+    carga = DenunciaCarga(unidad_id=unidad_id, user_id=user_id, estado=DenunciaCarga.PUBLICADA,
+                          publicada_at=datetime.utcnow())
+    db.session.add(carga)
+    db.session.flush()
+    carga.filas = DenunciaWeb.query.filter(
+        DenunciaWeb.unidad_id == unidad_id, DenunciaWeb.carga_id.is_(None)
+    ).update({DenunciaWeb.carga_id: carga.id}, synchronize_session=False)
+    db.session.commit()
+    return carga
+
+
+def _eliminar_filas_carga(unidad_id, carga_id, tamano_lote=TAMANO_LOTE):
+    """Elimina las filas de una carga en lotes cortos (no bloquea a los lectores)"""
+    tabla = DenunciaWeb.__table__
+    eliminadas = 0
+    while True:
+        ids = [fila[0] for fila in db.session.execute(
+            db.select(tabla.c.id).where(tabla.c.unidad_id == unidad_id, tabla.c.carga_id == carga_id)
+            .limit(tamano_lote)
+        )]
+        if not ids:
+            break
+        eliminadas += db.session.execute(tabla.delete().where(tabla.c.id.in_(ids))).rowcount
+        db.session.commit()
+    return eliminadas
+
+
+def cargar_generacion(registros, unidad_id, user_id, al_insertar=None):
+    """
+    Carga los registros en una generación nueva y la publica.
+    
+    Las filas se insertan con la carga en estado 'cargando' (invisible para
+    el dashboard), se valida la cantidad cargada y recién entonces se
+    publica con un único commit.
+    
+    Returns:
+        DenunciaCarga: la carga publicada
+    """
+    carga = DenunciaCarga(unidad_id=unidad_id, user_id=user_id, estado=DenunciaCarga.CARGANDO)
+    db.session.add(carga)
+    db.session.commit()
+    
+    try:
+        insertar_registros(registros, carga_id=carga.id, al_insertar=al_insertar)
+        
+        # Validar antes de publicar
+        cargadas = db.session.query(db.func.count(DenunciaWeb.id)).filter(DenunciaWeb.carga_id == carga.id).scalar()
+        if cargadas != len(registros):
+            raise ValueError(f'Se esperaban {len(registros)} filas y se cargaron {cargadas}')
+        if cargadas == 0:
+            raise ValueError('El archivo no contiene denuncias válidas')
+        
+        carga.filas = cargadas
+        reemplazada = publicar_carga(carga)
+    except Exception:
+        db.session.rollback()
+        carga.estado = DenunciaCarga.FALLIDA
+        db.session.commit()
+        _eliminar_filas_carga(unidad_id, carga.id)
+        raise
+    
+    purgar_cargas_antiguas(unidad_id, conservar_id=reemplazada.id if reemplazada else None)
+    return carga
+
+
+def publicar_carga(carga):
+    """
+    Publica una carga: la anterior publicada pasa a 'anterior' y la nueva a
+    'publicada' en la misma transacción (cambio atómico para los lectores).
+    
+    Returns:
+        DenunciaCarga o None: la generación reemplazada (queda como 'anterior')
+    """
+    anterior = carga_publicada(carga.unidad_id)
+    if anterior:
+        anterior.estado = DenunciaCarga.ANTERIOR
+    else:
+        # Primera carga: los datos previos (sin carga) pasan a ser la generación anterior
+        previos = DenunciaWeb.query.filter(DenunciaWeb.unidad_id == carga.unidad_id,
+                                           DenunciaWeb.carga_id.is_(None))
+        cantidad_previos = previos.count()
+        if cantidad_previos:
+            anterior = DenunciaCarga(unidad_id=carga.unidad_id, user_id=carga.user_id,
+                                     estado=DenunciaCarga.ANTERIOR, filas=cantidad_previos)
+            db.session.add(anterior)
+            db.session.flush()
+            previos.update({DenunciaWeb.carga_id: anterior.id}, synchronize_session=False)
+    
+    carga.estado = DenunciaCarga.PUBLICADA
+    carga.publicada_at = datetime.utcnow()
+    db.session.commit()
+    return anterior
+
+
+def purgar_cargas_antiguas(unidad_id, conservar_id=None):
+    """Elimina las filas de generaciones viejas, conservando solo la recién reemplazada"""
+    anteriores = DenunciaCarga.query.filter(
+        DenunciaCarga.unidad_id == unidad_id,
+        DenunciaCarga.estado == DenunciaCarga.ANTERIOR,
+        DenunciaCarga.id != conservar_id
+    ).all()
+    for carga in anteriores:
+        carga.estado = DenunciaCarga.ELIMINADA
+        for modelo in (DenunciaResumen, DenunciaDimension, DenunciaDependencia):
+            modelo.query.filter_by(carga_id=carga.id).delete(synchronize_session=False)
+        db.session.commit()
+        _eliminar_filas_carga(unidad_id, carga.id)
+
+
+def revertir_carga(unidad_id):
+    """
+    Vuelve a publicar la carga anterior (intercambio atómico con la actual).
+    
+    Returns:
+        tuple: (carga publicada, error_message)
+    """
+    actual = carga_publicada(unidad_id)
+    anterior = carga_anterior(unidad_id)
+    if not actual or not anterior:
+        return None, 'No hay una carga anterior para revertir'
+    
+    try:
+        actual.estado = DenunciaCarga.ANTERIOR
+        anterior.estado = DenunciaCarga.PUBLICADA
+        anterior.publicada_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return None, f'Error al revertir la carga: {str(e)}'
+    
+    audit_log('DENUNCIAS_REVERTED', f'Publicada nuevamente la carga {anterior.id} (antes {actual.id})')
+    actualizar_derivados(unidad_id, precalentar=True)
+    return anterior, None
+
+
+def _eliminar_archivo(file_path):
+    """Elimina un archivo temporal sin fallar"""
+    if file_path and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except:
+            pass
+
+
+def _columna_mapeada(col):
+    """Columnas del Excel que se leen (las demás se descartan al leer)"""
+    return col in COLUMNAS_EXCEL or col in COLUMNAS_ACUSADOS
+
+
+def leer_archivo_denuncias(file_path, unidad_id, user_id):
+    """
+    Lee las columnas mapeadas del Excel guardado por bloques de filas y
+    normaliza cada bloque a medida que se lee, de modo que nunca está en
+    memoria la hoja completa sin normalizar.
+    
+    Returns:
+        tuple: (DataFrame normalizado, lista de errores por fila, error_message)
+    """
+    filas_bloque = current_app.config.get('DATALAB_EXCEL_FILAS_BLOQUE', 50_000)
+    partes = []
+    errores = []
+    try:
+        for df in iter_excel_chunks(file_path, usecols=_columna_mapeada, chunk_rows=filas_bloque):
+            # Validar columnas mínimas requeridas (en el primer bloque)
+            if not partes:
+                columnas_requeridas = ['ID', 'FECHA DE REGISTRO']
+                columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
+                if columnas_faltantes:
+                    return None, None, f"Columnas faltantes: {', '.join(columnas_faltantes)}"
+            
+            datos, errores_bloque = normalizar_dataframe_denuncias(df, unidad_id, user_id)
+            partes.append(datos)
+            errores.extend(errores_bloque)
+    except MemoryError:
+        return None, None, MENSAJE_SIN_MEMORIA
+    except Exception as e:
+        return None, None, f"Error al leer el archivo: {str(e)}"
+    
+    datos = partes[0] if len(partes) == 1 else pd.concat(partes, copy=False)
+    return datos, errores, None
+
+
+def _resumir_errores(errores, cantidad):
+    """Mensaje de error resumido a partir de los errores por fila"""
+    if errores and len(errores) > 10:
+        return f"Algunas filas tuvieron errores. Cargadas: {cantidad}, Errores: {len(errores)}"
+    elif errores:
+        return f"Errores en algunas filas: {'; '.join(errores[:5])}"
+    return None
+
+
+def procesar_archivo_denuncias(file_path, unidad_id, user_id, eliminar_existentes=True, avance=sin_avance):
     """
     Procesa un archivo Excel de denuncias y lo carga en la base de datos.
+    El archivo se elimina al terminar.
     
     Args:
-        file: Archivo Excel subido
+        file_path: Ruta del Excel subido y guardado
         unidad_id: ID de la unidad
         user_id: ID del usuario que carga
-        eliminar_existentes: Si True, elimina todas las denuncias existentes antes de cargar
+        eliminar_existentes: Si True, reemplaza las denuncias existentes por una
+            generación nueva que se publica al terminar la carga. Si False,
+            agrega las filas a la generación publicada.
+        avance: callback (progreso, etapa) para informar el avance del trabajo
     
     Returns:
         tuple: (cantidad_cargada, error_message)
     """
     try:
-        # Guardar archivo temporalmente
-        file_path, safe_filename = save_uploaded_file(file, unidad_id)
+        avance(5, 'Leyendo y normalizando archivo')
+        datos, errores, error = leer_archivo_denuncias(file_path, unidad_id, user_id)
+        if error:
+            _eliminar_archivo(file_path)
+            return None, error
         
-        # Leer Excel
-        try:
-            df = pd.read_excel(file_path, sheet_name=0)
-        except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return None, f"Error al leer el archivo: {str(e)}"
+        avance(25, 'Preparando registros')
+        registros = dataframe_a_registros(datos)
+        del datos
         
-        # Validar columnas mínimas requeridas
-        columnas_requeridas = ['ID', 'FECHA DE REGISTRO']
-        columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
-        if columnas_faltantes:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return None, f"Columnas faltantes: {', '.join(columnas_faltantes)}"
+        def al_insertar(insertadas, total):
+            avance(30 + 55 * insertadas // max(total, 1), f'Insertando denuncias ({insertadas}/{total})')
         
-        # Eliminar denuncias existentes si se solicita
         if eliminar_existentes:
-            cantidad_eliminada = DenunciaWeb.query.filter_by(unidad_id=unidad_id).delete()
+            # Cargar en una generación nueva y publicarla de una sola vez
+            anterior = carga_publicada(unidad_id)
+            carga = cargar_generacion(registros, unidad_id, user_id, al_insertar=al_insertar)
+            audit_log('DENUNCIAS_PUBLISHED',
+                      f'Publicada carga {carga.id} ({carga.filas} denuncias), '
+                      f'reemplaza a {anterior.id if anterior else "datos previos"}', user_id=user_id)
+        else:
+            carga = asegurar_carga_publicada(unidad_id, user_id)
+            insertar_registros(registros, carga_id=carga.id, al_insertar=al_insertar)
+            carga.version = DenunciaCarga.version + 1
+            carga.filas = DenunciaCarga.filas + len(registros)
             db.session.commit()
-            audit_log('DENUNCIAS_DELETED', f'Eliminadas {cantidad_eliminada} denuncias antes de cargar nuevas')
-        
-        # Procesar cada fila
-        denuncias_creadas = 0
-        errores = []
-        
-        for idx, row in df.iterrows():
-            try:
-                denuncia = DenunciaWeb()
-                denuncia.unidad_id = unidad_id
-                denuncia.user_id = user_id
-                
-                # Mapear columnas
-                for col_excel, valor in row.items():
-                    campo_modelo = mapear_columna_excel(col_excel)
-                    if campo_modelo and hasattr(denuncia, campo_modelo):
-                        # Manejar fechas
-                        if 'fecha' in campo_modelo.lower():
-                            fecha_parsed = parsear_fecha(valor)
-                            if not pd.isna(fecha_parsed) and fecha_parsed is not None:
-                                setattr(denuncia, campo_modelo, fecha_parsed.to_pydatetime() if hasattr(fecha_parsed, 'to_pydatetime') else fecha_parsed)
-                        # Manejar valores numéricos
-                        elif campo_modelo in ['numero_ap', 'barrio_id', 'actuario_id', 'edad', 'estado', 'avance']:
-                            if not pd.isna(valor):
-                                try:
-                                    setattr(denuncia, campo_modelo, float(valor))
-                                except:
-                                    pass
-                        # Manejar texto
-                        else:
-                            if not pd.isna(valor):
-                                valor_str = str(valor).strip()
-                                if valor_str:
-                                    # Limitar longitud según el campo
-                                    # Campos que pueden ser largos
-                                    campos_largos = ['relato_hecho', 'acciones_desplegadas', 'observaciones', 'lugar_hecho', 'caratula']
-                                    # Campos de tamaño medio
-                                    campos_medios = ['dlio', 'nombre_barrio', 'departamento', 'division', 'sinar_a_cargo', 'jurisdiccion']
-                                    
-                                    if campo_modelo in campos_largos:
-                                        max_length = 500
-                                    elif campo_modelo in campos_medios:
-                                        max_length = 500
-                                    else:
-                                        max_length = 200
-                                    
-                                    if len(valor_str) > max_length:
-                                        valor_str = valor_str[:max_length]
-                                    setattr(denuncia, campo_modelo, valor_str)
-                
-                # Guardar acusados adicionales como JSON
-                acusados_adicionales = []
-                if not pd.isna(row.get('ACUSADO2', None)):
-                    acusados_adicionales.append({
-                        'nombre': str(row.get('ACUSADO2', '')),
-                        'edad': float(row.get('EDAD2', 0)) if not pd.isna(row.get('EDAD2', None)) else None,
-                        'dni': str(row.get('DNI2', '')) if not pd.isna(row.get('DNI2', None)) else None,
-                        'dlio': str(row.get('DLIO2', '')) if not pd.isna(row.get('DLIO2', None)) else None,
-                        'alias': str(row.get('ALIAS2', '')) if not pd.isna(row.get('ALIAS2', None)) else None
-                    })
-                if not pd.isna(row.get('ACUSADO3', None)):
-                    acusados_adicionales.append({
-                        'nombre': str(row.get('ACUSADO3', '')),
-                        'edad': float(row.get('EDAD3', 0)) if not pd.isna(row.get('EDAD3', None)) else None,
-                        'dni': str(row.get('DNI3', '')) if not pd.isna(row.get('DNI3', None)) else None,
-                        'dlio': str(row.get('DLIO3', '')) if not pd.isna(row.get('DLIO3', None)) else None,
-                        'alias': str(row.get('ALIAS3', '')) if not pd.isna(row.get('ALIAS3', None)) else None
-                    })
-                
-                if acusados_adicionales:
-                    import json
-                    denuncia.acusados_json = json.dumps(acusados_adicionales, ensure_ascii=False)
-                
-                # Calcular días de investigación
-                denuncia.dias_investigacion = denuncia.calcular_dias_investigacion()
-                
-                db.session.add(denuncia)
-                denuncias_creadas += 1
-                
-                # Commit en lotes de 100
-                if denuncias_creadas % 100 == 0:
-                    db.session.commit()
-                    
-            except Exception as e:
-                errores.append(f"Fila {idx + 2}: {str(e)}")
-                continue
+        denuncias_creadas = len(registros)
         
-        # Commit final
-        db.session.commit()
+        avance(90, 'Actualizando resumen del dashboard')
+        actualizar_derivados(unidad_id)
         
         # Limpiar archivo temporal
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        _eliminar_archivo(file_path)
         
         # Auditoría
-        audit_log('DENUNCIAS_UPLOADED', f'Cargadas {denuncias_creadas} denuncias. Errores: {len(errores)}')
+        audit_log('DENUNCIAS_UPLOADED', f'Cargadas {denuncias_creadas} denuncias. Errores: {len(errores)}',
+                  user_id=user_id)
         
-        mensaje_error = None
-        if errores and len(errores) > 10:
-            mensaje_error = f"Algunas filas tuvieron errores. Cargadas: {denuncias_creadas}, Errores: {len(errores)}"
-        elif errores:
-            mensaje_error = f"Errores en algunas filas: {'; '.join(errores[:5])}"
+        return denuncias_creadas, _resumir_errores(errores, denuncias_creadas)
         
-        return denuncias_creadas, mensaje_error
+    except Exception as e:
+        db.session.rollback()
+        _eliminar_archivo(file_path)
+        if isinstance(e, MemoryError):
+            return None, MENSAJE_SIN_MEMORIA
+        return None, f"Error al procesar el archivo: {str(e)}"
+
+
+def sincronizar_denuncias(datos, unidad_id, user_id, retirar_faltantes=False):
+    """
+    Sincroniza las denuncias normalizadas con las existentes de la unidad
+    usando (unidad_id, id_excel) como clave y el hash de fila para detectar
+    cambios. Solo se escriben las filas nuevas o modificadas.
+    
+    Returns:
+        tuple: (resumen dict, lista de errores por fila)
+    """
+    errores = []
+    
+    # Las filas sin ID ya se descartaron al normalizar (normalizar_dataframe_denuncias)
+    # IDs repetidos en el archivo: se conserva la última aparición
+    duplicadas = datos['id_excel'].duplicated(keep='last')
+    for idx in datos.index[duplicadas]:
+        errores.append(f"Fila {idx}: ID {datos.at[idx, 'id_excel']} repetido en el archivo")
+    datos = datos[~duplicadas]
+    
+    # Estado actual: solo id, id_excel y hash
+    carga = asegurar_carga_publicada(unidad_id, user_id)
+    existentes = pd.DataFrame(
+        consulta_denuncias(unidad_id, carga)
+        .with_entities(DenunciaWeb.id, DenunciaWeb.id_excel, DenunciaWeb.hash_fila).all(),
+        columns=['_id', 'id_excel', '_hash_actual']
+    ).drop_duplicates('id_excel', keep='last')
+    
+    cruce = datos.merge(existentes, on='id_excel', how='left', sort=False)
+    nuevas = cruce['_id'].isna()
+    modificadas = ~nuevas & (cruce['_hash_actual'] != cruce['hash_fila'])
+    
+    tabla = DenunciaWeb.__table__
+    
+    # Insertar nuevas (en la generación publicada)
+    registros_nuevos = dataframe_a_registros(cruce.loc[nuevas, datos.columns])
+    for registro in registros_nuevos:
+        registro['carga_id'] = carga.id
+    for inicio in range(0, len(registros_nuevos), TAMANO_LOTE):
+        db.session.execute(tabla.insert(), registros_nuevos[inicio:inicio + TAMANO_LOTE])
+    
+    # Actualizar modificadas
+    actualizar = cruce.loc[modificadas, list(datos.columns) + ['_id']].drop(columns=['unidad_id'])
+    actualizar['updated_at'] = datetime.utcnow()
+    # Los bindparam no pueden llamarse igual que las columnas del SET
+    actualizar.columns = [c if c == '_id' else f'v_{c}' for c in actualizar.columns]
+    registros_modificados = dataframe_a_registros(actualizar)
+    if registros_modificados:
+        valores = {c[2:]: bindparam(c) for c in actualizar.columns if c != '_id'}
+        sentencia = tabla.update().where(tabla.c.id == bindparam('_id')).values(**valores)
+        for inicio in range(0, len(registros_modificados), TAMANO_LOTE):
+            db.session.execute(sentencia, registros_modificados[inicio:inicio + TAMANO_LOTE])
+    
+    # Retirar las que ya no vienen en el archivo
+    retiradas = 0
+    if retirar_faltantes:
+        ids_faltantes = existentes.loc[~existentes['id_excel'].isin(datos['id_excel']), '_id'].tolist()
+        for inicio in range(0, len(ids_faltantes), TAMANO_LOTE):
+            retiradas += db.session.execute(
+                tabla.delete().where(tabla.c.id.in_(ids_faltantes[inicio:inicio + TAMANO_LOTE]))
+            ).rowcount
+    
+    # Nueva versión de los datos (invalida la caché del dashboard)
+    if registros_nuevos or registros_modificados or retiradas:
+        carga.version = DenunciaCarga.version + 1
+        carga.filas = DenunciaCarga.filas + len(registros_nuevos) - retiradas
+    db.session.commit()
+    
+    resumen = {
+        'insertadas': len(registros_nuevos),
+        'actualizadas': len(registros_modificados),
+        'sin_cambios': int((~nuevas & ~modificadas).sum()),
+        'retiradas': retiradas
+    }
+    return resumen, errores
+
+
+def sincronizar_archivo_denuncias(file_path, unidad_id, user_id, retirar_faltantes=False, avance=sin_avance):
+    """
+    Procesa un archivo Excel de denuncias en modo incremental (upsert por ID).
+    El archivo se elimina al terminar.
+    
+    Args:
+        file_path: Ruta del Excel subido y guardado
+        unidad_id: ID de la unidad
+        user_id: ID del usuario que carga
+        retirar_faltantes: Si True, elimina las denuncias cuyo ID ya no figura en el archivo
+        avance: callback (progreso, etapa) para informar el avance del trabajo
+    
+    Returns:
+        tuple: (resumen dict con insertadas/actualizadas/sin_cambios/retiradas, error_message)
+    """
+    try:
+        avance(5, 'Leyendo y normalizando archivo')
+        datos, errores, error = leer_archivo_denuncias(file_path, unidad_id, user_id)
+        if error:
+            _eliminar_archivo(file_path)
+            return None, error
+        
+        avance(40, 'Sincronizando con las denuncias existentes')
+        resumen, errores_sync = sincronizar_denuncias(datos, unidad_id, user_id, retirar_faltantes)
+        errores.extend(errores_sync)
+        
+        _eliminar_archivo(file_path)
+        avance(90, 'Actualizando resumen del dashboard')
+        actualizar_derivados(unidad_id)
+        
+        audit_log(
+            'DENUNCIAS_SYNCED',
+            f"Sincronizadas denuncias: {resumen['insertadas']} nuevas, {resumen['actualizadas']} actualizadas, "
+            f"{resumen['sin_cambios']} sin cambios, {resumen['retiradas']} retiradas. Errores: {len(errores)}",
+            user_id=user_id
+        )
+        
+        return resumen, _resumir_errores(errores, resumen['insertadas'] + resumen['actualizadas'])
         
     except Exception as e:
         db.session.rollback()
-        if 'file_path' in locals() and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        _eliminar_archivo(file_path)
+        if isinstance(e, MemoryError):
+            return None, MENSAJE_SIN_MEMORIA
         return None, f"Error al procesar el archivo: {str(e)}"
 
 
+def precalentar_dashboard(trabajo):
+    """
+    Acción al completar una carga de denuncias, en el proceso web: precalienta
+    su caché en memoria con la vista sin filtros (con Redis ya lo hizo el trabajo).
+    """
+    if not cache_compartida():
+        obtener_datos_graficos(trabajo.unidad_id)
+
+
+def descartar_archivo_trabajo(trabajo):
+    """Acción al vencer de una carga de denuncias: elimina el archivo subido"""
+    _eliminar_archivo(trabajo.get_parametros().get('file_path'))
+
+
+@tarea('denuncias_reemplazar', al_completar=precalentar_dashboard, al_vencer=descartar_archivo_trabajo)
+def tarea_reemplazar_denuncias(trabajo, avance, file_path):
+    """Tarea en segundo plano: reemplazar las denuncias de la unidad por el archivo"""
+    cantidad, error = procesar_archivo_denuncias(file_path, trabajo.unidad_id, trabajo.user_id,
+                                                 eliminar_existentes=True, avance=avance)
+    if cantidad is None:
+        raise TrabajoFallido(error)
+    return {'mensaje': f'{cantidad} denuncias cargadas correctamente', 'advertencia': error}
+
+
+@tarea('denuncias_sincronizar', al_completar=precalentar_dashboard, al_vencer=descartar_archivo_trabajo)
+def tarea_sincronizar_denuncias(trabajo, avance, file_path, retirar_faltantes=False):
+    """Tarea en segundo plano: sincronizar las denuncias de la unidad con el archivo"""
+    resumen, error = sincronizar_archivo_denuncias(file_path, trabajo.unidad_id, trabajo.user_id,
+                                                   retirar_faltantes=retirar_faltantes, avance=avance)
+    if resumen is None:
+        raise TrabajoFallido(error)
+    return {
+        'mensaje': f"Sincronización completa: {resumen['insertadas']} nuevas, "
+                   f"{resumen['actualizadas']} actualizadas, {resumen['sin_cambios']} sin cambios, "
+                   f"{resumen['retiradas']} retiradas",
+        'advertencia': error
+    }
+
+
+# Filtros de selección múltiple: clave del filtro -> campo (en DenunciaWeb y DenunciaResumen)
+FILTROS_DIMENSION = {
+    'tipos': 'tipo_origen',
+    'departamentos': 'departamento',
+    'divisiones': 'division',
+    'secciones': 'sinar_a_cargo',
+    'estados': 'estado_nombre',
+    'actuarios': 'nombre_actuario',
+}
+
+
+def aplicar_filtros_dimension(query, modelo, filtros):
+    """Aplica los filtros de selección múltiple sobre las columnas de `modelo`"""
+    for clave, campo in FILTROS_DIMENSION.items():
+        if filtros.get(clave):
+            query = query.filter(getattr(modelo, campo).in_(filtros[clave]))
+    return query
+
+
 def aplicar_filtros(query, filtros):
     """Aplica filtros a una query de DenunciaWeb"""
     if not filtros:
         return query
     
     # Filtros de selección múltiple
-    if filtros.get('tipos'):
-        query = query.filter(DenunciaWeb.tipo_origen.in_(filtros['tipos']))
-    if filtros.get('departamentos'):
-        query = query.filter(DenunciaWeb.departamento.in_(filtros['departamentos']))
-    if filtros.get('divisiones'):
-        query = query.filter(DenunciaWeb.division.in_(filtros['divisiones']))
-    if filtros.get('secciones'):
-        query = query.filter(DenunciaWeb.sinar_a_cargo.in_(filtros['secciones']))
-    if filtros.get('estados'):
-        query = query.filter(DenunciaWeb.estado_nombre.in_(filtros['estados']))
-    if filtros.get('actuarios'):
-        query = query.filter(DenunciaWeb.nombre_actuario.in_(filtros['actuarios']))
+    query = aplicar_filtros_dimension(query, DenunciaWeb, filtros)
     
     # Filtros de rango por fecha de registro
     if filtros.get('fecha_desde'):
@@ -265,13 +844,13 @@ def aplicar_filtros(query, filtros):
         query = query.filter(DenunciaWeb.fecha_registro <= filtros['fecha_hasta'])
 
     # Filtros de rango por días de investigación
-    # Usamos el campo calculado y almacenado en la BD `dias_investigacion`
-    # para que TODOS los componentes (tarjetas, gráficos, etc.) respeten
-    # los filtros de días de forma consistente.
+    # Se calculan en la base de datos con la misma expresión que usan los
+    # gráficos (`dias_transcurridos`), para que TODOS los componentes
+    # (tarjetas, gráficos, drill-down) respeten los filtros de días.
     if filtros.get('dias_desde'):
-        query = query.filter(DenunciaWeb.dias_investigacion >= filtros['dias_desde'])
+        query = query.filter(DenunciaWeb.dias_transcurridos >= filtros['dias_desde'])
     if filtros.get('dias_hasta'):
-        query = query.filter(DenunciaWeb.dias_investigacion <= filtros['dias_hasta'])
+        query = query.filter(DenunciaWeb.dias_transcurridos <= filtros['dias_hasta'])
 
     if filtros.get('avance_desde'):
         query = query.filter(DenunciaWeb.avance >= filtros['avance_desde'])
@@ -281,10 +860,374 @@ def aplicar_filtros(query, filtros):
     return query
 
 
+# Facetas del dashboard: clave del resultado -> columna agrupada
+FACETAS = {
+    'estados': DenunciaWeb.estado_nombre,
+    'departamentos_chart': DenunciaWeb.departamento,
+    'divisiones_chart': DenunciaWeb.division,
+    'secciones_chart': DenunciaWeb.sinar_a_cargo,
+    'actuarios': DenunciaWeb.nombre_actuario,
+}
+
+# Rangos de avance del dashboard: (etiqueta, desde, hasta inclusivo)
+RANGOS_AVANCE = [('10-20', 10, 20), ('30-50', 30, 50), ('60-70', 60, 70), ('80-100', 80, 100)]
+AVANCE_VACIAS = 'Vacías'
+
+# Claves de las opciones de filtros del dashboard
+DIMENSIONES_OPCIONES = ['tipos', 'departamentos', 'divisiones', 'secciones', 'estados', 'actuarios']
+
+
+# Dimensiones de filtro sin jerarquía: clave de opciones -> campo
+DIMENSIONES_PLANAS = {
+    'tipos': 'tipo_origen',
+    'estados': 'estado_nombre',
+    'actuarios': 'nombre_actuario',
+}
+
+
+def medidas_dashboard():
+    """
+    Medidas agregadas del dashboard como (nombre, expresión SQL).
+    
+    Todas son sumables entre grupos (conteos y sumas), de modo que se
+    calculan por combinación de facetas en un único GROUP BY y luego se
+    combinan en Python.
+    """
+    dias = DenunciaWeb.dias_transcurridos
+    rango_dias = DenunciaWeb.rango_dias
+    
+    def contar_si(condicion):
+        return db.func.sum(case((condicion, 1), else_=0))
+    
+    medidas = [('cantidad', db.func.count(DenunciaWeb.id))]
+    for i, (etiqueta, desde, hasta) in enumerate(RANGOS_AVANCE):
+        medidas.append((f'avance_{i}', contar_si(DenunciaWeb.avance.between(desde, hasta))))
+    medidas.append(('avance_vacias', contar_si(DenunciaWeb.avance.is_(None))))
+    for i, (_, _, etiqueta) in enumerate(RANGOS_DIAS):
+        medidas.append((f'dias_{i}', contar_si(rango_dias == etiqueta)))
+    medidas.append(('dias_sin_datos', contar_si(dias.is_(None))))
+    medidas += [
+        ('avance_suma', db.func.sum(DenunciaWeb.avance)),
+        ('avance_cantidad', db.func.count(DenunciaWeb.avance)),
+        ('dias_suma', db.func.sum(dias)),
+        ('dias_cantidad', db.func.count(dias)),
+    ]
+    return medidas
+
+
+def combinar_grupos(grupos):
+    """
+    Combina filas agregadas por facetas (atributos = claves de FACETAS y
+    nombres de medidas_dashboard) en la estructura que usa el dashboard.
+    """
+    totales = {}
+    facetas = {clave: {} for clave in FACETAS}
+    
+    for grupo in grupos:
+        medidas = grupo._mapping
+        for nombre, valor in medidas.items():
+            if nombre not in FACETAS:
+                totales[nombre] = totales.get(nombre, 0) + (valor or 0)
+        cantidad = int(medidas['cantidad'] or 0)
+        for clave in FACETAS:
+            valor_faceta = medidas[clave]
+            if valor_faceta:
+                facetas[clave][valor_faceta] = facetas[clave].get(valor_faceta, 0) + cantidad
+    
+    def total(nombre):
+        return totales.get(nombre, 0)
+    
+    avance_data = {etiqueta: int(total(f'avance_{i}')) for i, (etiqueta, _, _) in enumerate(RANGOS_AVANCE)}
+    avance_data[AVANCE_VACIAS] = int(total('avance_vacias'))
+    
+    dias_data = {etiqueta: int(total(f'dias_{i}')) for i, (_, _, etiqueta) in enumerate(RANGOS_DIAS)}
+    dias_data[RANGO_DIAS_SIN_DATOS] = int(total('dias_sin_datos'))
+    
+    total_denuncias = int(total('cantidad'))
+    dias_promedio = total('dias_suma') / total('dias_cantidad') if total('dias_cantidad') else 0
+    avance_promedio = total('avance_suma') / total('avance_cantidad') if total('avance_cantidad') else 0
+    
+    resultado = {clave: dict(sorted(valores.items())) for clave, valores in facetas.items()}
+    resultado.update({
+        'dias_investigacion': dias_data,
+        'avance': avance_data,
+        'total': total_denuncias,
+        'resumen': {
+            'total_denuncias': total_denuncias,
+            'dias_promedio': round(float(dias_promedio), 1),
+            'avance_promedio': round(float(avance_promedio), 1)
+        }
+    })
+    return resultado
+
+
+def calcular_opciones_filtros(arbol, filtros=None):
+    """
+    Opciones de filtros a partir del árbol de dimensiones (ver
+    arbol_dimensiones).
+    
+    Divisiones y secciones se restringen a los departamentos/divisiones
+    seleccionados (selects en cascada).
+    """
+    departamentos_sel = set(filtros.get('departamentos') or []) if filtros else set()
+    divisiones_sel = set(filtros.get('divisiones') or []) if filtros else set()
+    
+    opciones = {clave: set(arbol[clave]) for clave in DIMENSIONES_PLANAS}
+    opciones.update({'departamentos': set(), 'divisiones': set(), 'secciones': set()})
+    for departamento, division, seccion in arbol['dependencias']:
+        if departamento:
+            opciones['departamentos'].add(departamento)
+        if (not departamentos_sel or departamento in departamentos_sel) and \
+           (not divisiones_sel or division in divisiones_sel):
+            if division:
+                opciones['divisiones'].add(division)
+            if seccion:
+                opciones['secciones'].add(seccion)
+    
+    return {clave: sorted(opciones[clave]) for clave in DIMENSIONES_OPCIONES}
+
+
+# ==================== RESUMEN PRE-AGREGADO (CUBO) ====================
+
+# Dimensiones del resumen (mismos nombres de campo en DenunciaWeb y DenunciaResumen)
+DIMENSIONES_RESUMEN = ['tipo_origen', 'departamento', 'division', 'sinar_a_cargo', 'estado_nombre', 'nombre_actuario']
+
+
+def construir_resumen(carga):
+    """
+    Recalcula el resumen de una carga con un único INSERT ... SELECT
+    agrupado por dimensiones y mes de registro (no se traen filas a Python).
+    """
+    tabla = DenunciaResumen.__table__
+    db.session.execute(tabla.delete().where(tabla.c.carga_id == carga.id))
+    
+    dimensiones = [getattr(DenunciaWeb, campo) for campo in DIMENSIONES_RESUMEN]
+    mes = inicio_mes(DenunciaWeb.fecha_registro)
+    medidas = medidas_dashboard()
+    
+    seleccion = db.select(
+        literal(carga.unidad_id), literal(carga.id), *dimensiones, mes,
+        *[expresion for _, expresion in medidas]
+    ).where(
+        DenunciaWeb.unidad_id == carga.unidad_id,
+        DenunciaWeb.carga_id == carga.id
+    ).group_by(*dimensiones, mes)
+    
+    columnas = ['unidad_id', 'carga_id'] + DIMENSIONES_RESUMEN + ['mes_registro'] + [nombre for nombre, _ in medidas]
+    db.session.execute(tabla.insert().from_select(columnas, seleccion))
+    
+    construir_dimensiones(carga)
+
+
+def construir_dimensiones(carga):
+    """
+    Recalcula las tablas de dimensiones de una carga a partir del resumen
+    (mucho más chico que denuncias_web).
+    """
+    tabla_dimensiones = DenunciaDimension.__table__
+    tabla_dependencias = DenunciaDependencia.__table__
+    db.session.execute(tabla_dimensiones.delete().where(tabla_dimensiones.c.carga_id == carga.id))
+    db.session.execute(tabla_dependencias.delete().where(tabla_dependencias.c.carga_id == carga.id))
+    
+    for clave, campo in DIMENSIONES_PLANAS.items():
+        columna = getattr(DenunciaResumen, campo)
+        seleccion = db.select(
+            literal(carga.unidad_id), literal(carga.id), literal(clave), columna
+        ).where(
+            DenunciaResumen.carga_id == carga.id, columna.isnot(None), columna != ''
+        ).distinct()
+        db.session.execute(tabla_dimensiones.insert().from_select(
+            ['unidad_id', 'carga_id', 'dimension', 'valor'], seleccion
+        ))
+    
+    jerarquia = [DenunciaResumen.departamento, DenunciaResumen.division, DenunciaResumen.sinar_a_cargo]
+    seleccion = db.select(literal(carga.unidad_id), literal(carga.id), *jerarquia).where(
+        DenunciaResumen.carga_id == carga.id
+    ).distinct()
+    db.session.execute(tabla_dependencias.insert().from_select(
+        ['unidad_id', 'carga_id', 'departamento', 'division', 'sinar_a_cargo'], seleccion
+    ))
+
+
+def asegurar_resumen(carga):
+    """
+    Garantiza que el resumen de la carga corresponda a su versión de datos
+    y al día actual (los rangos de días cambian con la fecha).
+    
+    La actualización de resumen_fecha/resumen_version funciona como bloqueo:
+    solo el request que la logra recalcula, los demás esperan el commit.
+    """
+    hoy = datetime.utcnow().date()
+    if carga.resumen_fecha == hoy and carga.resumen_version == carga.version:
+        return
+    
+    tabla = DenunciaCarga.__table__
+    reclamado = db.session.execute(
+        tabla.update().where(
+            tabla.c.id == carga.id,
+            or_(tabla.c.resumen_fecha.is_(None), tabla.c.resumen_fecha != hoy,
+                tabla.c.resumen_version.is_(None), tabla.c.resumen_version != tabla.c.version)
+        ).values(resumen_fecha=hoy, resumen_version=tabla.c.version)
+    ).rowcount
+    try:
+        if reclamado:
+            construir_resumen(carga)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def filtros_dimensionales(filtros):
+    """
+    Indica si los filtros se pueden responder desde el resumen: solo
+    filtros de dimensiones y, opcionalmente, fecha_desde al inicio de un mes.
+    """
+    for clave, valor in (filtros or {}).items():
+        if not valor or clave in FILTROS_DIMENSION:
+            continue
+        if clave == 'fecha_desde' and valor == datetime(valor.year, valor.month, 1):
+            continue
+        return False
+    return True
+
+
+def _calcular_datos_resumen(carga, filtros):
+    """Datos del dashboard calculados desde el resumen pre-agregado"""
+    asegurar_resumen(carga)
+    
+    query_base = DenunciaResumen.query.filter(DenunciaResumen.carga_id == carga.id)
+    query_filtrada = aplicar_filtros_dimension(query_base, DenunciaResumen, filtros or {})
+    if filtros and filtros.get('fecha_desde'):
+        query_filtrada = query_filtrada.filter(DenunciaResumen.mes_registro >= filtros['fecha_desde'].date())
+    
+    facetas = [getattr(DenunciaResumen, columna.key) for columna in FACETAS.values()]
+    columnas = [columna.label(clave) for clave, columna in zip(FACETAS, facetas)]
+    columnas += [db.func.sum(getattr(DenunciaResumen, nombre)).label(nombre) for nombre, _ in medidas_dashboard()]
+    datos = combinar_grupos(query_filtrada.with_entities(*columnas).group_by(*facetas).all())
+    datos['opciones_filtros'] = calcular_opciones_filtros(arbol_dimensiones(carga.unidad_id, carga), filtros)
+    
+    return datos
+
+
+# ==================== CACHÉ DE RESULTADOS ====================
+
+def canonizar_filtros(filtros):
+    """Representación canónica (texto) de un conjunto de filtros para usar como clave de caché"""
+    canonico = {}
+    for clave, valor in (filtros or {}).items():
+        if valor is None or valor == '' or valor == []:
+            continue
+        if isinstance(valor, (list, tuple, set)):
+            valor = sorted(str(v) for v in valor)
+        elif isinstance(valor, datetime):
+            valor = valor.isoformat()
+        canonico[clave] = valor
+    return json.dumps(canonico, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def clave_cache(unidad_id, carga, tipo, *partes):
+    """
+    Clave de caché versionada: unidad + carga publicada + versión de datos
+    + día (UTC). Cualquier carga, sincronización o reversión cambia la
+    clave, por lo que no hace falta invalidar entradas (las viejas salen por
+    LRU/TTL); el día la cambia a medianoche, como el resumen (ver
+    asegurar_resumen), porque los rangos de días dependen de la fecha.
+    """
+    version = f'{carga.id}.{carga.version}' if carga else '0'
+    hoy = datetime.utcnow().date().isoformat()
+    resumen = hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+    return f'denuncias:{unidad_id}:{version}:{hoy}:{tipo}:{resumen}'
+
+
+def actualizar_derivados(unidad_id, precalentar=None):
+    """
+    Actualiza los datos derivados después de una carga: recalcula el
+    resumen pre-agregado y precalienta la caché con la vista sin filtros.
+    
+    Args:
+        precalentar: por defecto solo si la caché es compartida (Redis).
+            Dentro de un trabajo, la caché en memoria es la del proceso del
+            pool, que el proceso web no ve: allí precalienta el proceso web
+            al completarse el trabajo (precalentar_dashboard).
+    """
+    if precalentar is None:
+        precalentar = cache_compartida()
+    try:
+        carga = carga_publicada(unidad_id)
+        if carga:
+            asegurar_resumen(carga)
+        if precalentar:
+            obtener_datos_graficos(unidad_id)
+    except Exception as e:
+        print(f"Error al actualizar datos derivados de denuncias: {e}")
+
+
+def arbol_dimensiones(unidad_id, carga):
+    """
+    Árbol de dimensiones de la unidad para las opciones de filtros:
+    {'tipos': [...], 'estados': [...], 'actuarios': [...],
+     'dependencias': [[departamento, division, seccion], ...]}
+    
+    Se lee de las tablas de dimensiones de la carga y se cachea por versión
+    de datos. Los datos anteriores a las cargas versionadas se recorren con
+    DISTINCT sobre denuncias_web.
+    """
+    def calcular():
+        if carga is None:
+            return _arbol_sin_carga(unidad_id)
+        
+        asegurar_resumen(carga)
+        arbol = {clave: [] for clave in DIMENSIONES_PLANAS}
+        for dimension, valor in db.session.query(DenunciaDimension.dimension, DenunciaDimension.valor).filter(
+            DenunciaDimension.carga_id == carga.id
+        ):
+            arbol[dimension].append(valor)
+        arbol['dependencias'] = [
+            list(fila) for fila in db.session.query(
+                DenunciaDependencia.departamento, DenunciaDependencia.division, DenunciaDependencia.sinar_a_cargo
+            ).filter(DenunciaDependencia.carga_id == carga.id)
+        ]
+        return arbol
+    
+    return cacheado(clave_cache(unidad_id, carga, 'dimensiones'), calcular)
+
+
+def _arbol_sin_carga(unidad_id):
+    """Árbol de dimensiones para datos sin carga versionada"""
+    query = consulta_denuncias(unidad_id, None)
+    arbol = {}
+    for clave, campo in DIMENSIONES_PLANAS.items():
+        columna = getattr(DenunciaWeb, campo)
+        arbol[clave] = [fila[0] for fila in query.with_entities(columna).distinct() if fila[0]]
+    arbol['dependencias'] = [
+        list(fila) for fila in query.with_entities(
+            DenunciaWeb.departamento, DenunciaWeb.division, DenunciaWeb.sinar_a_cargo
+        ).distinct()
+    ]
+    return arbol
+
+
+def opciones_cascada(unidad_id, opcion, departamentos=None, divisiones=None):
+    """
+    Opciones de divisiones o secciones para los departamentos/divisiones
+    seleccionados (selects en cascada del dashboard).
+    """
+    carga = carga_publicada(unidad_id)
+    filtros = {'departamentos': departamentos, 'divisiones': divisiones}
+    return calcular_opciones_filtros(arbol_dimensiones(unidad_id, carga), filtros)[opcion]
+
+
 def obtener_datos_graficos(unidad_id, filtros=None):
     """
     Obtiene datos para los gráficos del dashboard con filtros.
     
+    Todas las facetas, rangos y promedios salen de una única consulta
+    agrupada sobre el conjunto filtrado (o del resumen pre-agregado); las
+    opciones de filtros, del árbol de dimensiones. La cantidad de consultas no
+    depende de la cantidad de gráficos. El resultado se cachea por unidad,
+    versión de datos y filtros.
+    
     Returns:
         dict: {
             'estados': {estado: cantidad},
@@ -297,235 +1240,235 @@ def obtener_datos_graficos(unidad_id, filtros=None):
             }
         }
     """
+    carga = carga_publicada(unidad_id)
+    clave = clave_cache(unidad_id, carga, 'dashboard', canonizar_filtros(filtros))
+    return cacheado(clave, lambda: _calcular_datos_graficos(unidad_id, carga, filtros))
+
+
+def _calcular_datos_graficos(unidad_id, carga, filtros):
+    """Calcula los datos del dashboard (sin caché)"""
+    # Filtros solo por dimensiones: responder desde el resumen pre-agregado
+    if carga and filtros_dimensionales(filtros):
+        return _calcular_datos_resumen(carga, filtros)
+    
     # Query base
-    query_base = DenunciaWeb.query.filter_by(unidad_id=unidad_id)
+    query_base = consulta_denuncias(unidad_id, carga)
     query_filtrada = aplicar_filtros(query_base, filtros)
     
-    # 1. Gráfico de Estados - aplicar TODOS los filtros correctamente
-    estados_query = query_filtrada
-    denuncias_filtradas_por_dias = None  # Inicializar variable
+    # 1. Facetas y medidas en una sola pasada (GROUP BY por combinación de facetas)
+    columnas = [columna.label(clave) for clave, columna in FACETAS.items()]
+    columnas += [expresion.label(nombre) for nombre, expresion in medidas_dashboard()]
+    grupos = query_filtrada.with_entities(*columnas).group_by(*FACETAS.values()).all()
+    datos = combinar_grupos(grupos)
     
-    # Si hay filtros de días, necesitamos calcularlos dinámicamente
-    # Obtener todas las denuncias que pasan los filtros básicos
-    if filtros and (filtros.get('dias_desde') or filtros.get('dias_hasta')):
-        from datetime import datetime
-        from dateutil import parser
-        
-        # Obtener todas las denuncias que pasan los filtros básicos
-        denuncias_candidatas = estados_query.all()
-        denuncias_filtradas_por_dias = []
-        
-        for denuncia in denuncias_candidatas:
-            if denuncia.fecha_registro:
-                fecha_fin = denuncia.fecha_elevacion if denuncia.fecha_elevacion else datetime.utcnow()
-                if isinstance(fecha_fin, str):
-                    fecha_fin = parser.parse(fecha_fin)
-                if isinstance(denuncia.fecha_registro, str):
-                    fecha_registro = parser.parse(denuncia.fecha_registro)
-                else:
-                    fecha_registro = denuncia.fecha_registro
-                
-                delta = fecha_fin - fecha_registro
-                dias = max(0, delta.days)
-                
-                # Aplicar filtros de días
-                if filtros.get('dias_desde') and dias < filtros['dias_desde']:
-                    continue
-                if filtros.get('dias_hasta') and dias > filtros['dias_hasta']:
-                    continue
-                
-                denuncias_filtradas_por_dias.append(denuncia)
-        
-        # Contar estados de las denuncias filtradas por días
-        estados_dict = {}
-        for denuncia in denuncias_filtradas_por_dias:
-            if denuncia.estado_nombre:
-                estados_dict[denuncia.estado_nombre] = estados_dict.get(denuncia.estado_nombre, 0) + 1
-    else:
-        # Si no hay filtros de días, usar query directa (más eficiente)
-        estados_data = estados_query.with_entities(
-            DenunciaWeb.estado_nombre,
-            db.func.count(DenunciaWeb.id).label('cantidad')
-        ).group_by(DenunciaWeb.estado_nombre).all()
-        estados_dict = {estado: cantidad for estado, cantidad in estados_data if estado}
-    
-    # 2. Gráfico de Días de Investigación
-    # Calcular días desde fecha_registro hasta fecha_elevacion (o fecha actual)
-    # para TODAS las denuncias filtradas que tengan fecha_registro.
-    from datetime import datetime
-    estados_investigativos = ['ETAPA INVEST.', 'ETAPA INVEST. VINCULADA']
-    dias_query = query_filtrada.filter(DenunciaWeb.fecha_registro.isnot(None))
-    
-    rangos_dias = {'0-100 días': 0, '100-200 días': 0, '200-300 días': 0, '+300 días': 0, 'Sin datos': 0}
-    
-    for denuncia in dias_query.all():
-        if denuncia.fecha_registro:
-            fecha_fin = denuncia.fecha_elevacion if denuncia.fecha_elevacion else datetime.utcnow()
-            if isinstance(fecha_fin, str):
-                from dateutil import parser
-                fecha_fin = parser.parse(fecha_fin)
-            if isinstance(denuncia.fecha_registro, str):
-                from dateutil import parser
-                fecha_registro = parser.parse(denuncia.fecha_registro)
-            else:
-                fecha_registro = denuncia.fecha_registro
-            
-            delta = fecha_fin - fecha_registro
-            dias = max(0, delta.days)
-            
-            if dias < 100:
-                rangos_dias['0-100 días'] += 1
-            elif dias < 200:
-                rangos_dias['100-200 días'] += 1
-            elif dias < 300:
-                rangos_dias['200-300 días'] += 1
-            else:
-                rangos_dias['+300 días'] += 1
-        else:
-            rangos_dias['Sin datos'] += 1
+    # 2. Opciones para filtros (tablas de dimensiones de la unidad, sin filtros)
+    datos['opciones_filtros'] = calcular_opciones_filtros(arbol_dimensiones(unidad_id, carga), filtros)
     
-    dias_data = rangos_dias
+    return datos
+
+
+# Slices del drill-down: tipo -> faceta de los datos del dashboard con sus totales
+FACETAS_SLICE = {'estados': 'estados', 'actuarios': 'actuarios', 'dias': 'dias_investigacion', 'avance': 'avance'}
+
+
+class SliceInvalido(ValueError):
+    """Tipo de slice del drill-down no soportado"""
+
+
+def validar_slice(slice_tipo):
+    """Lanza SliceInvalido si el tipo de slice no es uno de FACETAS_SLICE"""
+    if slice_tipo and slice_tipo not in FACETAS_SLICE:
+        raise SliceInvalido(f'Tipo de slice no soportado: {slice_tipo}')
+
+
+def aplicar_slice(query, slice_tipo, slice_label):
+    """Aplica el "slice" adicional de un gráfico del dashboard (drill-down)"""
+    validar_slice(slice_tipo)
+    if not slice_tipo or not slice_label:
+        return query
     
-    # 3. Gráfico de Avance
-    avance_query = query_filtrada.filter(DenunciaWeb.avance.isnot(None))
+    if slice_tipo == 'estados':
+        query = query.filter(DenunciaWeb.estado_nombre == slice_label)
+    elif slice_tipo == 'actuarios':
+        query = query.filter(DenunciaWeb.nombre_actuario == slice_label)
+    elif slice_tipo == 'dias':
+        # Mismo rango que el gráfico, calculado en la base de datos
+        query = query.filter(DenunciaWeb.rango_dias == slice_label)
+    elif slice_tipo == 'avance':
+        # Rango de avance en porcentaje
+        if slice_label == AVANCE_VACIAS:
+            query = query.filter(DenunciaWeb.avance.is_(None))
+        else:
+            for etiqueta, desde, hasta in RANGOS_AVANCE:
+                if slice_label == etiqueta:
+                    query = query.filter(DenunciaWeb.avance >= desde, DenunciaWeb.avance <= hasta)
     
-    avance_data = {
-        '10-20': avance_query.filter(DenunciaWeb.avance >= 10, DenunciaWeb.avance <= 20).count(),
-        '30-50': avance_query.filter(DenunciaWeb.avance >= 30, DenunciaWeb.avance <= 50).count(),
-        '60-70': avance_query.filter(DenunciaWeb.avance >= 60, DenunciaWeb.avance <= 70).count(),
-        '80-100': avance_query.filter(DenunciaWeb.avance >= 80, DenunciaWeb.avance <= 100).count(),
-        'Vacías': query_filtrada.filter(DenunciaWeb.avance.is_(None)).count()
+    return query
+
+
+def serializar_denuncia_lista(d):
+    """Datos de una denuncia para la lista del drill-down"""
+    return {
+        'id': d.id,
+        'numero_ap': d.numero_ap,
+        'fecha_registro': d.fecha_registro.isoformat() if d.fecha_registro else None,
+        'estado': d.estado_nombre,
+        'actuario': d.nombre_actuario,
+        'avance': d.avance,
+        'departamento': d.departamento,
+        'division': d.division,
+        'tipo_origen': d.tipo_origen
     }
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginación mal formado"""
+
+
+def codificar_cursor(denuncia):
+    """Cursor opaco con la posición (fecha_registro, id) de la última fila de una página"""
+    posicion = json.dumps([denuncia['fecha_registro'], denuncia['id']])
+    return base64.urlsafe_b64encode(posicion.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha_registro, id) del cursor o lanza CursorInvalido"""
+    try:
+        fecha, denuncia_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(fecha), int(denuncia_id)
+    except Exception:
+        raise CursorInvalido('Cursor de paginación inválido')
+
+
+def total_segmento(unidad_id, filtros=None, slice_tipo=None, slice_label=None):
+    """
+    Total de denuncias de un segmento del drill-down tomado de los datos
+    (cacheados) del dashboard, sin un COUNT(*) adicional.
     
-    # 4. Gráficos por Departamento, División y SINAR a Cargo
-    departamentos_data = query_filtrada.with_entities(
-        DenunciaWeb.departamento,
-        db.func.count(DenunciaWeb.id).label('cantidad')
-    ).group_by(DenunciaWeb.departamento).all()
-    departamentos_dict = {d: cant for d, cant in departamentos_data if d}
-
-    divisiones_data = query_filtrada.with_entities(
-        DenunciaWeb.division,
-        db.func.count(DenunciaWeb.id).label('cantidad')
-    ).group_by(DenunciaWeb.division).all()
-    divisiones_dict = {d: cant for d, cant in divisiones_data if d}
-
-    secciones_data = query_filtrada.with_entities(
-        DenunciaWeb.sinar_a_cargo,
-        db.func.count(DenunciaWeb.id).label('cantidad')
-    ).group_by(DenunciaWeb.sinar_a_cargo).all()
-    secciones_dict = {s: cant for s, cant in secciones_data if s}
-    
-    # Opciones para filtros (valores únicos disponibles)
-    # Si hay filtros de departamento, filtrar divisiones por esos departamentos
-    query_opciones = DenunciaWeb.query.filter_by(unidad_id=unidad_id)
-    if filtros and filtros.get('departamentos'):
-        query_opciones = query_opciones.filter(DenunciaWeb.departamento.in_(filtros['departamentos']))
-    if filtros and filtros.get('divisiones'):
-        query_opciones = query_opciones.filter(DenunciaWeb.division.in_(filtros['divisiones']))
-    
-    opciones_filtros = {
-        'tipos': sorted([t[0] for t in db.session.query(DenunciaWeb.tipo_origen).filter_by(unidad_id=unidad_id).distinct().all() if t[0]]),
-        'departamentos': sorted([d[0] for d in db.session.query(DenunciaWeb.departamento).filter_by(unidad_id=unidad_id).distinct().all() if d[0]]),
-        'divisiones': sorted([d[0] for d in query_opciones.with_entities(DenunciaWeb.division).distinct().all() if d[0]]),
-        'secciones': sorted([s[0] for s in query_opciones.with_entities(DenunciaWeb.sinar_a_cargo).distinct().all() if s[0]]),
-        'estados': sorted([e[0] for e in db.session.query(DenunciaWeb.estado_nombre).filter_by(unidad_id=unidad_id).distinct().all() if e[0]]),
-        'actuarios': sorted([a[0] for a in db.session.query(DenunciaWeb.nombre_actuario).filter_by(unidad_id=unidad_id).distinct().all() if a[0]])
-    }
+    Raises:
+        SliceInvalido: si el tipo de slice no está soportado
+    """
+    validar_slice(slice_tipo)
+    datos = obtener_datos_graficos(unidad_id, filtros)
+    if not slice_tipo or not slice_label:
+        return datos['total']
+    return datos[FACETAS_SLICE[slice_tipo]].get(slice_label, 0)
+
+
+def listar_denuncias(unidad_id, filtros=None, slice_tipo=None, slice_label=None, limite=200, cursor=None):
+    """
+    Lista de denuncias para el drill-down desde los gráficos. Respeta los
+    filtros del dashboard y el slice del gráfico.
     
-    # Datos para tarjetas de resumen
-    # Si hay filtros de días, el total debe calcularse de las denuncias filtradas por días
-    if denuncias_filtradas_por_dias is not None:
-        total_denuncias = len(denuncias_filtradas_por_dias)
-    else:
-        total_denuncias = query_filtrada.count()
-    
-    # Calcular días promedio de investigación (desde fecha_registro hasta fecha_elevacion o fecha actual)
-    dias_promedio_query = query_filtrada.filter(
-        DenunciaWeb.fecha_registro.isnot(None)
-    )
-    
-    # Calcular días promedio manualmente
-    total_dias = 0
-    count_dias = 0
-    for denuncia in dias_promedio_query.all():
-        if denuncia.fecha_registro:
-            fecha_fin = denuncia.fecha_elevacion if denuncia.fecha_elevacion else datetime.utcnow()
-            if isinstance(fecha_fin, str):
-                from dateutil import parser
-                fecha_fin = parser.parse(fecha_fin)
-            if isinstance(denuncia.fecha_registro, str):
-                from dateutil import parser
-                fecha_registro = parser.parse(denuncia.fecha_registro)
-            else:
-                fecha_registro = denuncia.fecha_registro
-            
-            delta = fecha_fin - fecha_registro
-            dias = max(0, delta.days)
-            total_dias += dias
-            count_dias += 1
-    
-    dias_promedio = (total_dias / count_dias) if count_dias > 0 else 0
-    
-    # Calcular avance promedio
-    avance_promedio_query = query_filtrada.filter(DenunciaWeb.avance.isnot(None))
-    avance_promedio = avance_promedio_query.with_entities(
-        db.func.avg(DenunciaWeb.avance)
-    ).scalar() or 0
-    
-    # Datos de actuarios
-    actuarios_query = db.session.query(
-        DenunciaWeb.nombre_actuario,
-        db.func.count(DenunciaWeb.id).label('cantidad')
-    ).filter_by(unidad_id=unidad_id)
-    
-    # Aplicar filtros a actuarios
-    if filtros:
-        if filtros.get('tipos'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.tipo_origen.in_(filtros['tipos']))
-        if filtros.get('departamentos'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.departamento.in_(filtros['departamentos']))
-        if filtros.get('divisiones'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.division.in_(filtros['divisiones']))
-        if filtros.get('secciones'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.sinar_a_cargo.in_(filtros['secciones']))
-        if filtros.get('estados'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.estado_nombre.in_(filtros['estados']))
-        if filtros.get('actuarios'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.nombre_actuario.in_(filtros['actuarios']))
-        if filtros.get('fecha_desde'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.fecha_registro >= filtros['fecha_desde'])
-        if filtros.get('fecha_hasta'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.fecha_registro <= filtros['fecha_hasta'])
-        if filtros.get('dias_desde'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.dias_investigacion >= filtros['dias_desde'])
-        if filtros.get('dias_hasta'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.dias_investigacion <= filtros['dias_hasta'])
-        if filtros.get('avance_desde'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.avance >= filtros['avance_desde'])
-        if filtros.get('avance_hasta'):
-            actuarios_query = actuarios_query.filter(DenunciaWeb.avance <= filtros['avance_hasta'])
-    
-    actuarios_data = actuarios_query.filter(DenunciaWeb.nombre_actuario.isnot(None)).group_by(DenunciaWeb.nombre_actuario).all()
-    actuarios_dict = {actuario: cantidad for actuario, cantidad in actuarios_data if actuario}
-    
-    # Resumen simplificado (solo total)
-    resumen = {
-        'total_denuncias': total_denuncias,
-        'dias_promedio': round(float(dias_promedio), 1),
-        'avance_promedio': round(float(avance_promedio), 1)
-    }
+    Pagina por cursor sobre (fecha_registro, id) descendente: cada página
+    cuesta lo mismo sin importar cuántas se hayan recorrido. El total se
+    informa solo en la primera página y sale de los datos del dashboard.
+    Cada página se cachea por unidad, versión de datos, filtros, slice y cursor.
     
-    return {
-        'estados': estados_dict,
-        'dias_investigacion': dias_data,
-        'avance': avance_data,
-        'opciones_filtros': opciones_filtros,
-        'total': total_denuncias,
-        'resumen': resumen,
-        'actuarios': actuarios_dict,
-        'departamentos_chart': departamentos_dict,
-        'divisiones_chart': divisiones_dict,
-        'secciones_chart': secciones_dict
-    }
+    Returns:
+        dict: {'total': int | None, 'registros': [...], 'siguiente': cursor | None}
+    
+    Raises:
+        CursorInvalido: si el cursor no se puede decodificar
+        SliceInvalido: si el tipo de slice no está soportado
+    """
+    validar_slice(slice_tipo)
+    posicion = decodificar_cursor(cursor) if cursor else None
+    carga = carga_publicada(unidad_id)
+    clave = clave_cache(unidad_id, carga, 'lista', canonizar_filtros(filtros),
+                        str(slice_tipo), str(slice_label), str(limite), str(cursor))
+    
+    def calcular():
+        query = aplicar_filtros(consulta_denuncias(unidad_id, carga), filtros)
+        query = aplicar_slice(query, slice_tipo, slice_label)
+        if posicion:
+            fecha, denuncia_id = posicion
+            query = query.filter(or_(
+                DenunciaWeb.fecha_registro < fecha,
+                db.and_(DenunciaWeb.fecha_registro == fecha, DenunciaWeb.id < denuncia_id)
+            ))
+        
+        filas = query.order_by(DenunciaWeb.fecha_registro.desc(), DenunciaWeb.id.desc()).limit(limite + 1).all()
+        registros = [serializar_denuncia_lista(d) for d in filas[:limite]]
+        siguiente = codificar_cursor(registros[-1]) if len(filas) > limite else None
+        
+        total = None if cursor else total_segmento(unidad_id, filtros, slice_tipo, slice_label)
+        return {'total': total, 'registros': registros, 'siguiente': siguiente}
+    
+    return cacheado(clave, calcular)
+
+
+# ==================== EXPORTACIÓN ====================
+
+# Filas leídas por vuelta del cursor del servidor durante la exportación
+TAMANO_LOTE_EXPORTACION = 1000
+
+# Tamaño de los bloques enviados al cliente al transmitir un archivo
+TAMANO_BLOQUE_ENVIO = 64 * 1024
+
+
+def filas_exportacion(unidad_id, filtros=None):
+    """
+    Itera las denuncias filtradas como tuplas en el orden de COLUMNAS_EXCEL,
+    leyendo por lotes con un cursor del lado del servidor (memoria constante).
+    """
+    columnas = [getattr(DenunciaWeb, campo) for campo in COLUMNAS_EXCEL.values()]
+    query = aplicar_filtros(consulta_denuncias(unidad_id), filtros)
+    query = query.with_entities(*columnas).order_by(DenunciaWeb.fecha_registro.desc(), DenunciaWeb.id.desc())
+    return query.yield_per(TAMANO_LOTE_EXPORTACION)
+
 
+def exportar_csv(unidad_id, filtros=None):
+    """
+    Genera el CSV de las denuncias filtradas por bloques de texto, con los
+    mismos encabezados que el Excel de origen (BOM para que Excel lo abra en UTF-8).
+    El BOM y los encabezados se envían de inmediato, antes de consultar las
+    filas, para que la descarga empiece sin esperar al primer bloque.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')
+    escritor.writerow(COLUMNAS_EXCEL.keys())
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    
+    for i, fila in enumerate(filas_exportacion(unidad_id, filtros), start=1):
+        escritor.writerow(['' if valor is None else valor for valor in fila])
+        if i % TAMANO_LOTE_EXPORTACION == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def exportar_xlsx(unidad_id, filtros=None):
+    """
+    Genera el XLSX de las denuncias filtradas con openpyxl en modo
+    write-only (memoria constante) sobre un archivo temporal, y luego lo
+    transmite por bloques. El formato XLSX es un ZIP: no se puede enviar
+    nada hasta terminar de escribirlo.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    
+    descriptor, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descriptor)
+    try:
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet('Denuncias')
+        hoja.append(list(COLUMNAS_EXCEL.keys()))
+        for fila in filas_exportacion(unidad_id, filtros):
+            hoja.append([ILLEGAL_CHARACTERS_RE.sub('', valor) if isinstance(valor, str) else valor for valor in fila])
+        libro.save(ruta)
+        
+        with open(ruta, 'rb') as archivo:
+            while True:
+                bloque = archivo.read(TAMANO_BLOQUE_ENVIO)
+                if not bloque:
+                    break
+                yield bloque
+    finally:
+        _eliminar_archivo(ruta)
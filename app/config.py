@@ -31,6 +31,42 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024))  # 20MB
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'instance/uploads')
     ALLOWED_EXTENSIONS = {'xlsx', 'xlsm', 'csv'}
+    # Subidas por partes (archivos mayores que MAX_CONTENT_LENGTH)
+    DATALAB_SUBIDA_BLOQUE_MB = int(os.environ.get('DATALAB_SUBIDA_BLOQUE_MB', 8))  # Debe ser menor que MAX_CONTENT_LENGTH
+    DATALAB_SUBIDA_MAX_MB = int(os.environ.get('DATALAB_SUBIDA_MAX_MB', 1024))  # Tamaño máximo de un archivo
+    DATALAB_SUBIDA_VIGENCIA_HORAS = int(os.environ.get('DATALAB_SUBIDA_VIGENCIA_HORAS', 24))  # Subidas abandonadas
+    DATALAB_CUOTA_UNIDAD_MB = int(os.environ.get('DATALAB_CUOTA_UNIDAD_MB', 5120))  # Disco por unidad
+    
+    # DataLab: copia Parquet de los datasets
+    DATALAB_EXCEL_FILAS_BLOQUE = int(os.environ.get('DATALAB_EXCEL_FILAS_BLOQUE', 50_000))  # Filas por bloque al leer Excel
+    DATALAB_PARQUET_FILAS_GRUPO = int(os.environ.get('DATALAB_PARQUET_FILAS_GRUPO', 100_000))  # Filas por row group
+    DATALAB_PARQUET_MAX_ABIERTOS = int(os.environ.get('DATALAB_PARQUET_MAX_ABIERTOS', 8))  # Datasets abiertos por proceso (LRU)
+    DATALAB_FILAS_MAX_PAGINA = int(os.environ.get('DATALAB_FILAS_MAX_PAGINA', 1000))  # Filas por página del explorador
+    # DataLab: consola SQL (DuckDB en memoria, una base por consulta)
+    DATALAB_SQL_MAX_FILAS = int(os.environ.get('DATALAB_SQL_MAX_FILAS', 10_000))  # Filas máximas del resultado
+    DATALAB_SQL_TIMEOUT = int(os.environ.get('DATALAB_SQL_TIMEOUT', 30))  # segundos
+    DATALAB_SQL_MEMORIA = os.environ.get('DATALAB_SQL_MEMORIA', '1GB')  # Memoria máxima por consulta
+    DATALAB_SQL_HILOS = int(os.environ.get('DATALAB_SQL_HILOS', 2))  # Hilos por consulta
+    # DataLab: perfil aproximado (sketches) desde esta cantidad de filas
+    DATALAB_PERFIL_APROXIMADO_FILAS = int(os.environ.get('DATALAB_PERFIL_APROXIMADO_FILAS', 1_000_000))
+    # DataLab: histogramas precalculados (regla de numpy o cantidad fija de bins)
+    DATALAB_HISTOGRAMA_BINS = os.environ.get('DATALAB_HISTOGRAMA_BINS', 'auto')
+    DATALAB_HISTOGRAMA_MAX_BINS = int(os.environ.get('DATALAB_HISTOGRAMA_MAX_BINS', 100))
+    # DataLab: puntos máximos por serie temporal (LTTB)
+    DATALAB_SERIE_MAX_PUNTOS = int(os.environ.get('DATALAB_SERIE_MAX_PUNTOS', 500))
+    
+    # Caché de resultados (dashboard de denuncias, etc.)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoria')  # 'memoria' o 'redis'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_MAX_ENTRADAS = int(os.environ.get('CACHE_MAX_ENTRADAS', 512))
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', 24 * 3600))  # segundos
+    
+    # Trabajos en segundo plano (procesamiento de archivos subidos)
+    TRABAJOS_MAX_PROCESOS = int(os.environ.get('TRABAJOS_MAX_PROCESOS', 2))  # Trabajos simultáneos por proceso web
+    TRABAJOS_MEMORIA_MB = int(os.environ.get('TRABAJOS_MEMORIA_MB', 2048))  # Memoria máxima por trabajo (0 = sin tope)
+    TRABAJOS_PROCESOS_POR_TAREA = int(os.environ.get('TRABAJOS_PROCESOS_POR_TAREA', 4))  # Hojas/archivos en paralelo por trabajo
+    TRABAJOS_SINCRONICOS = os.environ.get('TRABAJOS_SINCRONICOS', 'False').lower() == 'true'  # Ejecutar dentro del request
+    TRABAJOS_VENCIMIENTO_MINUTOS = int(os.environ.get('TRABAJOS_VENCIMIENTO_MINUTOS', 10))  # Sin latido tras este tiempo = fallido (0 = nunca)
     
     # Admin por defecto
     DEFAULT_ADMIN_USERNAME = os.environ.get('DEFAULT_ADMIN_USERNAME', 'admin')
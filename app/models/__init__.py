@@ -7,7 +7,9 @@ from app.models.permission import Permission
 from app.models.unidad import Unidad
 from app.models.audit_log import AuditLog
 from app.models.dataset import Dataset
-from app.models.denuncia_web import DenunciaWeb
+from app.models.trabajo import Trabajo
+from app.models.subida import Subida
+from app.models.denuncia_web import DenunciaWeb, DenunciaCarga, DenunciaResumen, DenunciaDimension, DenunciaDependencia
 from app.models.intervencion import Intervencion
 from app.models.persona import Persona
 from app.models.vehiculo import Vehiculo
@@ -31,7 +33,8 @@ from app.models.relaciones import RelacionPersona, OrganizacionCriminal, Persona
 from app.models.operativos import TipoOperativo, OperativoActivo
 
 __all__ = [
-    'User', 'Role', 'Permission', 'Unidad', 'AuditLog', 'Dataset', 'DenunciaWeb',
+    'User', 'Role', 'Permission', 'Unidad', 'AuditLog', 'Dataset', 'Trabajo', 'Subida', 'DenunciaWeb', 'DenunciaCarga', 'DenunciaResumen',
+    'DenunciaDimension', 'DenunciaDependencia',
     'Intervencion', 'Persona', 'Vehiculo', 'Ubicacion',
     'Sexo', 'Nacionalidad', 'EstadoCivil', 'Ocupacion', 'TipoContactoEmergencia',
     'Barrio', 'Comisaria', 'Jerarquia',
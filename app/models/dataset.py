@@ -17,6 +17,9 @@ class Dataset(db.Model):
     source_type = db.Column(db.String(20), nullable=False)  # 'csv', 'xlsx', 'xlsm'
     original_filename = db.Column(db.String(255), nullable=False)
     stored_path = db.Column(db.String(500), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 del archivo original
+    parquet_path = db.Column(db.String(500), nullable=True)  # Directorio de partes Parquet
+    schema_json = db.Column(db.Text, nullable=True)  # Esquema Arrow de la copia Parquet
     rows_count = db.Column(db.Integer, nullable=False)
     columns_count = db.Column(db.Integer, nullable=False)
     preview_json = db.Column(db.Text, nullable=True)  # Primeras 100 filas como JSON
@@ -51,6 +54,15 @@ class Dataset(db.Model):
                 return {}
         return {}
     
+    def get_schema(self):
+        """Obtiene el esquema de la copia Parquet como lista de columnas"""
+        if self.schema_json:
+            try:
+                return json.loads(self.schema_json)
+            except:
+                return []
+        return []
+    
     def set_preview(self, data):
         """Guarda el preview como JSON"""
         self.preview_json = json.dumps(data, default=str, ensure_ascii=False)
@@ -63,6 +75,10 @@ class Dataset(db.Model):
         """Guarda los gráficos como JSON"""
         self.charts_json = json.dumps(data, default=str, ensure_ascii=False)
     
+    def set_schema(self, data):
+        """Guarda el esquema como JSON"""
+        self.schema_json = json.dumps(data, default=str, ensure_ascii=False)
+    
     def __repr__(self):
         return f'<Dataset {self.name}>'
     
@@ -76,6 +92,7 @@ class Dataset(db.Model):
             'original_filename': self.original_filename,
             'rows_count': self.rows_count,
             'columns_count': self.columns_count,
+            'parquet': bool(self.parquet_path),
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -2,18 +2,138 @@
 Modelo de Denuncia Web - Dirección General de Drogas Peligrosas
 """
 from datetime import datetime
+from sqlalchemy import case
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.expression import FunctionElement
 from app.extensions import db
 import json
 
 
+# Rangos de días de investigación del dashboard: (desde, hasta exclusivo, etiqueta)
+RANGOS_DIAS = [
+    (0, 100, '0-100 días'),
+    (100, 200, '100-200 días'),
+    (200, 300, '200-300 días'),
+    (300, None, '+300 días'),
+]
+RANGO_DIAS_SIN_DATOS = 'Sin datos'
+
+
+class dias_entre(FunctionElement):
+    """Días de calendario entre dos fechas: dias_entre(fin, inicio)"""
+    type = db.Integer()
+    name = 'dias_entre'
+    inherit_cache = True
+
+
+@compiles(dias_entre)
+def _dias_entre_mysql(element, compiler, **kw):
+    fin, inicio = list(element.clauses)
+    return f'DATEDIFF({compiler.process(fin, **kw)}, {compiler.process(inicio, **kw)})'
+
+
+@compiles(dias_entre, 'sqlite')
+def _dias_entre_sqlite(element, compiler, **kw):
+    fin, inicio = list(element.clauses)
+    return (f'CAST(julianday(date({compiler.process(fin, **kw)})) - '
+            f'julianday(date({compiler.process(inicio, **kw)})) AS INTEGER)')
+
+
+class utc_ahora(FunctionElement):
+    """Fecha y hora actual en UTC (igual que datetime.utcnow en Python)"""
+    type = db.DateTime()
+    name = 'utc_ahora'
+    inherit_cache = True
+
+
+@compiles(utc_ahora)
+def _utc_ahora_mysql(element, compiler, **kw):
+    return 'UTC_TIMESTAMP()'
+
+
+@compiles(utc_ahora, 'sqlite')
+def _utc_ahora_sqlite(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+class inicio_mes(FunctionElement):
+    """Primer día del mes de una fecha"""
+    type = db.Date()
+    name = 'inicio_mes'
+    inherit_cache = True
+
+
+@compiles(inicio_mes)
+def _inicio_mes_mysql(element, compiler, **kw):
+    fecha, = list(element.clauses)
+    fecha = compiler.process(fecha, **kw)
+    return f'DATE_SUB(DATE({fecha}), INTERVAL DAYOFMONTH({fecha}) - 1 DAY)'
+
+
+@compiles(inicio_mes, 'sqlite')
+def _inicio_mes_sqlite(element, compiler, **kw):
+    fecha, = list(element.clauses)
+    return f"date({compiler.process(fecha, **kw)}, 'start of month')"
+
+
+class DenunciaCarga(db.Model):
+    """
+    Generación (carga completa) de denuncias de una unidad.
+    
+    Las filas de una carga nueva se insertan con estado 'cargando' y no son
+    visibles hasta que se publica; la publicación cambia el estado de la
+    carga nueva y de la anterior en una sola transacción. La carga anterior
+    se conserva para poder revertir.
+    """
+    __tablename__ = 'denuncias_cargas'
+    
+    CARGANDO = 'cargando'
+    PUBLICADA = 'publicada'
+    ANTERIOR = 'anterior'
+    FALLIDA = 'fallida'
+    ELIMINADA = 'eliminada'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='cargando', index=True)
+    filas = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Se incrementa con cada cambio de datos
+    resumen_version = db.Column(db.Integer, nullable=True)  # Versión con la que se calculó el resumen
+    resumen_fecha = db.Column(db.Date, nullable=True)  # Día (UTC) en que se calculó el resumen
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    publicada_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<DenunciaCarga {self.id} {self.estado}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'unidad_id': self.unidad_id,
+            'estado': self.estado,
+            'filas': self.filas,
+            'version': self.version,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'publicada_at': self.publicada_at.isoformat() if self.publicada_at else None
+        }
+
+
 class DenunciaWeb(db.Model):
     """Modelo de denuncia web del sistema"""
     __tablename__ = 'denuncias_web'
+    __table_args__ = (
+        db.Index('ix_denuncias_web_unidad_id_excel', 'unidad_id', 'id_excel'),
+        # Paginación por cursor del drill-down: ORDER BY fecha_registro DESC, id DESC
+        db.Index('ix_denuncias_web_carga_fecha_id', 'unidad_id', 'carga_id', 'fecha_registro', 'id'),
+    )
     
     # Identificación
     id = db.Column(db.Integer, primary_key=True)
     unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    carga_id = db.Column(db.Integer, db.ForeignKey('denuncias_cargas.id'), nullable=True, index=True)  # Generación
     
     # Campos principales del Excel
     id_excel = db.Column(db.String(50), nullable=True, index=True)  # ID del Excel
@@ -92,6 +212,7 @@ class DenunciaWeb(db.Model):
     
     # Campos calculados
     dias_investigacion = db.Column(db.Integer, nullable=True, index=True)  # Calculado
+    hash_fila = db.Column(db.String(16), nullable=True)  # Hash del contenido de la fila (sincronización)
     
     # Metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -122,6 +243,47 @@ class DenunciaWeb(db.Model):
         except Exception as e:
             return None
     
+    @hybrid_property
+    def dias_transcurridos(self):
+        """
+        Días de investigación calculados al momento de la consulta (desde
+        fecha_registro hasta fecha_elevacion o la fecha actual).
+        
+        En SQL se traduce a DATEDIFF(COALESCE(fecha_elevacion, UTC_TIMESTAMP()), fecha_registro),
+        de modo que filtros, rangos y promedios se calculan en la base de datos.
+        """
+        if not self.fecha_registro:
+            return None
+        fecha_fin = self.fecha_elevacion or datetime.utcnow()
+        return max(0, (fecha_fin.date() - self.fecha_registro.date()).days)
+    
+    @dias_transcurridos.expression
+    def dias_transcurridos(cls):
+        dias = dias_entre(db.func.coalesce(cls.fecha_elevacion, utc_ahora()), cls.fecha_registro)
+        return case(
+            (cls.fecha_registro.is_(None), None),
+            (dias < 0, 0),
+            else_=dias
+        )
+    
+    @hybrid_property
+    def rango_dias(self):
+        """Etiqueta del rango de días de investigación (ver RANGOS_DIAS)"""
+        dias = self.dias_transcurridos
+        if dias is None:
+            return RANGO_DIAS_SIN_DATOS
+        for desde, hasta, etiqueta in RANGOS_DIAS:
+            if hasta is None or dias < hasta:
+                return etiqueta
+        return RANGO_DIAS_SIN_DATOS
+    
+    @rango_dias.expression
+    def rango_dias(cls):
+        dias = cls.dias_transcurridos
+        condiciones = [(dias.is_(None), RANGO_DIAS_SIN_DATOS)]
+        condiciones += [(dias < hasta, etiqueta) for desde, hasta, etiqueta in RANGOS_DIAS if hasta is not None]
+        return case(*condiciones, else_=RANGOS_DIAS[-1][2])
+    
     def get_acusados(self):
         """Obtiene todos los acusados como lista"""
         acusados = []
@@ -165,3 +327,87 @@ class DenunciaWeb(db.Model):
             'actuario_id': self.actuario_id
         }
 
+
+
+class DenunciaResumen(db.Model):
+    """
+    Resumen pre-agregado (cubo) de las denuncias de una carga.
+    
+    Una fila por combinación de dimensiones del dashboard y mes de registro,
+    con las mismas medidas sumables que calcula el dashboard. Los rangos de
+    días dependen de la fecha actual, por eso el resumen se recalcula al
+    cambiar los datos y una vez por día.
+    """
+    __tablename__ = 'denuncias_resumen'
+    __table_args__ = (db.Index('ix_denuncias_resumen_unidad_carga', 'unidad_id', 'carga_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False)
+    carga_id = db.Column(db.Integer, db.ForeignKey('denuncias_cargas.id'), nullable=False)
+    
+    # Dimensiones
+    tipo_origen = db.Column(db.String(100), nullable=True)
+    departamento = db.Column(db.String(200), nullable=True)
+    division = db.Column(db.String(200), nullable=True)
+    sinar_a_cargo = db.Column(db.String(200), nullable=True)
+    estado_nombre = db.Column(db.String(200), nullable=True)
+    nombre_actuario = db.Column(db.String(200), nullable=True)
+    mes_registro = db.Column(db.Date, nullable=True)
+    
+    # Medidas (sumables)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    avance_0 = db.Column(db.Integer, nullable=False, default=0)  # 10-20
+    avance_1 = db.Column(db.Integer, nullable=False, default=0)  # 30-50
+    avance_2 = db.Column(db.Integer, nullable=False, default=0)  # 60-70
+    avance_3 = db.Column(db.Integer, nullable=False, default=0)  # 80-100
+    avance_vacias = db.Column(db.Integer, nullable=False, default=0)
+    dias_0 = db.Column(db.Integer, nullable=False, default=0)  # 0-100 días
+    dias_1 = db.Column(db.Integer, nullable=False, default=0)  # 100-200 días
+    dias_2 = db.Column(db.Integer, nullable=False, default=0)  # 200-300 días
+    dias_3 = db.Column(db.Integer, nullable=False, default=0)  # +300 días
+    dias_sin_datos = db.Column(db.Integer, nullable=False, default=0)
+    avance_suma = db.Column(db.Float, nullable=True)
+    avance_cantidad = db.Column(db.Integer, nullable=False, default=0)
+    dias_suma = db.Column(db.BigInteger, nullable=True)
+    dias_cantidad = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DenunciaResumen carga {self.carga_id} ({self.cantidad})>'
+
+
+class DenunciaDimension(db.Model):
+    """
+    Valores distintos de una dimensión de filtro (tipos, estados, actuarios)
+    en una carga. Las opciones de filtros se leen de esta tabla chica en
+    lugar de recorrer denuncias_web.
+    """
+    __tablename__ = 'denuncias_dimensiones'
+    __table_args__ = (db.Index('ix_denuncias_dimensiones_carga', 'carga_id', 'dimension'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False)
+    carga_id = db.Column(db.Integer, db.ForeignKey('denuncias_cargas.id'), nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)
+    valor = db.Column(db.String(200), nullable=False)
+    
+    def __repr__(self):
+        return f'<DenunciaDimension {self.dimension}={self.valor}>'
+
+
+class DenunciaDependencia(db.Model):
+    """
+    Jerarquía departamento -> división -> sección presente en una carga,
+    usada para los selects en cascada del dashboard.
+    """
+    __tablename__ = 'denuncias_dependencias'
+    __table_args__ = (db.Index('ix_denuncias_dependencias_carga', 'carga_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False)
+    carga_id = db.Column(db.Integer, db.ForeignKey('denuncias_cargas.id'), nullable=False)
+    departamento = db.Column(db.String(200), nullable=True)
+    division = db.Column(db.String(200), nullable=True)
+    sinar_a_cargo = db.Column(db.String(200), nullable=True)
+    
+    def __repr__(self):
+        return f'<DenunciaDependencia {self.departamento} / {self.division} / {self.sinar_a_cargo}>'
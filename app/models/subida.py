@@ -0,0 +1,41 @@
+"""
+Modelo de Subida por partes (DataLab)
+"""
+from datetime import datetime
+from app.extensions import db
+
+
+class Subida(db.Model):
+    """
+    Archivo grande que se está subiendo por partes. El contenido recibido
+    se va escribiendo en `ruta`; `recibido` es la posición desde la que se
+    retoma la subida si se corta la conexión. Al usarse en un formulario el
+    archivo se mueve a su ubicación definitiva y la fila se elimina.
+    """
+    __tablename__ = 'subidas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)  # Nombre original
+    tamano = db.Column(db.BigInteger, nullable=False)  # Bytes totales declarados
+    recibido = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes escritos
+    ruta = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @property
+    def completa(self):
+        return self.recibido >= self.tamano
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'tamano': self.tamano,
+            'recibido': self.recibido,
+            'completa': self.completa
+        }
+
+    def __repr__(self):
+        return f'<Subida {self.id} {self.filename} {self.recibido}/{self.tamano}>'
@@ -0,0 +1,83 @@
+"""
+Modelo de Trabajo en segundo plano (DataLab)
+"""
+from datetime import datetime
+from app.extensions import db
+import json
+
+
+class Trabajo(db.Model):
+    """
+    Trabajo pesado (procesamiento de archivos subidos) que se ejecuta en
+    un proceso aparte. La fila registra el estado y el avance para que la
+    página que lo lanzó pueda consultarlo.
+    """
+    __tablename__ = 'trabajos'
+
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADO = 'completado'
+    FALLIDO = 'fallido'
+
+    id = db.Column(db.Integer, primary_key=True)
+    unidad_id = db.Column(db.Integer, db.ForeignKey('unidades.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)  # Nombre de la tarea registrada
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True)
+    progreso = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    etapa = db.Column(db.String(200), nullable=True)
+    parametros_json = db.Column(db.Text, nullable=True)
+    resultado_json = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    iniciado_at = db.Column(db.DateTime, nullable=True)
+    finalizado_at = db.Column(db.DateTime, nullable=True)
+    actualizado_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)  # Latido: ver vencer_trabajos
+
+    @property
+    def terminado(self):
+        return self.estado in (self.COMPLETADO, self.FALLIDO)
+
+    def get_parametros(self):
+        """Obtiene los parámetros como diccionario"""
+        if self.parametros_json:
+            try:
+                return json.loads(self.parametros_json)
+            except:
+                return {}
+        return {}
+
+    def get_resultado(self):
+        """Obtiene el resultado como diccionario"""
+        if self.resultado_json:
+            try:
+                return json.loads(self.resultado_json)
+            except:
+                return {}
+        return {}
+
+    def set_parametros(self, data):
+        """Guarda los parámetros como JSON"""
+        self.parametros_json = json.dumps(data, default=str, ensure_ascii=False)
+
+    def set_resultado(self, data):
+        """Guarda el resultado como JSON"""
+        self.resultado_json = json.dumps(data, default=str, ensure_ascii=False)
+
+    def __repr__(self):
+        return f'<Trabajo {self.id} {self.tipo} {self.estado}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'progreso': self.progreso,
+            'etapa': self.etapa,
+            'resultado': self.get_resultado(),
+            'error': self.error,
+            'terminado': self.terminado,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'iniciado_at': self.iniciado_at.isoformat() if self.iniciado_at else None,
+            'finalizado_at': self.finalizado_at.isoformat() if self.finalizado_at else None
+        }
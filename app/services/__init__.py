@@ -3,7 +3,7 @@ Servicios de la aplicación SIOC
 """
 from app.services.rbac import require_login, require_permission
 from app.services.audit import audit_log
-from app.services.file_storage import save_uploaded_file, get_safe_filename
+from app.services.file_storage import save_uploaded_file, save_content_addressed, get_safe_filename
 from app.services.datalab_profiler import profile_dataset
 from app.services.datalab_charts import generate_charts
 from app.services.utils import normalize_column_name, detect_date_columns
@@ -11,7 +11,7 @@ from app.services.utils import normalize_column_name, detect_date_columns
 __all__ = [
     'require_login', 'require_permission',
     'audit_log',
-    'save_uploaded_file', 'get_safe_filename',
+    'save_uploaded_file', 'save_content_addressed', 'get_safe_filename',
     'profile_dataset', 'generate_charts',
     'normalize_column_name', 'detect_date_columns'
 ]
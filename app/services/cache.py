@@ -0,0 +1,121 @@
+"""
+Servicio de caché de resultados
+
+Backend en memoria del proceso (LRU acotado) por defecto, o Redis si se
+configura CACHE_BACKEND=redis (requiere el paquete `redis`).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class CacheMemoria:
+    """Caché LRU en memoria del proceso, con cantidad máxima de entradas y TTL opcional"""
+
+    def __init__(self, max_entradas=512, ttl=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        expira = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class CacheRedis:
+    """Caché compartida entre procesos en Redis (valores serializados como JSON)"""
+
+    def __init__(self, url, ttl=None, prefijo='sioc:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefijo = prefijo
+
+    def get(self, clave):
+        valor = self._redis.get(self.prefijo + clave)
+        return json.loads(valor) if valor is not None else None
+
+    def set(self, clave, valor):
+        self._redis.set(self.prefijo + clave, json.dumps(valor, default=str, ensure_ascii=False), ex=self.ttl)
+
+    def delete(self, clave):
+        self._redis.delete(self.prefijo + clave)
+
+    def clear(self):
+        for clave in self._redis.scan_iter(self.prefijo + '*'):
+            self._redis.delete(clave)
+
+
+def _crear_cache(config):
+    """Crea el backend de caché según la configuración"""
+    ttl = config.get('CACHE_TTL')
+    if config.get('CACHE_BACKEND') == 'redis':
+        try:
+            return CacheRedis(config['CACHE_REDIS_URL'], ttl=ttl)
+        except ImportError:
+            print("Paquete 'redis' no instalado: se usa caché en memoria")
+    return CacheMemoria(max_entradas=config.get('CACHE_MAX_ENTRADAS', 512), ttl=ttl)
+
+
+def get_cache():
+    """Obtiene la caché de la aplicación actual (se crea al primer uso)"""
+    cache = current_app.extensions.get('sioc_cache')
+    if cache is None:
+        cache = _crear_cache(current_app.config)
+        current_app.extensions['sioc_cache'] = cache
+    return cache
+
+
+def cache_compartida():
+    """True si la caché es compartida entre procesos (Redis), False si es la memoria de este proceso"""
+    return not isinstance(get_cache(), CacheMemoria)
+
+
+def cacheado(clave, calcular):
+    """
+    Devuelve el valor cacheado para `clave` o lo calcula con `calcular()`
+    y lo guarda. Si la caché falla, se calcula sin cachear.
+    """
+    cache = get_cache()
+    try:
+        valor = cache.get(clave)
+    except Exception as e:
+        print(f"Error al leer la caché: {e}")
+        return calcular()
+
+    if valor is not None:
+        return valor
+
+    valor = calcular()
+    try:
+        cache.set(clave, valor)
+    except Exception as e:
+        print(f"Error al escribir la caché: {e}")
+    return valor
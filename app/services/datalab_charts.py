@@ -1,15 +1,401 @@
 """
 Servicio de generación de gráficos para DataLab
+
+Los gráficos de un dataset se pueden extender al agregarle filas sin
+recorrer las anteriores (ver merge_charts): las barras salen del perfil
+combinado, los histogramas suman los conteos de las filas nuevas en sus
+bins (ampliando el rango y agrupando bins de a pares si hace falta) y las
+series temporales se recalculan desde sumas y cantidades por día.
 """
 import pandas as pd
 import numpy as np
+from flask import current_app
 from app.services.utils import detect_date_columns
 
 
+# Reglas para calcular la cantidad de bins (las mismas fórmulas que numpy)
+REGLAS_BINS = {'auto', 'fd', 'scott', 'rice', 'sturges', 'sqrt'}
+
+
+def _cantidad_bins(valores, regla):
+    """
+    Cantidad de bins según la regla, calculada a partir del ancho sin
+    materializar los bordes (con outliers, numpy puede pedir millones).
+    """
+    n = len(valores)
+    rango = float(valores.max() - valores.min())
+    if isinstance(regla, int):
+        return regla
+    if rango == 0:
+        return 1
+    if regla == 'sturges':
+        return int(np.ceil(np.log2(n))) + 1
+    if regla == 'sqrt':
+        return int(np.ceil(np.sqrt(n)))
+    if regla == 'rice':
+        return int(np.ceil(2 * n ** (1 / 3)))
+
+    ancho_sturges = rango / (np.log2(n) + 1)
+    if regla == 'scott':
+        ancho = (24 * np.pi ** 0.5 / n) ** (1 / 3) * float(np.std(valores))
+    else:
+        q75, q25 = np.percentile(valores, [75, 25])
+        ancho = 2 * float(q75 - q25) * n ** (-1 / 3)
+        if regla == 'auto':
+            ancho = min(ancho, ancho_sturges) if ancho > 0 else ancho_sturges
+    if ancho <= 0:
+        ancho = ancho_sturges
+    return max(int(np.ceil(rango / ancho)), 1)
+
+
+def histogram_bins(valores, bins='auto', max_bins=100):
+    """
+    Histograma precalculado de una serie numérica: bordes y conteos de
+    cada bin, para no guardar ni enviar los valores crudos.
+    
+    Args:
+        valores: Serie numérica (se ignoran nulos e infinitos)
+        bins: regla ('auto', 'fd', 'sturges', ...) o cantidad de bins
+        max_bins: tope de bins si la regla produce demasiados (p. ej. con outliers)
+    
+    Returns:
+        dict: {'edges': [...], 'counts': [...]} o None si no hay valores
+    """
+    valores = pd.to_numeric(valores, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    valores = valores[np.isfinite(valores)]
+    if len(valores) == 0:
+        return None
+    
+    cantidad = min(_cantidad_bins(valores, bins), max_bins)
+    minimo, maximo = float(valores.min()), float(valores.max())
+    if np.all(valores == np.round(valores)) and maximo - minimo + 1 <= cantidad:
+        # Enteros con pocos valores: un bin por valor, centrado
+        edges = np.arange(minimo - 0.5, maximo + 1.5)
+    else:
+        edges = cantidad
+    counts, edges = np.histogram(valores, bins=edges)
+    return {
+        'edges': [float(e) for e in edges],
+        'counts': [int(c) for c in counts]
+    }
+
+
+def merge_histogram(histograma, valores, max_bins=100):
+    """
+    Suma valores nuevos a un histograma de bins de igual ancho: el rango se
+    amplía con bins del mismo ancho y, si se pasa de `max_bins`, los bins
+    se agrupan de a pares (ancho doble) hasta que entran.
+    
+    Returns:
+        dict: {'edges': [...], 'counts': [...]} (el mismo si no hay valores)
+    """
+    valores = pd.to_numeric(valores, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    valores = valores[np.isfinite(valores)]
+    if len(valores) == 0:
+        return histograma
+    
+    edges = np.asarray(histograma['edges'], dtype=float)
+    counts = np.asarray(histograma['counts'], dtype=np.int64)
+    ancho = edges[1] - edges[0] if len(edges) > 1 and edges[1] > edges[0] else 1.0
+    minimo, maximo = float(valores.min()), float(valores.max())
+    while True:
+        izquierda = max(int(np.ceil((edges[0] - minimo) / ancho)), 0)
+        derecha = max(int(np.ceil((maximo - edges[-1]) / ancho)), 0)
+        if len(counts) + izquierda + derecha <= max(max_bins, 1):
+            break
+        if len(counts) % 2:
+            counts = np.append(counts, 0)
+            edges = np.append(edges, edges[-1] + ancho)
+        counts = counts.reshape(-1, 2).sum(axis=1)
+        edges = edges[::2]
+        ancho *= 2
+    
+    inicio = edges[0] - izquierda * ancho
+    edges = inicio + ancho * np.arange(len(counts) + izquierda + derecha + 1)
+    # Redondeo: el último valor siempre dentro del último bin
+    edges[-1] = max(edges[-1], maximo)
+    edges[0] = min(edges[0], minimo)
+    counts = np.concatenate([np.zeros(izquierda, np.int64), counts, np.zeros(derecha, np.int64)])
+    counts += np.histogram(valores, bins=edges)[0]
+    return {
+        'edges': [float(e) for e in edges],
+        'counts': [int(c) for c in counts]
+    }
+
+
+# Resoluciones de las series temporales, de la más fina a la más gruesa:
+# código -> (unidad de numpy, días por punto)
+RESOLUCIONES = {
+    'H': ('h', 1 / 24),
+    'D': ('D', 1),
+    'W': ('W', 7),
+    'M': ('M', 30.44),
+}
+
+
+def elegir_resolucion(desde, hasta, max_puntos=500, minima='D'):
+    """
+    Resolución más fina (desde `minima`) con la que el rango de fechas
+    entra en `max_puntos` puntos; si ninguna alcanza, la más gruesa.
+    """
+    dias = (hasta - desde) / pd.Timedelta(days=1) + 1
+    codigos = list(RESOLUCIONES)
+    for codigo in codigos[codigos.index(minima):]:
+        if dias / RESOLUCIONES[codigo][1] <= max_puntos:
+            return codigo
+    return codigos[-1]
+
+
+def _truncar_fechas(fechas, resolucion):
+    """Inicio del período (hora, día, semana desde el lunes o mes) de cada fecha"""
+    valores = fechas.to_numpy(dtype='datetime64[ns]')
+    if resolucion == 'W':
+        # El 1970-01-01 (día 0 de numpy) fue jueves: se corre 3 días para empezar en lunes
+        dias = valores.astype('datetime64[D]').astype(np.int64)
+        inicio = (dias + 3) // 7 * 7 - 3
+        inicio = np.where(np.isnat(valores), np.iinfo(np.int64).min, inicio)
+        return inicio.astype('datetime64[D]')
+    return valores.astype(f'datetime64[{RESOLUCIONES[resolucion][0]}]')
+
+
+def lttb(x, y, umbral):
+    """
+    Largest-Triangle-Three-Buckets: elige `umbral` puntos que conservan la
+    forma de la serie (picos y valles), en lugar de promediarlos.
+    
+    Returns:
+        np.ndarray: índices de los puntos elegidos, en orden
+    """
+    n = len(x)
+    if umbral >= n or umbral < 3:
+        return np.arange(n)
+    
+    indices = np.empty(umbral, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    paso = (n - 2) / (umbral - 2)
+    elegido = 0
+    for i in range(umbral - 2):
+        inicio = int(i * paso) + 1
+        fin = int((i + 1) * paso) + 1
+        # Promedio del bucket siguiente (el último es el punto final)
+        siguiente_fin = min(int((i + 2) * paso) + 1, n)
+        x_medio = x[fin:siguiente_fin].mean()
+        y_medio = y[fin:siguiente_fin].mean()
+        # Punto del bucket que forma el triángulo de mayor área
+        areas = np.abs(
+            (x[elegido] - x_medio) * (y[inicio:fin] - y[elegido])
+            - (x[elegido] - x[inicio:fin]) * (y_medio - y[elegido])
+        )
+        elegido = inicio + int(np.argmax(areas))
+        indices[i + 1] = elegido
+    return indices
+
+
+def time_series(fechas, valores, resolucion=None, max_puntos=500, desde=None, hasta=None, minima='D'):
+    """
+    Serie temporal del promedio de `valores` por período de `fechas`,
+    trabajando solo sobre las dos columnas (sin copiar el DataFrame).
+    La resolución se elige según el rango si no se indica, y la serie se
+    reduce con LTTB a `max_puntos` como máximo.
+    
+    Args:
+        fechas, valores: Series del mismo largo
+        resolucion: 'H', 'D', 'W' o 'M' (None = automática)
+        desde, hasta: rango opcional de fechas (inclusive)
+        minima: resolución más fina que se elige automáticamente
+    
+    Returns:
+        dict: {'x', 'y', 'resolution', 'points_total'}
+    """
+    fechas = pd.to_datetime(fechas, errors='coerce')
+    valores = pd.to_numeric(valores, errors='coerce')
+    if desde is not None or hasta is not None:
+        en_rango = fechas.notna()
+        if desde is not None:
+            en_rango &= fechas >= desde
+        if hasta is not None:
+            en_rango &= fechas <= hasta
+        fechas, valores = fechas[en_rango], valores[en_rango]
+    
+    vacia = {'x': [], 'y': [], 'resolution': resolucion or minima, 'points_total': 0}
+    if fechas.notna().sum() == 0:
+        return vacia
+    
+    if resolucion not in RESOLUCIONES:
+        resolucion = elegir_resolucion(fechas.min(), fechas.max(), max_puntos, minima)
+    
+    agrupada = valores.groupby(_truncar_fechas(fechas, resolucion)).mean().dropna()
+    if agrupada.empty:
+        return dict(vacia, resolution=resolucion)
+    return _serie_reducida(agrupada, resolucion, max_puntos)
+
+
+def _serie_reducida(agrupada, resolucion, max_puntos):
+    """Serie ya agrupada por período, reducida con LTTB y con las fechas como texto"""
+    x = agrupada.index.to_numpy(dtype='datetime64[ns]')
+    y = agrupada.to_numpy(dtype=float)
+    elegidos = lttb(x.astype(np.int64).astype(float), y, max_puntos)
+    formato = '%Y-%m-%d %H:%M' if resolucion == 'H' else '%Y-%m-%d'
+    return {
+        'x': list(pd.DatetimeIndex(x[elegidos]).strftime(formato)),
+        'y': [float(v) for v in y[elegidos]],
+        'resolution': resolucion,
+        'points_total': len(agrupada)
+    }
+
+
+def series_state(fechas, valores):
+    """
+    Estado combinable de una serie temporal: suma y cantidad de valores por
+    día, y el rango de fechas (en ns) que define la resolución.
+    
+    Returns:
+        dict: {'desde', 'hasta', 'dias', 'sumas', 'cantidades'} (desde y
+        hasta son None si no hay fechas)
+    """
+    fechas = pd.to_datetime(fechas, errors='coerce')
+    valores = pd.to_numeric(valores, errors='coerce')
+    con_fecha = fechas.notna()
+    if not con_fecha.any():
+        return {'desde': None, 'hasta': None, 'dias': [], 'sumas': [], 'cantidades': []}
+    
+    validos = con_fecha & valores.notna()
+    dias = fechas[validos].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    agrupados = pd.Series(valores[validos].to_numpy(dtype=float)).groupby(dias).agg(['sum', 'count'])
+    return {
+        'desde': int(fechas.min().value),
+        'hasta': int(fechas.max().value),
+        'dias': [int(d) for d in agrupados.index],
+        'sumas': [float(v) for v in agrupados['sum']],
+        'cantidades': [int(v) for v in agrupados['count']]
+    }
+
+
+def merge_series_state(estado, otro):
+    """Combina dos estados de series_state (del mismo par de columnas)"""
+    if estado['desde'] is None:
+        return otro
+    if otro['desde'] is None:
+        return estado
+    sumas = pd.Series(estado['sumas'], index=estado['dias'], dtype=float) \
+        .add(pd.Series(otro['sumas'], index=otro['dias'], dtype=float), fill_value=0)
+    cantidades = pd.Series(estado['cantidades'], index=estado['dias'], dtype=np.int64) \
+        .add(pd.Series(otro['cantidades'], index=otro['dias'], dtype=np.int64), fill_value=0)
+    return {
+        'desde': min(estado['desde'], otro['desde']),
+        'hasta': max(estado['hasta'], otro['hasta']),
+        'dias': [int(d) for d in sumas.index],
+        'sumas': [float(v) for v in sumas],
+        'cantidades': [int(v) for v in cantidades]
+    }
+
+
+def series_from_state(estado, max_puntos=500):
+    """
+    Serie temporal (como time_series con resolución automática desde 'D')
+    a partir de un estado de series_state, sin leer las filas.
+    """
+    if estado['desde'] is None:
+        return {'x': [], 'y': [], 'resolution': 'D', 'points_total': 0}
+    resolucion = elegir_resolucion(pd.Timestamp(estado['desde']), pd.Timestamp(estado['hasta']), max_puntos)
+    if not estado['dias']:
+        return {'x': [], 'y': [], 'resolution': resolucion, 'points_total': 0}
+    
+    dias = pd.Series(np.asarray(estado['dias'], dtype='datetime64[D]').astype('datetime64[ns]'))
+    periodos = _truncar_fechas(dias, resolucion)
+    sumas = pd.Series(estado['sumas'], dtype=float).groupby(periodos).sum()
+    cantidades = pd.Series(estado['cantidades'], dtype=np.int64).groupby(periodos).sum()
+    return _serie_reducida(sumas / cantidades, resolucion, max_puntos)
+
+
+def _regla_bins():
+    """Regla de bins configurada (DATALAB_HISTOGRAMA_BINS): nombre de regla o entero"""
+    regla = str(current_app.config.get('DATALAB_HISTOGRAMA_BINS', 'auto')).strip().lower()
+    if regla.isdigit() and int(regla) > 0:
+        return int(regla)
+    return regla if regla in REGLAS_BINS else 'auto'
+
+
+def _grafico_barras(col, top_values):
+    return {
+        'type': 'bar',
+        'title': f'Top valores: {col}',
+        'data': {
+            'x': list(top_values.keys()),
+            'y': list(top_values.values())
+        },
+        'xaxis': col,
+        'yaxis': 'Cantidad'
+    }
+
+
+def _grafico_histograma(col, histograma):
+    return {
+        'type': 'histogram',
+        'title': f'Distribución: {col}',
+        'data': histograma,
+        'xaxis': col,
+        'yaxis': 'Frecuencia'
+    }
+
+
+def _grafico_linea(date_col, num_col, serie):
+    return {
+        'type': 'line',
+        'title': f'Tendencia temporal: {num_col}',
+        'data': serie,
+        'xaxis': date_col,
+        'yaxis': num_col,
+        'drill': {'fecha': date_col, 'valor': num_col}
+    }
+
+
+def _columnas_barras(df, profile):
+    """Columnas con pocos valores distintos (a lo sumo 20) y sus valores más frecuentes"""
+    for col in df.columns:
+        col_profile = profile['columns'].get(col, {})
+        
+        # Si es categórica o tiene pocos valores únicos
+        if col_profile.get('unique_count', 0) <= 20 and col_profile.get('unique_count', 0) > 0:
+            top_values = col_profile.get('top_values', {})
+            if top_values:
+                yield col, top_values
+
+
+def _columnas_histograma(df, date_columns):
+    """Columnas numéricas que no son fechas ni booleanas"""
+    return [
+        col for col in df.columns
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        and col not in date_columns
+    ]
+
+
+def time_series_columns(df, date_columns=None):
+    """
+    Pares (fecha, valor) de las series temporales automáticas: cada
+    columna de fechas con la primera columna numérica.
+    """
+    if date_columns is None:
+        date_columns = detect_date_columns(df)
+    pares = []
+    for date_col in date_columns:
+        # Buscar columnas numéricas para graficar
+        numeric_cols = [c for c in df.columns
+                        if pd.api.types.is_numeric_dtype(df[c]) and c != date_col]
+        if numeric_cols:
+            # Tomar la primera numérica
+            pares.append((date_col, numeric_cols[0]))
+    return pares
+
+
 def generate_charts(df, profile):
     """
     Genera especificaciones de gráficos automáticos basados en el dataset.
     
+    Los histogramas se guardan ya agrupados (bordes y conteos), de modo que
+    el tamaño de los gráficos no depende de la cantidad de filas.
+    
     Args:
         df: DataFrame de pandas
         profile: Perfil del dataset generado por profile_dataset
@@ -24,78 +410,97 @@ def generate_charts(df, profile):
     date_columns = detect_date_columns(df)
     
     # 1. Gráficos de barras para categóricas (top 10)
-    for col in df.columns:
-        col_profile = profile['columns'].get(col, {})
-        
-        # Si es categórica o tiene pocos valores únicos
-        if col_profile.get('unique_count', 0) <= 20 and col_profile.get('unique_count', 0) > 0:
-            top_values = col_profile.get('top_values', {})
-            if top_values:
-                charts[f'chart_{chart_id}'] = {
-                    'type': 'bar',
-                    'title': f'Top valores: {col}',
-                    'data': {
-                        'x': list(top_values.keys()),
-                        'y': list(top_values.values())
-                    },
-                    'xaxis': col,
-                    'yaxis': 'Cantidad'
-                }
-                chart_id += 1
+    for col, top_values in _columnas_barras(df, profile):
+        charts[f'chart_{chart_id}'] = _grafico_barras(col, top_values)
+        chart_id += 1
     
     # 2. Histogramas para numéricas
-    for col in df.columns:
-        col_data = df[col]
-        if pd.api.types.is_numeric_dtype(col_data) and col not in date_columns:
-            # Crear bins para histograma
-            try:
-                hist, bins = np.histogram(col_data.dropna(), bins=20)
-                charts[f'chart_{chart_id}'] = {
-                    'type': 'histogram',
-                    'title': f'Distribución: {col}',
-                    'data': {
-                        'x': col_data.dropna().tolist(),
-                        'bins': 20
-                    },
-                    'xaxis': col,
-                    'yaxis': 'Frecuencia'
-                }
-                chart_id += 1
-            except:
-                pass
-    
-    # 3. Gráficos de línea temporal (fecha + numérica)
-    for date_col in date_columns:
+    regla_bins = _regla_bins()
+    max_bins = current_app.config.get('DATALAB_HISTOGRAMA_MAX_BINS', 100)
+    for col in _columnas_histograma(df, date_columns):
+        # Bins calculados en el servidor
         try:
-            df_date = df.copy()
-            df_date[date_col] = pd.to_datetime(df_date[date_col], errors='coerce')
-            
-            # Buscar columnas numéricas para graficar
-            numeric_cols = [c for c in df.columns 
-                          if pd.api.types.is_numeric_dtype(df[c]) and c != date_col]
-            
-            if numeric_cols:
-                # Tomar la primera numérica
-                num_col = numeric_cols[0]
-                
-                # Agrupar por fecha y sumar/promediar
-                df_grouped = df_date.groupby(df_date[date_col].dt.date)[num_col].mean().reset_index()
-                df_grouped = df_grouped.sort_values(date_col)
-                
-                charts[f'chart_{chart_id}'] = {
-                    'type': 'line',
-                    'title': f'Tendencia temporal: {num_col}',
-                    'data': {
-                        'x': [str(d) for d in df_grouped[date_col].tolist()],
-                        'y': df_grouped[num_col].tolist()
-                    },
-                    'xaxis': date_col,
-                    'yaxis': num_col
-                }
-                chart_id += 1
+            histograma = histogram_bins(df[col], regla_bins, max_bins)
+            if histograma is None:
+                continue
+            charts[f'chart_{chart_id}'] = _grafico_histograma(col, histograma)
+            chart_id += 1
+        except Exception as e:
+            print(f"Error generando histograma de {col}: {e}")
+    
+    # 3. Gráficos de línea temporal (fecha + numérica), sin copiar el frame
+    max_puntos = current_app.config.get('DATALAB_SERIE_MAX_PUNTOS', 500)
+    for date_col, num_col in time_series_columns(df, date_columns):
+        try:
+            serie = time_series(df[date_col], df[num_col], max_puntos=max_puntos)
+            if not serie['x']:
+                continue
+            charts[f'chart_{chart_id}'] = _grafico_linea(date_col, num_col, serie)
+            chart_id += 1
         except Exception as e:
             print(f"Error generando gráfico temporal: {e}")
-            pass
     
     return charts
 
+
+def merge_charts(charts, profile, df, series):
+    """
+    Gráficos de un dataset después de agregarle las filas de `df`, sin
+    leer las filas anteriores: mismos gráficos y en el mismo orden que
+    generate_charts.
+    
+    Args:
+        charts: gráficos guardados del dataset
+        profile: perfil combinado (todas las filas)
+        df: filas agregadas, con los tipos del dataset
+        series: {(fecha, valor): estado combinado (series_state)} de los
+            pares de time_series_columns(df)
+    
+    Returns:
+        dict: Diccionario con especificaciones de gráficos para Plotly
+    """
+    nuevos = {}
+    
+    def agregar(grafico):
+        nuevos[f'chart_{len(nuevos) + 1}'] = grafico
+    
+    date_columns = detect_date_columns(df)
+    
+    # 1. Barras: del perfil combinado
+    for col, top_values in _columnas_barras(df, profile):
+        agregar(_grafico_barras(col, top_values))
+    
+    # 2. Histogramas: los conteos nuevos se suman a los bins guardados
+    anteriores = {
+        grafico['xaxis']: grafico['data'] for grafico in charts.values() if grafico.get('type') == 'histogram'
+    }
+    regla_bins = _regla_bins()
+    max_bins = current_app.config.get('DATALAB_HISTOGRAMA_MAX_BINS', 100)
+    for col in _columnas_histograma(df, date_columns):
+        try:
+            anterior = anteriores.get(col)
+            if anterior and 'edges' in anterior:
+                histograma = merge_histogram(anterior, df[col], max_bins)
+            elif anterior:
+                # Datasets anteriores: valores crudos
+                valores = pd.concat([pd.Series(anterior['x'], dtype=float), pd.to_numeric(df[col])])
+                histograma = histogram_bins(valores, regla_bins, max_bins)
+            else:
+                histograma = histogram_bins(df[col], regla_bins, max_bins)
+            if histograma is None:
+                continue
+            agregar(_grafico_histograma(col, histograma))
+        except Exception as e:
+            print(f"Error generando histograma de {col}: {e}")
+    
+    # 3. Líneas: desde los estados combinados de cada serie
+    max_puntos = current_app.config.get('DATALAB_SERIE_MAX_PUNTOS', 500)
+    for date_col, num_col in time_series_columns(df, date_columns):
+        estado = series.get((date_col, num_col))
+        if estado is None:
+            continue
+        serie = series_from_state(estado, max_puntos)
+        if serie['x']:
+            agregar(_grafico_linea(date_col, num_col, serie))
+    
+    return nuevos
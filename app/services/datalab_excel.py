@@ -0,0 +1,175 @@
+"""
+Lectura de Excel por bloques
+
+pd.read_excel carga el modelo completo de openpyxl (todas las celdas como
+objetos) antes de armar el DataFrame, con un pico de memoria de 10 a 20
+veces el tamaño del archivo. Acá la hoja se recorre en modo read_only,
+fila por fila, y se arman DataFrames tipados de a `chunk_rows` filas,
+conservando solo las columnas pedidas. Los tipos se infieren igual que
+con read_excel (enteros, decimales, fechas, texto) y se mantienen entre
+bloques: cada columna conserva el tipo del primer bloque en que tuvo valores.
+"""
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# Filas por bloque al leer una hoja
+FILAS_BLOQUE = 50_000
+
+
+def _encabezados(fila):
+    """Nombres de columna como los arma read_excel (sin nombre -> 'Unnamed: i', repetidos -> 'x.1')"""
+    nombres = []
+    vistos = {}
+    for i, valor in enumerate(fila):
+        nombre = f'Unnamed: {i}' if valor is None or valor == '' else str(valor)
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f'{nombre}.{vistos[nombre]}'
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+def _seleccion(nombres, usecols):
+    """Posiciones de las columnas a conservar según usecols (lista de nombres o función)"""
+    if usecols is None:
+        return list(range(len(nombres)))
+    if callable(usecols):
+        return [i for i, nombre in enumerate(nombres) if usecols(nombre)]
+    pedidas = set(usecols)
+    return [i for i, nombre in enumerate(nombres) if nombre in pedidas]
+
+
+def sheet_names(path):
+    """Nombres de las hojas de datos del libro, en orden (sin hojas de gráficos)"""
+    libro = load_workbook(path, read_only=True)
+    try:
+        return [hoja.title for hoja in libro.worksheets]
+    finally:
+        libro.close()
+
+
+def iter_excel_chunks(path, usecols=None, chunk_rows=FILAS_BLOQUE, sheet=0, skip_blank_rows=True):
+    """
+    Recorre la hoja en bloques de DataFrames.
+
+    Args:
+        path: archivo .xlsx / .xlsm
+        usecols: columnas a conservar (lista de nombres o función nombre -> bool)
+        chunk_rows: filas por bloque
+        sheet: índice o nombre de la hoja
+        skip_blank_rows: omitir las filas vacías; si es False se conservan
+            como filas nulas, salvo las del final de la hoja (como read_excel)
+
+    Yields:
+        DataFrame: bloque cuyo índice es el número de fila en la hoja (el
+        encabezado es la fila 1; las filas omitidas no corren la
+        numeración). Cada columna tiene el mismo dtype en todos los bloques
+        (ver _tipos_estables). Una hoja sin filas de datos produce un único
+        bloque vacío con las columnas.
+    """
+    libro = load_workbook(path, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[sheet] if isinstance(sheet, int) else libro[sheet]
+        # Algunos generadores escriben mal las dimensiones de la hoja
+        hoja.reset_dimensions()
+        filas = hoja.iter_rows(values_only=True)
+
+        encabezado = next(filas, None)
+        if encabezado is None:
+            yield pd.DataFrame()
+            return
+        nombres = _encabezados(encabezado)
+        posiciones = _seleccion(nombres, usecols)
+        columnas = [nombres[i] for i in posiciones]
+        ancho = len(nombres)
+
+        tipos = {}
+        bloque = []
+        numeros = []
+        vacias = []  # Filas vacías pendientes: se agregan solo si después hay datos
+        vacia = (None,) * len(posiciones)
+        emitido = False
+        for numero, fila in enumerate(filas, start=2):
+            if all(valor is None for valor in fila):
+                if not skip_blank_rows:
+                    vacias.append(numero)
+                continue
+            if len(fila) < ancho:
+                fila = fila + (None,) * (ancho - len(fila))
+            pendientes = [(numero_vacia, vacia) for numero_vacia in vacias]
+            pendientes.append((numero, tuple(fila[i] for i in posiciones)))
+            vacias = []
+            for numero_fila, valores in pendientes:
+                bloque.append(valores)
+                numeros.append(numero_fila)
+                if len(bloque) == chunk_rows:
+                    yield _dataframe(bloque, columnas, numeros, tipos)
+                    bloque = []
+                    numeros = []
+                    emitido = True
+        if bloque or not emitido:
+            yield _dataframe(bloque, columnas, numeros, tipos)
+    finally:
+        libro.close()
+
+
+def _dataframe(filas, columnas, numeros, tipos):
+    """Bloque tipado a partir de las tuplas de valores y sus números de fila"""
+    df = pd.DataFrame(filas, columns=columnas, index=pd.Index(numeros, dtype='int64'), dtype=object)
+    return _tipos_estables(df, tipos)
+
+
+def _tipos_estables(df, tipos):
+    """
+    Tipa las columnas del bloque (llegan como object) con el dtype que
+    tuvieron en el primer bloque con valores, registrado en `tipos`.
+
+    Inferir cada bloque por separado haría que una celda vacía convierta
+    una columna de enteros a float64 solo en ese bloque. Los enteros de un
+    bloque se pasan a float si la columna es float; si los valores no
+    entran en el dtype registrado (por ejemplo, nulos en una columna de
+    enteros), la columna del bloque queda como object con los valores de
+    las celdas.
+    """
+    for columna in df.columns:
+        serie = df[columna]
+        tipo = tipos.get(columna)
+        if not serie.notna().any():
+            # Sin valores: nulos del dtype registrado si admite nulos
+            if tipo is not None and tipo.kind in 'fM':
+                df[columna] = serie.astype(tipo)
+            continue
+
+        inferida = serie.infer_objects()
+        if tipo is None:
+            tipos[columna] = inferida.dtype
+        elif inferida.dtype != tipo:
+            if tipo.kind == 'f' and inferida.dtype.kind in 'iu':
+                inferida = inferida.astype(tipo)
+            else:
+                continue
+        df[columna] = inferida
+    return df
+
+
+def read_excel_chunked(path, usecols=None, chunk_rows=FILAS_BLOQUE, sheet=0):
+    """
+    Hoja completa leída por bloques: mismo resultado que
+    pd.read_excel(path, sheet_name=sheet, usecols=usecols), sin el pico de
+    memoria del modelo de openpyxl.
+    """
+    bloques = list(iter_excel_chunks(path, usecols=usecols, chunk_rows=chunk_rows, sheet=sheet,
+                                     skip_blank_rows=False))
+    if len(bloques) == 1:
+        df = bloques[0]
+    else:
+        df = pd.concat(bloques, copy=False)
+        del bloques
+        # Un bloque que no entró en el dtype de la columna la deja como object: se infiere una vez
+        df = df.infer_objects()
+    # Índice posicional, como read_excel
+    df.index = pd.RangeIndex(len(df))
+    return df
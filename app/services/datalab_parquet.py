@@ -0,0 +1,398 @@
+"""
+Servicio de almacenamiento columnar (Parquet) para DataLab
+
+Cada dataset guarda, además del archivo original, una copia tipada y
+comprimida del DataFrame normalizado en un directorio de partes Parquet
+(part-00000.parquet, part-00001.parquet, ...). Los análisis posteriores
+leen solo las columnas que necesitan, con memory-map, sin volver a abrir
+el Excel.
+
+Agregar filas a un dataset escribe solo una parte nueva. Si las filas
+nuevas necesitan un tipo más amplio (int8 -> int16, float32 -> double) la
+parte nueva se escribe con ese tipo y las anteriores no se reescriben: los
+lectores unifican los esquemas de las partes (promoción permisiva de
+Arrow) y toman los metadatos de pandas de la última parte, la más amplia.
+"""
+import os
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+from flask import current_app
+
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Tipos inferidos de columnas object que Arrow no puede convertir directamente
+TIPOS_MIXTOS = {'mixed', 'mixed-integer'}
+
+# Resultados de filtro/orden que se recuerdan por dataset abierto
+ORDENES_POR_DATASET = 4
+
+
+class EsquemaIncompatible(ValueError):
+    """Las filas nuevas no tienen las columnas o los tipos del dataset; el mensaje se muestra al usuario"""
+
+
+def parquet_dir_for(stored_path):
+    """Directorio de partes Parquet de un dataset (junto al archivo original)"""
+    return os.path.splitext(stored_path)[0] + '_parquet'
+
+
+def part_path(directory, part):
+    """Ruta de una parte del directorio Parquet"""
+    return os.path.join(directory, f'part-{part:05d}.parquet')
+
+
+def sidecar_path(directory, nombre):
+    """
+    Archivo auxiliar de un dataset con la misma base que su directorio
+    Parquet (X_parquet -> X_nombre.json); los sketches son
+    sidecar_path(directorio, 'sketches').
+    """
+    base = directory[:-len('_parquet')] if directory.endswith('_parquet') else directory
+    return f'{base}_{nombre}.json'
+
+
+def list_parts(directory):
+    """Partes existentes del directorio, en orden"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, nombre) for nombre in os.listdir(directory)
+        if nombre.startswith('part-') and nombre.endswith('.parquet')
+    )
+
+
+def remove_parquet(directory):
+    """Elimina el directorio Parquet de un dataset sin fallar"""
+    close_parquet_handle(directory)
+    if directory and os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def prepare_for_arrow(df):
+    """
+    Adapta columnas object con valores de tipos mezclados (por ejemplo,
+    números y textos en la misma columna del Excel) a texto, para que
+    Arrow pueda tiparlas. No modifica el DataFrame original.
+    """
+    convertir = [
+        col for col in df.columns
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) in TIPOS_MIXTOS
+    ]
+    if not convertir:
+        return df
+    df = df.copy(deep=False)
+    for col in convertir:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _sin_diccionarios(tabla):
+    """
+    Columnas category (diccionarios Arrow) como su tipo de valores: Parquet
+    ya las codifica con diccionario al escribir, y los filtros, el orden y
+    la unión de esquemas entre partes funcionan sobre el tipo simple.
+    """
+    if not any(pa.types.is_dictionary(campo.type) for campo in tabla.schema):
+        return tabla
+    campos = [
+        pa.field(campo.name, campo.type.value_type, campo.nullable) if pa.types.is_dictionary(campo.type) else campo
+        for campo in tabla.schema
+    ]
+    return tabla.cast(pa.schema(campos, metadata=tabla.schema.metadata))
+
+
+def dataframe_to_table(df):
+    """Convierte un DataFrame a tabla Arrow (sin índice)"""
+    try:
+        return _sin_diccionarios(pa.Table.from_pandas(prepare_for_arrow(df), preserve_index=False))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Último recurso: todas las columnas object como texto
+        df = df.copy(deep=False)
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        return _sin_diccionarios(pa.Table.from_pandas(df, preserve_index=False))
+
+
+def schema_to_list(schema):
+    """Esquema Arrow como lista serializable [{'name', 'type', 'nullable'}]"""
+    return [
+        {'name': campo.name, 'type': str(campo.type), 'nullable': campo.nullable}
+        for campo in schema
+    ]
+
+
+def write_parquet(df, directory, part=0):
+    """
+    Escribe el DataFrame como una parte del directorio Parquet, en grupos
+    de filas de DATALAB_PARQUET_FILAS_GRUPO.
+
+    Returns:
+        tuple: (ruta de la parte, esquema como lista)
+    """
+    os.makedirs(directory, exist_ok=True)
+    tabla = dataframe_to_table(df)
+    ruta = part_path(directory, part)
+    pq.write_table(
+        tabla, ruta,
+        compression=PARQUET_COMPRESSION,
+        row_group_size=current_app.config.get('DATALAB_PARQUET_FILAS_GRUPO', 100_000)
+    )
+    return ruta, schema_to_list(tabla.schema)
+
+
+def unify_schemas(esquemas):
+    """
+    Esquema común de las partes (tipos ampliados por las filas agregadas),
+    con los metadatos de pandas de la última parte.
+    """
+    esquema = pa.unify_schemas(esquemas, promote_options='permissive')
+    return esquema.with_metadata(esquemas[-1].metadata)
+
+
+def parquet_schema(directory):
+    """Esquema común de las partes del directorio"""
+    partes = list_parts(directory)
+    if not partes:
+        return pa.schema([])
+    return unify_schemas([pq.read_schema(ruta) for ruta in partes])
+
+
+def open_parquet(directory):
+    """Dataset Arrow sobre todas las partes del directorio (con su esquema común)"""
+    return pads.dataset(list_parts(directory), schema=parquet_schema(directory), format='parquet')
+
+
+def read_parquet(directory, columns=None):
+    """
+    Lee las columnas pedidas de todas las partes como DataFrame
+    (memory-map; solo se descomprimen las columnas solicitadas).
+    """
+    tablas = [pq.read_table(ruta, columns=columns, memory_map=True) for ruta in list_parts(directory)]
+    if not tablas:
+        return pd.DataFrame(columns=columns or [])
+    tabla = pa.concat_tables(tablas, promote_options='permissive')
+    return tabla.replace_schema_metadata(tablas[-1].schema.metadata).to_pandas()
+
+
+def iter_parquet_frames(directory, columns=None, partes=None):
+    """
+    Recorre las partes (o las primeras `partes`) de a un row group, como
+    DataFrames, sin cargar el dataset completo.
+    """
+    for ruta in list_parts(directory)[:partes]:
+        archivo = pq.ParquetFile(ruta, memory_map=True)
+        for grupo in range(archivo.metadata.num_row_groups):
+            yield archivo.read_row_group(grupo, columns=columns).to_pandas()
+
+
+def _tipo_destino(campo, tipo):
+    """Tipo con el que se guarda una columna nueva de tipo `tipo` en la columna `campo` del dataset"""
+    if tipo == campo.type or pa.types.is_null(tipo):
+        return campo.type
+    if pa.types.is_string(campo.type) or pa.types.is_large_string(campo.type):
+        # Una columna de texto admite cualquier valor como texto
+        return campo.type
+    try:
+        return unify_schemas([pa.schema([campo]), pa.schema([pa.field(campo.name, tipo)])]).field(0).type
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        raise EsquemaIncompatible(
+            f'La columna "{campo.name}" es de tipo {campo.type} en el dataset y {tipo} en las filas nuevas'
+        )
+
+
+def _serie_para_tipo(serie, tipo):
+    """Columna de pandas con un dtype que Arrow convierte a `tipo` (y metadatos de pandas acordes)"""
+    if pa.types.is_integer(tipo):
+        return serie.astype(f'{"U" if pa.types.is_unsigned_integer(tipo) else ""}Int{tipo.bit_width}')
+    if pa.types.is_floating(tipo):
+        return serie.astype(f'float{tipo.bit_width}')
+    if pa.types.is_boolean(tipo):
+        return serie.astype('boolean')
+    if pa.types.is_timestamp(tipo):
+        return pd.to_datetime(serie, errors='raise')
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        serie = serie.astype(object)
+        return serie.where(serie.isna(), serie.astype(str))
+    return serie
+
+
+def append_parquet(df, directory):
+    """
+    Agrega el DataFrame como una parte nueva del directorio, sin tocar las
+    existentes. Debe tener las mismas columnas (en cualquier orden) y tipos
+    compatibles: los numéricos se amplían si hace falta, una columna
+    vacía toma el tipo del dataset y una columna de texto admite cualquier
+    valor como texto.
+    
+    Raises:
+        EsquemaIncompatible: columnas distintas o tipos incompatibles
+    
+    Returns:
+        tuple: (ruta de la parte, esquema común como lista, DataFrame con
+        los tipos con que se guardó, para perfilarlo)
+    """
+    esquema = parquet_schema(directory)
+    faltantes = [col for col in esquema.names if col not in df.columns]
+    sobrantes = [str(col) for col in df.columns if col not in esquema.names]
+    if faltantes or sobrantes:
+        detalle = []
+        if faltantes:
+            detalle.append(f'faltan {", ".join(faltantes)}')
+        if sobrantes:
+            detalle.append(f'sobran {", ".join(sobrantes)}')
+        raise EsquemaIncompatible(f'Las columnas no coinciden con las del dataset ({"; ".join(detalle)})')
+    
+    df = df[esquema.names]
+    tabla = dataframe_to_table(df)
+    tipos = {campo.name: _tipo_destino(campo, tabla.schema.field(campo.name).type) for campo in esquema}
+    cambiar = [col for col, tipo in tipos.items() if tabla.schema.field(col).type != tipo]
+    if cambiar:
+        df = df.copy(deep=False)
+        try:
+            for col in cambiar:
+                df[col] = _serie_para_tipo(df[col], tipos[col])
+            tabla = dataframe_to_table(df)
+            tabla = tabla.cast(pa.schema([pa.field(col, tipos[col]) for col in esquema.names],
+                                         metadata=tabla.schema.metadata))
+        except (ValueError, TypeError, pa.ArrowInvalid) as e:
+            raise EsquemaIncompatible(f'Las filas nuevas no se pueden convertir a los tipos del dataset: {e}')
+    
+    ruta = part_path(directory, len(list_parts(directory)))
+    pq.write_table(
+        tabla, ruta,
+        compression=PARQUET_COMPRESSION,
+        row_group_size=current_app.config.get('DATALAB_PARQUET_FILAS_GRUPO', 100_000)
+    )
+    return ruta, schema_to_list(unify_schemas([esquema, tabla.schema])), df
+
+
+class ParquetAbierto:
+    """
+    Dataset Parquet abierto: las partes con memory-map y los metadatos ya
+    leídos, con la posición global de cada row group para leer solo los
+    grupos que contienen las filas pedidas.
+    """
+
+    def __init__(self, directory, firma):
+        self.directory = directory
+        self.firma = firma
+        self.archivos = [pq.ParquetFile(ruta, memory_map=True) for ruta in list_parts(directory)]
+        self.schema = unify_schemas([archivo.schema_arrow for archivo in self.archivos]) \
+            if self.archivos else pa.schema([])
+
+        # (archivo, row group, primera fila global) de cada row group
+        self.grupos = []
+        inicio = 0
+        for archivo in self.archivos:
+            for grupo in range(archivo.metadata.num_row_groups):
+                self.grupos.append((archivo, grupo, inicio))
+                inicio += archivo.metadata.row_group(grupo).num_rows
+        self.num_rows = inicio
+        self._inicios = np.array([grupo[2] for grupo in self.grupos], dtype=np.int64)
+
+        # Posiciones de filas ya filtradas/ordenadas: clave de consulta -> np.ndarray
+        self.ordenes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _leer(self, archivo, columns, grupo=None):
+        """Columnas de un archivo (o de un row group); las que la parte no tiene se omiten"""
+        presentes = [col for col in columns if col in archivo.schema_arrow.names]
+        if grupo is None:
+            return archivo.read(columns=presentes)
+        return archivo.read_row_group(grupo, columns=presentes)
+
+    def _unir(self, tablas, columns):
+        if not tablas:
+            return self.schema.empty_table().select(columns)
+        tabla = pa.concat_tables(tablas, promote_options='permissive')
+        faltantes = [col for col in columns if col not in tabla.column_names]
+        for col in faltantes:
+            tabla = tabla.append_column(self.schema.field(col), pa.nulls(len(tabla), self.schema.field(col).type))
+        return tabla.select(columns).replace_schema_metadata(self.schema.metadata)
+
+    def read_columns(self, columns):
+        """Columnas pedidas de todas las filas"""
+        return self._unir([self._leer(archivo, columns) for archivo in self.archivos], columns)
+
+    def read_rows(self, posiciones, columns):
+        """
+        Filas en las posiciones globales pedidas (en ese orden), leyendo
+        solo los row groups que las contienen.
+        """
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        if len(posiciones) == 0:
+            return self._unir([], columns)
+
+        grupos = np.searchsorted(self._inicios, posiciones, side='right') - 1
+        tablas = []
+        orden_leido = []
+        for grupo in np.unique(grupos):
+            archivo, numero, inicio = self.grupos[grupo]
+            en_grupo = np.flatnonzero(grupos == grupo)
+            tabla = self._leer(archivo, columns, numero)
+            tablas.append(tabla.take(pa.array(posiciones[en_grupo] - inicio)))
+            orden_leido.append(en_grupo)
+
+        tabla = self._unir(tablas, columns)
+        # Volver al orden pedido
+        return tabla.take(pa.array(np.argsort(np.concatenate(orden_leido), kind='stable')))
+
+    def cached_order(self, clave, calcular):
+        """Posiciones de una consulta de filtro/orden, recordando las últimas"""
+        with self._lock:
+            if clave in self.ordenes:
+                self.ordenes.move_to_end(clave)
+                return self.ordenes[clave]
+        posiciones = calcular()
+        with self._lock:
+            self.ordenes[clave] = posiciones
+            while len(self.ordenes) > ORDENES_POR_DATASET:
+                self.ordenes.popitem(last=False)
+        return posiciones
+
+
+# Datasets abiertos, del menos al más recientemente usado
+_abiertos = OrderedDict()
+_abiertos_lock = threading.Lock()
+
+
+def _firma(directory):
+    """Partes del directorio con su tamaño y fecha: cambia si se agregan o reescriben"""
+    return tuple((ruta, os.path.getsize(ruta), os.path.getmtime(ruta)) for ruta in list_parts(directory))
+
+
+def get_parquet_handle(directory):
+    """
+    Dataset Parquet abierto, reutilizado entre requests. Se mantienen
+    abiertos hasta DATALAB_PARQUET_MAX_ABIERTOS (LRU); un directorio que
+    cambió desde que se abrió se vuelve a abrir.
+    """
+    firma = _firma(directory)
+    with _abiertos_lock:
+        abierto = _abiertos.get(directory)
+        if abierto is not None and abierto.firma == firma:
+            _abiertos.move_to_end(directory)
+            return abierto
+
+    abierto = ParquetAbierto(directory, firma)
+    with _abiertos_lock:
+        _abiertos[directory] = abierto
+        _abiertos.move_to_end(directory)
+        maximo = current_app.config.get('DATALAB_PARQUET_MAX_ABIERTOS', 8)
+        while len(_abiertos) > maximo:
+            _abiertos.popitem(last=False)
+    return abierto
+
+
+def close_parquet_handle(directory):
+    """Descarta el dataset abierto (por ejemplo, antes de borrar el directorio)"""
+    with _abiertos_lock:
+        _abiertos.pop(directory, None)
@@ -4,68 +4,253 @@ Servicio de perfilado de datasets para DataLab
 import pandas as pd
 import numpy as np
 from app.services.utils import detect_date_columns
-from dateutil import parser as date_parser
+from app.services.datalab_sketches import SketchDataset
 
 
-def profile_dataset(df):
+# Cantidad de valores más frecuentes que se informan por columna
+TOP_VALORES = 10
+
+# Columnas numéricas con hasta esta cantidad de valores distintos también informan top valores
+MAX_DISTINTOS_TOP = 20
+
+# Filas por bloque al construir los sketches del perfil aproximado
+FILAS_BLOQUE_SKETCH = 100_000
+
+# Percentiles que informa el perfil aproximado
+PERCENTILES = (5, 25, 75, 95)
+
+
+def _estadisticas_numericas(df):
+    """
+    Estadísticas de todas las columnas numéricas, calculadas por bloque de
+    dtype (una reducción por estadística sobre el bloque completo, no una
+    por columna).
+
+    Returns:
+        dict: {columna: {'min', 'max', 'mean', 'median', 'std'}}
+    """
+    numericas = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    if not numericas:
+        return {}
+    if df.empty:
+        return {col: dict.fromkeys(['min', 'max', 'mean', 'median', 'std']) for col in numericas}
+
+    # Los booleanos no forman parte del bloque numérico de pandas: se reducen aparte
+    bloque = df[[col for col in numericas if not pd.api.types.is_bool_dtype(df[col])]]
+    reducciones = {
+        'min': bloque.min(),
+        'max': bloque.max(),
+        'mean': bloque.mean(),
+        'median': bloque.median(),
+        'std': bloque.std(),
+    }
+
+    estadisticas = {}
+    for col in numericas:
+        if col in bloque.columns:
+            estadisticas[col] = {nombre: float(serie[col]) for nombre, serie in reducciones.items()}
+        else:
+            serie = df[col]
+            estadisticas[col] = {
+                'min': float(serie.min()), 'max': float(serie.max()), 'mean': float(serie.mean()),
+                'median': float(serie.median()), 'std': float(serie.std())
+            }
+    return estadisticas
+
+
+def _contar_valores(serie, top_siempre):
+    """
+    Cantidad de valores distintos y, si corresponde, los valores más
+    frecuentes, a partir de una única pasada de hashing (factorize).
+
+    Returns:
+        tuple: (distintos, Series de conteos ordenada desc. o None)
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # value_counts de categóricas incluye categorías sin filas: se respeta
+        conteo = serie.value_counts()
+        return int(serie.nunique()), conteo
+
+    codigos, unicos = pd.factorize(serie)
+    distintos = len(unicos)
+    if not top_siempre and distintos > MAX_DISTINTOS_TOP:
+        return distintos, None
+
+    # Mismo orden que value_counts: por frecuencia desc., valores en orden de aparición
+    frecuencias = np.bincount(codigos[codigos >= 0], minlength=distintos)
+    conteo = pd.Series(frecuencias, index=unicos, copy=False).sort_values(ascending=False)
+    return distintos, conteo
+
+
+def profile_dataset(df, approximate=False):
     """
     Genera un perfil estadístico básico del dataset.
-    
+
+    Recorre los datos una sola vez por medida: nulos para todo el frame,
+    estadísticas numéricas por bloque de dtype y, por columna, una única
+    pasada de hashing de la que salen tanto la cantidad de distintos como
+    los valores más frecuentes.
+
+    Con approximate=True el perfil sale de sketches construidos por
+    bloques (ver profile_from_sketches).
+
     Args:
         df: DataFrame de pandas
-    
+        approximate: usar el perfil aproximado por sketches
+
     Returns:
         dict: Perfil con tipos, nulos, estadísticas numéricas y categóricas
     """
+    if approximate:
+        return profile_from_sketches(sketch_dataset(bloques_dataframe(df)))
+
+    total_filas = len(df)
+    nulos = df.isna().sum()
+
     profile = {
         'columns': {},
         'summary': {
-            'total_rows': len(df),
+            'total_rows': total_filas,
             'total_columns': len(df.columns),
-            'total_nulls': int(df.isnull().sum().sum())
+            'total_nulls': int(nulos.sum())
         }
     }
-    
-    # Detectar columnas de fecha
-    date_columns = detect_date_columns(df)
-    
-    for col in df.columns:
-        col_data = df[col]
-        col_type = str(col_data.dtype)
-        
+
+    # Columnas de fecha (por contenido; se convierten al ingerir, no acá)
+    date_columns = set(detect_date_columns(df))
+    estadisticas = _estadisticas_numericas(df)
+
+    for posicion, col in enumerate(df.columns):
+        col_data = df.iloc[:, posicion]
+        es_numerica = col in estadisticas
+        cantidad_nulos = int(nulos.iloc[posicion])
+
+        distintos, conteo = _contar_valores(col_data, top_siempre=not es_numerica)
+
         col_profile = {
-            'type': col_type,
-            'nulls': int(col_data.isnull().sum()),
-            'null_percentage': float((col_data.isnull().sum() / len(df)) * 100) if len(df) > 0 else 0.0,
-            'unique_count': int(col_data.nunique())
+            'type': str(col_data.dtype),
+            'nulls': cantidad_nulos,
+            'null_percentage': float(cantidad_nulos / total_filas * 100) if total_filas > 0 else 0.0,
+            'unique_count': distintos
         }
-        
-        # Intentar parsear fechas si el nombre sugiere que es fecha
+
         if col in date_columns:
-            try:
-                # Intentar convertir a datetime
-                pd.to_datetime(col_data.dropna(), errors='coerce', infer_datetime_format=True)
-                col_profile['type'] = 'datetime64[ns]'
-                col_profile['is_date'] = True
-            except:
-                pass
-        
-        # Estadísticas para numéricas
-        if pd.api.types.is_numeric_dtype(col_data):
-            col_profile['min'] = float(col_data.min()) if not col_data.empty else None
-            col_profile['max'] = float(col_data.max()) if not col_data.empty else None
-            col_profile['mean'] = float(col_data.mean()) if not col_data.empty else None
-            col_profile['median'] = float(col_data.median()) if not col_data.empty else None
-            col_profile['std'] = float(col_data.std()) if not col_data.empty else None
-        
-        # Top valores para categóricas (o numéricas con pocos valores únicos)
-        if col_data.nunique() <= 20 or not pd.api.types.is_numeric_dtype(col_data):
-            value_counts = col_data.value_counts().head(10)
+            col_profile['type'] = 'datetime64[ns]'
+            col_profile['is_date'] = True
+
+        if es_numerica:
+            col_profile.update(estadisticas[col])
+
+        if conteo is not None:
             col_profile['top_values'] = {
-                str(k): int(v) for k, v in value_counts.items()
+                str(k): int(v) for k, v in conteo.head(TOP_VALORES).items()
             }
-        
+
         profile['columns'][col] = col_profile
-    
+
     return profile
 
+
+def bloques_dataframe(df, filas=FILAS_BLOQUE_SKETCH):
+    """Recorre el DataFrame en bloques de filas (vistas, sin copiar)"""
+    for inicio in range(0, max(len(df), 1), filas):
+        yield df.iloc[inicio:inicio + filas]
+
+
+def sketch_dataset(bloques, sketch=None):
+    """
+    Construye (o extiende) los sketches de un dataset a partir de bloques
+    de filas; los bloques pueden venir de un DataFrame, de las partes
+    Parquet o del lector del archivo, sin tener todo el dataset en memoria.
+
+    Returns:
+        SketchDataset
+    """
+    sketch = sketch or SketchDataset()
+    for bloque in bloques:
+        sketch.agregar(bloque)
+    return sketch
+
+
+def profile_from_sketches(sketch):
+    """
+    Perfil con el mismo formato que profile_dataset, calculado a partir de
+    los sketches. Nulos, mínimo, máximo, media y desvío son exactos; la
+    cantidad de distintos, mediana, percentiles y top valores son
+    estimaciones. Cada columna lista en 'approximate' las medidas estimadas
+    y en 'error_bounds' su cota de error.
+
+    Returns:
+        dict: Perfil del dataset
+    """
+    total_filas = sketch.filas
+    # Las fechas ya se convirtieron al ingerir: se reconocen por el tipo
+    date_columns = {
+        col for col, col_sketch in sketch.columnas.items() if (col_sketch.tipo or '').startswith('datetime64')
+    }
+
+    profile = {
+        'columns': {},
+        'summary': {
+            'total_rows': total_filas,
+            'total_columns': len(sketch.columnas),
+            'total_nulls': sum(col.nulos for col in sketch.columnas.values()),
+            'approximate': True
+        }
+    }
+
+    for col, col_sketch in sketch.columnas.items():
+        no_nulos = total_filas - col_sketch.nulos
+        frecuentes = col_sketch.frecuentes
+        aproximadas = []
+        cotas = {}
+
+        # Si Misra-Gries nunca descartó valores, conoce todos los distintos
+        if frecuentes.error == 0 and len(frecuentes.contadores) < frecuentes.k:
+            distintos = len(frecuentes.contadores)
+        else:
+            distintos = min(col_sketch.distintos.estimar(), no_nulos)
+            aproximadas.append('unique_count')
+            cotas['unique_count'] = {'relative_std_error': round(col_sketch.distintos.error_relativo, 4)}
+
+        col_profile = {
+            'type': col_sketch.tipo,
+            'nulls': col_sketch.nulos,
+            'null_percentage': float(col_sketch.nulos / total_filas * 100) if total_filas > 0 else 0.0,
+            'unique_count': distintos
+        }
+
+        if col in date_columns:
+            col_profile['type'] = 'datetime64[ns]'
+            col_profile['is_date'] = True
+
+        if col_sketch.numerica:
+            momentos = col_sketch.momentos
+            cuantiles = col_sketch.cuantiles
+            vacia = momentos.cantidad == 0
+            col_profile.update({
+                'min': None if vacia else momentos.minimo,
+                'max': None if vacia else momentos.maximo,
+                'mean': None if vacia else momentos.media,
+                'median': cuantiles.cuantil(0.5),
+                'std': None if vacia else momentos.desvio,
+                'percentiles': {f'p{p}': cuantiles.cuantil(p / 100) for p in PERCENTILES}
+            })
+            aproximadas += ['median', 'percentiles']
+            cota = {'relative_error': cuantiles.error_relativo}
+            cotas['median'] = cota
+            cotas['percentiles'] = cota
+
+        if not col_sketch.numerica or distintos <= MAX_DISTINTOS_TOP:
+            col_profile['top_values'] = dict(frecuentes.mas_frecuentes(TOP_VALORES))
+            if frecuentes.error:
+                aproximadas.append('top_values')
+                cotas['top_values'] = {'max_undercount': frecuentes.error}
+
+        if aproximadas:
+            col_profile['approximate'] = aproximadas
+            col_profile['error_bounds'] = cotas
+
+        profile['columns'][col] = col_profile
+
+    return profile
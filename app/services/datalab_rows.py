@@ -0,0 +1,196 @@
+"""
+Servicio de consulta de filas de datasets de DataLab
+
+Recorre la copia Parquet de un dataset por páginas, con proyección de
+columnas, orden y filtros simples (igual, en lista, rango, contiene), sin
+volver a leer el archivo original. Las páginas sin filtro ni orden leen
+solo los row groups que contienen sus filas; con filtro u orden se leen
+únicamente las columnas involucradas y el resultado (posiciones de filas)
+queda recordado en el dataset abierto para las páginas siguientes.
+"""
+import base64
+import json
+import math
+from datetime import date, datetime, time
+from decimal import Decimal
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from app.services.datalab_parquet import get_parquet_handle
+
+
+# Operadores de filtro soportados
+OPERADORES = {'eq', 'in', 'range', 'contains'}
+
+# Columna auxiliar con la posición global de cada fila
+COLUMNA_POSICION = '__posicion'
+
+
+def encode_cursor(offset):
+    """Cursor opaco con la posición de la siguiente página"""
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Posición del cursor (0 si no hay cursor) o ValueError"""
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['offset'])
+    except Exception:
+        raise ValueError('Cursor de paginación inválido')
+    if offset < 0:
+        raise ValueError('Cursor de paginación inválido')
+    return offset
+
+
+def parse_sort(orden):
+    """
+    Orden como texto 'col1,-col2' (con '-' descendente) a lista de
+    (columna, 'ascending'|'descending').
+    """
+    claves = []
+    for parte in (orden or '').split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        sentido = 'descending' if parte.startswith('-') else 'ascending'
+        claves.append((parte.lstrip('-+'), sentido))
+    return claves
+
+
+def _escalar(valor, tipo):
+    """Valor de un filtro convertido al tipo Arrow de la columna"""
+    try:
+        return pa.scalar(valor).cast(tipo)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        raise ValueError(f'Valor de filtro inválido para {tipo}: {valor!r}')
+
+
+def build_filter(filtros, schema):
+    """
+    Expresión Arrow a partir de la lista de filtros
+    [{'column', 'op', 'value'}], combinados con AND.
+
+    - eq: value escalar
+    - in: value lista
+    - range: value [desde, hasta] (inclusive; cualquiera puede ser null)
+    - contains: value texto (sin distinguir mayúsculas)
+    """
+    if not isinstance(filtros, list):
+        raise ValueError('Los filtros deben ser una lista')
+
+    expresion = None
+    for filtro in filtros:
+        if not isinstance(filtro, dict):
+            raise ValueError('Filtro mal formado')
+        columna, operador, valor = filtro.get('column'), filtro.get('op'), filtro.get('value')
+        if columna not in schema.names:
+            raise ValueError(f'Columna de filtro inexistente: {columna}')
+        if operador not in OPERADORES:
+            raise ValueError(f'Operador de filtro no soportado: {operador}')
+
+        campo = pc.field(columna)
+        tipo = schema.field(columna).type
+        if operador == 'eq':
+            condicion = campo == _escalar(valor, tipo)
+        elif operador == 'in':
+            if not isinstance(valor, list) or not valor:
+                raise ValueError('El filtro "in" requiere una lista de valores')
+            condicion = campo.isin(pa.array([_escalar(v, tipo).as_py() for v in valor], type=tipo))
+        elif operador == 'range':
+            if not isinstance(valor, list) or len(valor) != 2 or valor == [None, None]:
+                raise ValueError('El filtro "range" requiere [desde, hasta]')
+            desde, hasta = valor
+            condicion = None
+            if desde is not None:
+                condicion = campo >= _escalar(desde, tipo)
+            if hasta is not None:
+                tope = campo <= _escalar(hasta, tipo)
+                condicion = tope if condicion is None else condicion & tope
+        else:
+            if not isinstance(valor, str) or not valor:
+                raise ValueError('El filtro "contains" requiere un texto')
+            texto = campo if pa.types.is_string(tipo) or pa.types.is_large_string(tipo) else campo.cast(pa.string())
+            condicion = pc.match_substring(texto, valor, ignore_case=True)
+
+        expresion = condicion if expresion is None else expresion & condicion
+    return expresion
+
+
+def json_value(valor):
+    """Valor de una celda serializable a JSON"""
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, bytes):
+        return valor.decode('utf-8', errors='replace')
+    return valor
+
+
+def browse_rows(directory, columns=None, filters=None, sort=None, offset=0, limit=100):
+    """
+    Página de filas de un directorio Parquet.
+
+    Args:
+        directory: directorio de partes Parquet del dataset
+        columns: columnas a devolver (None = todas)
+        filters: lista de filtros (ver build_filter)
+        sort: lista de (columna, 'ascending'|'descending')
+        offset: posición de la primera fila de la página
+        limit: filas por página
+
+    Raises:
+        ValueError: columnas, filtros u orden inválidos
+
+    Returns:
+        dict: {'columnas', 'registros', 'total', 'siguiente'}
+    """
+    abierto = get_parquet_handle(directory)
+    nombres = abierto.schema.names
+    columnas = list(dict.fromkeys(columns)) if columns else nombres
+    sort = sort or []
+    inexistentes = [col for col in columnas + [col for col, _ in sort] if col not in nombres]
+    if inexistentes:
+        raise ValueError(f'Columnas inexistentes: {", ".join(inexistentes)}')
+
+    expresion = build_filter(filters, abierto.schema) if filters else None
+
+    if expresion is None and not sort:
+        total = abierto.num_rows
+        posiciones = np.arange(offset, min(offset + limit, total), dtype=np.int64)
+    else:
+        def calcular():
+            # Solo las columnas del filtro y del orden, más la posición de cada fila
+            involucradas = list(dict.fromkeys(
+                [filtro['column'] for filtro in filters or []] + [col for col, _ in sort]
+            ))
+            tabla = abierto.read_columns(involucradas).append_column(
+                COLUMNA_POSICION, pa.array(np.arange(abierto.num_rows, dtype=np.int64))
+            )
+            if expresion is not None:
+                tabla = tabla.filter(expresion)
+            if sort:
+                tabla = tabla.take(pc.sort_indices(tabla, sort_keys=sort, null_placement='at_end'))
+            return tabla[COLUMNA_POSICION].to_numpy()
+
+        clave = json.dumps([filters or [], sort], sort_keys=True, default=str)
+        todas = abierto.cached_order(clave, calcular)
+        total = len(todas)
+        posiciones = todas[offset:offset + limit]
+
+    tabla = abierto.read_rows(posiciones, columnas)
+    registros = [
+        {col: json_value(valor) for col, valor in fila.items()}
+        for fila in tabla.to_pylist()
+    ]
+    siguiente = offset + len(posiciones)
+    return {
+        'columnas': columnas,
+        'registros': registros,
+        'total': total,
+        'siguiente': encode_cursor(siguiente) if siguiente < total else None
+    }
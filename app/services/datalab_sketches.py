@@ -0,0 +1,418 @@
+"""
+Sketches probabilísticos para el perfilado aproximado de DataLab
+
+Resúmenes de tamaño acotado que se actualizan por bloques de filas y se
+pueden combinar entre sí (merge), de modo que un dataset muy grande se
+perfila sin tenerlo completo en memoria y un perfil se puede extender al
+agregar filas:
+
+- HyperLogLog: cantidad de valores distintos.
+- DDSketch: cuantiles (mediana, percentiles) con error relativo acotado.
+- Misra-Gries: valores más frecuentes (heavy hitters).
+
+Los sketches se guardan como JSON en un archivo aparte del dataset (son
+demasiado grandes para una columna Text).
+"""
+import base64
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+
+
+# Precisión de HyperLogLog: 2^14 registros, error estándar relativo 1.04/sqrt(2^14) ~ 0.8%
+HLL_PRECISION = 14
+
+# Error relativo garantizado de los cuantiles de DDSketch
+DDSKETCH_ERROR_RELATIVO = 0.01
+
+# Máximo de buckets por signo de DDSketch (se colapsan los de menor magnitud)
+DDSKETCH_MAX_BUCKETS = 2048
+
+# Contadores de Misra-Gries por columna (error máximo n / (k + 1))
+MISRA_GRIES_CONTADORES = 64
+
+# Versión del formato serializado
+VERSION_SKETCHES = 1
+
+
+def hash_valores(valores):
+    """
+    Hash de 64 bits estable (entre procesos) de un Index de valores. Los
+    numéricos se llevan a float para que 1 y 1.0 (bloques con y sin nulos)
+    cuenten como el mismo valor.
+    """
+    if pd.api.types.is_numeric_dtype(valores.dtype):
+        valores = valores.astype(np.float64)
+    return pd.util.hash_pandas_object(valores).to_numpy(dtype=np.uint64)
+
+
+class HyperLogLog:
+    """Estimador de cardinalidad HyperLogLog sobre hashes de 64 bits"""
+
+    def __init__(self, precision=HLL_PRECISION, registros=None):
+        self.precision = precision
+        self.registros = registros if registros is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def error_relativo(self):
+        """Error estándar relativo de la estimación"""
+        return 1.04 / math.sqrt(len(self.registros))
+
+    def agregar_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        bits_resto = 64 - self.precision
+        indices = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+        resto = hashes & np.uint64((1 << bits_resto) - 1)
+        # Posición del primer 1 en los bits restantes (1 = bit más alto). El
+        # resto tiene menos de 53 bits: frexp da su largo exacto
+        _, largos = np.frexp(resto.astype(np.float64))
+        rangos = (bits_resto - largos + 1).astype(np.uint8)
+        np.maximum.at(self.registros, indices, rangos)
+
+    def combinar(self, otro):
+        np.maximum(self.registros, otro.registros, out=self.registros)
+
+    def estimar(self):
+        m = len(self.registros)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimacion = alfa * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        vacios = int(np.count_nonzero(self.registros == 0))
+        if estimacion <= 2.5 * m and vacios:
+            # Rango bajo: conteo lineal
+            estimacion = m * math.log(m / vacios)
+        return int(round(estimacion))
+
+    def to_dict(self):
+        return {
+            'precision': self.precision,
+            'registros': base64.b64encode(self.registros.tobytes()).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, datos):
+        registros = np.frombuffer(base64.b64decode(datos['registros']), dtype=np.uint8).copy()
+        return cls(datos['precision'], registros)
+
+
+class DDSketch:
+    """
+    Sketch de cuantiles con error relativo acotado (DDSketch): cada valor
+    cae en un bucket logarítmico y cualquier cuantil se estima con error
+    relativo menor a `error_relativo`.
+    """
+
+    def __init__(self, error_relativo=DDSKETCH_ERROR_RELATIVO, max_buckets=DDSKETCH_MAX_BUCKETS,
+                 positivos=None, negativos=None, ceros=0):
+        self.error_relativo = error_relativo
+        self.max_buckets = max_buckets
+        self.gamma = (1 + error_relativo) / (1 - error_relativo)
+        self._log_gamma = math.log(self.gamma)
+        self.positivos = positivos or {}
+        self.negativos = negativos or {}
+        self.ceros = ceros
+
+    @property
+    def cantidad(self):
+        return self.ceros + sum(self.positivos.values()) + sum(self.negativos.values())
+
+    def _sumar(self, buckets, magnitudes):
+        if len(magnitudes) == 0:
+            return
+        indices = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        claves, conteos = np.unique(indices, return_counts=True)
+        for clave, conteo in zip(claves.tolist(), conteos.tolist()):
+            buckets[clave] = buckets.get(clave, 0) + conteo
+        self._colapsar(buckets)
+
+    def _colapsar(self, buckets):
+        """Une los buckets de menor magnitud si se supera el máximo"""
+        if len(buckets) <= self.max_buckets:
+            return
+        claves = sorted(buckets)
+        sobrantes = claves[:len(claves) - self.max_buckets + 1]
+        destino = sobrantes[-1]
+        buckets[destino] = sum(buckets.pop(clave) for clave in sobrantes[:-1]) + buckets[destino]
+
+    def agregar(self, valores):
+        valores = valores[np.isfinite(valores)]
+        self.ceros += int(np.count_nonzero(valores == 0))
+        self._sumar(self.positivos, valores[valores > 0])
+        self._sumar(self.negativos, -valores[valores < 0])
+
+    def combinar(self, otro):
+        for propios, ajenos in ((self.positivos, otro.positivos), (self.negativos, otro.negativos)):
+            for clave, conteo in ajenos.items():
+                propios[clave] = propios.get(clave, 0) + conteo
+            self._colapsar(propios)
+        self.ceros += otro.ceros
+
+    def _valor(self, clave):
+        return 2 * self.gamma ** clave / (self.gamma + 1)
+
+    def cuantil(self, q):
+        total = self.cantidad
+        if total == 0:
+            return None
+        rango = q * (total - 1)
+        acumulado = 0
+        # De menor a mayor: negativos por magnitud decreciente, ceros, positivos
+        for clave in sorted(self.negativos, reverse=True):
+            acumulado += self.negativos[clave]
+            if acumulado > rango:
+                return -self._valor(clave)
+        acumulado += self.ceros
+        if acumulado > rango:
+            return 0.0
+        for clave in sorted(self.positivos):
+            acumulado += self.positivos[clave]
+            if acumulado > rango:
+                return self._valor(clave)
+        return self._valor(max(self.positivos)) if self.positivos else 0.0
+
+    def to_dict(self):
+        return {
+            'error_relativo': self.error_relativo,
+            'max_buckets': self.max_buckets,
+            'positivos': {str(k): v for k, v in self.positivos.items()},
+            'negativos': {str(k): v for k, v in self.negativos.items()},
+            'ceros': self.ceros
+        }
+
+    @classmethod
+    def from_dict(cls, datos):
+        return cls(
+            datos['error_relativo'], datos['max_buckets'],
+            {int(k): v for k, v in datos['positivos'].items()},
+            {int(k): v for k, v in datos['negativos'].items()},
+            datos['ceros']
+        )
+
+
+class MisraGries:
+    """
+    Resumen de valores frecuentes de Misra-Gries: `k` contadores cuyos
+    valores subestiman la frecuencia real en a lo sumo `error`
+    (<= n / (k + 1)).
+    """
+
+    def __init__(self, k=MISRA_GRIES_CONTADORES, contadores=None, error=0):
+        self.k = k
+        self.contadores = contadores or {}
+        self.error = error
+
+    def _podar(self, contadores):
+        """Deja los k mayores, descontando el (k+1)-ésimo conteo a todos"""
+        if len(contadores) <= self.k:
+            return contadores, 0
+        ordenados = sorted(contadores.items(), key=lambda item: item[1], reverse=True)
+        umbral = ordenados[self.k][1]
+        return {valor: conteo - umbral for valor, conteo in ordenados[:self.k] if conteo > umbral}, umbral
+
+    def agregar_conteo(self, conteo):
+        """Incorpora los conteos exactos (value_counts) de un bloque"""
+        if conteo.empty:
+            return
+        # El bloque se resume primero (exacto hasta k+1 valores) para no
+        # convertir a texto más que los candidatos
+        umbral = 0
+        if len(conteo) > self.k:
+            umbral = int(-np.partition(-conteo.to_numpy(), self.k)[self.k])
+            conteo = conteo[conteo > umbral] - umbral
+        bloque = {str(valor): int(cantidad) for valor, cantidad in conteo.items()}
+        self.combinar(MisraGries(self.k, bloque, umbral))
+
+    def combinar(self, otro):
+        unidos = dict(self.contadores)
+        for valor, conteo in otro.contadores.items():
+            unidos[valor] = unidos.get(valor, 0) + conteo
+        self.contadores, umbral = self._podar(unidos)
+        self.error += otro.error + umbral
+
+    def mas_frecuentes(self, cantidad):
+        return sorted(self.contadores.items(), key=lambda item: item[1], reverse=True)[:cantidad]
+
+    def to_dict(self):
+        return {'k': self.k, 'contadores': self.contadores, 'error': self.error}
+
+    @classmethod
+    def from_dict(cls, datos):
+        return cls(datos['k'], dict(datos['contadores']), datos['error'])
+
+
+class Momentos:
+    """Cantidad, mínimo, máximo, media y varianza exactos y combinables (Chan et al.)"""
+
+    def __init__(self, cantidad=0, media=0.0, m2=0.0, minimo=None, maximo=None):
+        self.cantidad = cantidad
+        self.media = media
+        self.m2 = m2
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def agregar(self, valores):
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return
+        media = float(valores.mean())
+        self.combinar(Momentos(len(valores), media, float(((valores - media) ** 2).sum()),
+                               float(valores.min()), float(valores.max())))
+
+    def combinar(self, otro):
+        if otro.cantidad == 0:
+            return
+        if self.cantidad == 0:
+            self.cantidad, self.media, self.m2 = otro.cantidad, otro.media, otro.m2
+            self.minimo, self.maximo = otro.minimo, otro.maximo
+            return
+        total = self.cantidad + otro.cantidad
+        delta = otro.media - self.media
+        self.media += delta * otro.cantidad / total
+        self.m2 += otro.m2 + delta * delta * self.cantidad * otro.cantidad / total
+        self.cantidad = total
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+
+    @property
+    def desvio(self):
+        """Desvío estándar muestral (ddof=1, como pandas)"""
+        return math.sqrt(self.m2 / (self.cantidad - 1)) if self.cantidad > 1 else float('nan')
+
+    def to_dict(self):
+        return {'cantidad': self.cantidad, 'media': self.media, 'm2': self.m2,
+                'minimo': self.minimo, 'maximo': self.maximo}
+
+    @classmethod
+    def from_dict(cls, datos):
+        return cls(datos['cantidad'], datos['media'], datos['m2'], datos['minimo'], datos['maximo'])
+
+
+class SketchColumna:
+    """Estado del perfil aproximado de una columna"""
+
+    def __init__(self, tipo=None, numerica=False, nulos=0, distintos=None, frecuentes=None,
+                 cuantiles=None, momentos=None):
+        self.tipo = tipo
+        self.numerica = numerica
+        self.nulos = nulos
+        self.distintos = distintos or HyperLogLog()
+        self.frecuentes = frecuentes or MisraGries()
+        self.cuantiles = cuantiles or (DDSketch() if numerica else None)
+        self.momentos = momentos or (Momentos() if numerica else None)
+
+    @classmethod
+    def para_serie(cls, serie):
+        return cls(str(serie.dtype), pd.api.types.is_numeric_dtype(serie))
+
+    def agregar(self, serie):
+        self.nulos += int(serie.isna().sum())
+        # Un solo conteo por bloque alimenta a HyperLogLog (solo importan
+        # los valores distintos) y a Misra-Gries
+        conteo = serie.value_counts(sort=False)
+        conteo = conteo[conteo > 0]  # las categóricas incluyen categorías sin filas
+        self.distintos.agregar_hashes(hash_valores(conteo.index))
+        self.frecuentes.agregar_conteo(conteo)
+        if self.numerica:
+            valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            self.momentos.agregar(valores)
+            self.cuantiles.agregar(valores[~np.isnan(valores)])
+
+    def combinar(self, otro):
+        if otro.numerica and not self.numerica and not self.frecuentes.contadores and not self.frecuentes.error:
+            # Columna todavía sin valores (tipo desconocido): toma el del otro lado
+            self.tipo, self.numerica = otro.tipo, True
+            self.cuantiles, self.momentos = DDSketch(), Momentos()
+        self.nulos += otro.nulos
+        self.distintos.combinar(otro.distintos)
+        self.frecuentes.combinar(otro.frecuentes)
+        if self.numerica and otro.numerica:
+            self.momentos.combinar(otro.momentos)
+            self.cuantiles.combinar(otro.cuantiles)
+
+    def to_dict(self):
+        return {
+            'tipo': self.tipo,
+            'numerica': self.numerica,
+            'nulos': self.nulos,
+            'distintos': self.distintos.to_dict(),
+            'frecuentes': self.frecuentes.to_dict(),
+            'cuantiles': self.cuantiles.to_dict() if self.cuantiles else None,
+            'momentos': self.momentos.to_dict() if self.momentos else None
+        }
+
+    @classmethod
+    def from_dict(cls, datos):
+        return cls(
+            datos['tipo'], datos['numerica'], datos['nulos'],
+            HyperLogLog.from_dict(datos['distintos']),
+            MisraGries.from_dict(datos['frecuentes']),
+            DDSketch.from_dict(datos['cuantiles']) if datos['cuantiles'] else None,
+            Momentos.from_dict(datos['momentos']) if datos['momentos'] else None
+        )
+
+
+class SketchDataset:
+    """
+    Estado combinable del perfil aproximado de un dataset: filas totales y
+    un SketchColumna por columna (en el orden de las columnas).
+    """
+
+    def __init__(self, filas=0, columnas=None):
+        self.filas = filas
+        self.columnas = columnas or {}
+
+    def agregar(self, df):
+        """Incorpora un bloque de filas"""
+        self.filas += len(df)
+        for posicion, col in enumerate(df.columns):
+            serie = df.iloc[:, posicion]
+            if col not in self.columnas:
+                self.columnas[col] = SketchColumna.para_serie(serie)
+            self.columnas[col].agregar(serie)
+
+    def combinar(self, otro):
+        # Una columna que falta de un lado (partes con columnas distintas)
+        # cuenta como nula en todas las filas de ese lado
+        for col, sketch in self.columnas.items():
+            if col not in otro.columnas:
+                sketch.nulos += otro.filas
+        for col, sketch in otro.columnas.items():
+            if col in self.columnas:
+                self.columnas[col].combinar(sketch)
+            else:
+                sketch.nulos += self.filas
+                self.columnas[col] = sketch
+        self.filas += otro.filas
+
+    def to_dict(self):
+        return {
+            'version': VERSION_SKETCHES,
+            'filas': self.filas,
+            'columnas': [[col, sketch.to_dict()] for col, sketch in self.columnas.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, datos):
+        return cls(datos['filas'], {col: SketchColumna.from_dict(sketch) for col, sketch in datos['columnas']})
+
+
+def sketches_path_for(stored_path):
+    """Archivo de sketches de un dataset (junto al archivo original)"""
+    return os.path.splitext(stored_path)[0] + '_sketches.json'
+
+
+def save_sketches(sketch, path):
+    """Guarda el estado de los sketches como JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(sketch.to_dict(), f)
+    return path
+
+
+def load_sketches(path):
+    """Carga el estado de los sketches, o None si no existe"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return SketchDataset.from_dict(json.load(f))
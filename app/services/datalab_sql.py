@@ -0,0 +1,179 @@
+"""
+Motor SQL analítico embebido (DuckDB) sobre los datasets de DataLab
+
+Cada consulta corre en una base DuckDB en memoria, nueva y propia, en la
+que solo existen como tablas los datasets de la unidad del usuario (sus
+copias Parquet). Antes de ejecutar el SQL del usuario se deshabilita el
+acceso externo (archivos, red, extensiones) y se bloquea la
+configuración, de modo que la consulta no puede leer nada fuera de esas
+tablas. Las consultas tienen tope de filas, de memoria, de hilos y de
+tiempo, y el resultado se envía por partes.
+"""
+import json
+import threading
+import duckdb
+from flask import current_app
+from app.models.dataset import Dataset
+from app.services.datalab_parquet import list_parts, open_parquet
+from app.services.datalab_rows import json_value
+from app.services.utils import normalize_column_name
+
+
+# Filas por lote al leer el resultado
+FILAS_LOTE = 2048
+
+
+class ConsultaInvalida(ValueError):
+    """Consulta rechazada, con error de SQL o que superó el tiempo máximo"""
+
+
+def dataset_tables(unidad_id):
+    """
+    Tablas disponibles para la unidad: {nombre de tabla: Dataset}. El
+    nombre sale del nombre del dataset normalizado; si se repite, se le
+    agrega el id.
+    """
+    tablas = {}
+    datasets = Dataset.query.filter(
+        Dataset.unidad_id == unidad_id,
+        Dataset.parquet_path.isnot(None)
+    ).order_by(Dataset.id)
+    for dataset in datasets:
+        nombre = normalize_column_name(dataset.name)
+        if not nombre[:1].isalpha():
+            nombre = f'dataset_{nombre}'
+        if nombre in tablas:
+            nombre = f'{nombre}_{dataset.id}'
+        tablas[nombre] = dataset
+    return tablas
+
+
+def _conectar(tablas):
+    """Base DuckDB en memoria con las tablas registradas y el acceso externo cerrado"""
+    config = current_app.config
+    con = duckdb.connect(':memory:', config={
+        'threads': config.get('DATALAB_SQL_HILOS', 2),
+        'memory_limit': config.get('DATALAB_SQL_MEMORIA', '1GB'),
+        'autoinstall_known_extensions': False,
+        'autoload_known_extensions': False,
+    })
+    try:
+        for nombre, dataset in tablas.items():
+            if list_parts(dataset.parquet_path):
+                con.register(nombre, open_parquet(dataset.parquet_path))
+        # Desde acá la consulta solo ve las tablas registradas
+        con.execute('SET enable_external_access = false')
+        con.execute('SET lock_configuration = true')
+    except Exception:
+        con.close()
+        raise
+    return con
+
+
+def _validar(con, sql):
+    """Una sola sentencia y de tipo SELECT"""
+    try:
+        sentencias = con.extract_statements(sql)
+    except duckdb.Error as e:
+        raise ConsultaInvalida(str(e))
+    if len(sentencias) != 1:
+        raise ConsultaInvalida('Se admite una sola consulta por vez')
+    if sentencias[0].type != duckdb.StatementType.SELECT:
+        raise ConsultaInvalida('Solo se admiten consultas SELECT')
+
+
+class ResultadoSQL:
+    """
+    Resultado de una consulta en curso. `iter_json` lo envía por partes
+    como un único objeto JSON y cierra la conexión al terminar.
+    """
+
+    def __init__(self, con, lector, temporizador, max_filas):
+        self.con = con
+        self.lector = lector
+        self.temporizador = temporizador
+        self.max_filas = max_filas
+        self.columnas = lector.schema.names
+
+    def cerrar(self):
+        self.temporizador.cancel()
+        self.con.close()
+
+    def iter_json(self):
+        """
+        {"columnas": [...], "filas": [[...], ...], "total": n,
+        "truncado": bool, "error": null|texto}; un error a mitad de camino
+        (por ejemplo, el tiempo máximo) se informa en "error".
+        """
+        yield '{"columnas": ' + json.dumps(self.columnas) + ', "filas": ['
+        total = 0
+        truncado = False
+        error = None
+        try:
+            for lote in self.lector:
+                columnas = [columna.to_pylist() for columna in lote.columns]
+                for fila in zip(*columnas):
+                    if total == self.max_filas:
+                        truncado = True
+                        break
+                    yield (',' if total else '') + json.dumps([json_value(valor) for valor in fila], default=str)
+                    total += 1
+                if truncado:
+                    break
+        except duckdb.InterruptException:
+            error = 'La consulta superó el tiempo máximo'
+        except duckdb.Error as e:
+            error = str(e)
+        finally:
+            self.cerrar()
+        yield '], ' + json.dumps({'total': total, 'truncado': truncado, 'error': error})[1:]
+
+
+def execute_query(unidad_id, sql):
+    """
+    Ejecuta una consulta SELECT sobre los datasets de la unidad.
+
+    Raises:
+        ConsultaInvalida: consulta vacía, no SELECT, con error o fuera de tiempo
+
+    Returns:
+        ResultadoSQL: resultado listo para enviarse con iter_json
+    """
+    sql = (sql or '').strip().rstrip(';').strip()
+    if not sql:
+        raise ConsultaInvalida('La consulta está vacía')
+
+    config = current_app.config
+    max_filas = config.get('DATALAB_SQL_MAX_FILAS', 10_000)
+    con = _conectar(dataset_tables(unidad_id))
+    temporizador = threading.Timer(config.get('DATALAB_SQL_TIMEOUT', 30), con.interrupt)
+    try:
+        _validar(con, sql)
+        temporizador.start()
+        # Una fila más que el tope para saber si el resultado se truncó (los
+        # saltos de línea evitan que un comentario final anule el LIMIT)
+        resultado = con.execute(f'SELECT * FROM (\n{sql}\n) AS consulta LIMIT {max_filas + 1}')
+        lector = resultado.fetch_record_batch(FILAS_LOTE)
+    except Exception as e:
+        temporizador.cancel()
+        con.close()
+        if isinstance(e, duckdb.InterruptException):
+            raise ConsultaInvalida('La consulta superó el tiempo máximo')
+        if isinstance(e, duckdb.Error):
+            raise ConsultaInvalida(str(e))
+        raise
+    return ResultadoSQL(con, lector, temporizador, max_filas)
+
+
+def describe_tables(unidad_id):
+    """Tablas de la unidad con sus columnas (del esquema guardado), para la ayuda de la consola"""
+    return [
+        {
+            'tabla': nombre,
+            'dataset_id': dataset.id,
+            'dataset': dataset.name,
+            'filas': dataset.rows_count,
+            'columnas': [campo['name'] for campo in dataset.get_schema() or []]
+        }
+        for nombre, dataset in dataset_tables(unidad_id).items()
+    ]
@@ -0,0 +1,286 @@
+"""
+Inferencia de tipos al ingerir datasets de DataLab
+
+Las columnas de fecha se reconocen por su contenido y no por el nombre:
+se toma una muestra de valores, se elige una sola vez el formato que los
+interpreta (ISO, dd/mm/aaaa y variantes, seriales de Excel, celdas que ya
+son fechas) y la columna completa se convierte de manera vectorizada con
+ese formato explícito. Los formatos elegidos se guardan en la caché por
+fuente (unidad y encabezados del archivo), de modo que las subidas
+repetidas de la misma planilla no vuelven a inferirlos.
+"""
+import hashlib
+import json
+import re
+from datetime import date
+import numpy as np
+import pandas as pd
+from app.services.cache import get_cache
+
+
+# Valores que se muestrean por columna para inferir el formato
+MUESTRA_FECHAS = 200
+
+# Proporción mínima de la muestra (no nula) que el formato debe interpretar
+UMBRAL_FECHAS = 0.9
+
+# Formatos de texto candidatos, en orden de preferencia: ante una muestra
+# ambigua (01/02/2024) gana el primero, día antes que mes
+FORMATOS_FECHA = [
+    'ISO8601',
+    '%d/%m/%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S',
+    '%d-%m-%Y', '%d-%m-%Y %H:%M', '%d-%m-%Y %H:%M:%S',
+    '%d.%m.%Y', '%d/%m/%y', '%Y/%m/%d', '%Y/%m/%d %H:%M:%S',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S',
+]
+
+# Formatos especiales: días desde 1899-12-30 (Excel) y celdas que ya son fechas
+SERIAL_EXCEL = 'serial_excel'
+OBJETOS_FECHA = 'objetos'
+
+# Seriales de Excel aceptados (1954-10-03 a 2119-01-10)
+RANGO_SERIAL = (20_000, 80_000)
+
+# Un número solo se toma como serial si el nombre de la columna lo sugiere
+PALABRAS_FECHA = {'fecha', 'fec', 'date', 'datetime', 'timestamp', 'created', 'updated'}
+
+# Prefiltro barato: valores con forma de fecha (antes de probar formatos)
+_FORMA_FECHA = re.compile(r'^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}')
+
+
+def _muestra(serie, tamano=MUESTRA_FECHAS):
+    """Hasta `tamano` valores no nulos repartidos a lo largo de la columna"""
+    valores = serie.dropna()
+    if len(valores) > tamano:
+        valores = valores.iloc[np.linspace(0, len(valores) - 1, tamano).astype(int)]
+    return valores
+
+
+def _nombre_sugiere_fecha(nombre):
+    partes = re.split(r'[^a-z]+', str(nombre).lower())
+    return any(parte in PALABRAS_FECHA for parte in partes)
+
+
+def _proporcion(parseadas, total):
+    return parseadas.notna().sum() / total if total else 0.0
+
+
+def infer_date_format(serie, nombre=None):
+    """
+    Formato de fecha de una columna según una muestra de sus valores.
+
+    Returns:
+        str | None: formato de FORMATOS_FECHA, SERIAL_EXCEL u OBJETOS_FECHA,
+        o None si la columna no es de fechas (o ya es datetime)
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return None
+    # Las categóricas (ver compact_dtypes) se muestrean como valores simples
+    muestra = _muestra(serie).astype(object)
+    if muestra.empty:
+        return None
+
+    if pd.api.types.is_numeric_dtype(serie):
+        if not _nombre_sugiere_fecha(nombre if nombre is not None else serie.name):
+            return None
+        valores = muestra.to_numpy(dtype=float)
+        en_rango = (valores >= RANGO_SERIAL[0]) & (valores <= RANGO_SERIAL[1])
+        return SERIAL_EXCEL if en_rango.mean() >= UMBRAL_FECHAS else None
+
+    if not (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)):
+        return None
+
+    # Celdas que ya son fechas (Excel con algunas celdas de texto)
+    son_fechas = muestra.map(lambda valor: isinstance(valor, (date, np.datetime64)))
+    if son_fechas.mean() >= UMBRAL_FECHAS:
+        return OBJETOS_FECHA
+
+    texto = muestra.astype(str).str.strip()
+    if texto.str.match(_FORMA_FECHA).mean() < UMBRAL_FECHAS:
+        return None
+
+    mejor, mejor_proporcion = None, 0.0
+    for formato in FORMATOS_FECHA:
+        proporcion = _proporcion(pd.to_datetime(texto, format=formato, errors='coerce'), len(texto))
+        if proporcion > mejor_proporcion:
+            mejor, mejor_proporcion = formato, proporcion
+            if proporcion == 1.0:
+                break
+    return mejor if mejor_proporcion >= UMBRAL_FECHAS else None
+
+
+def parse_date_column(serie, formato):
+    """Convierte la columna completa con el formato ya elegido (sin inferir por elemento)"""
+    if formato == SERIAL_EXCEL:
+        return pd.to_datetime(pd.to_numeric(serie, errors='coerce'), unit='D', origin='1899-12-30', errors='coerce')
+    if formato == OBJETOS_FECHA:
+        return pd.to_datetime(serie, errors='coerce', format='mixed')
+    # Las fechas se repiten mucho: se convierte cada valor distinto una sola vez
+    codigos, distintos = pd.factorize(serie)
+    texto = pd.Series(distintos, dtype=object).astype(str).str.strip()
+    fechas = pd.to_datetime(texto, format=formato, errors='coerce')
+    # Código -1 (nulo) -> NaT
+    return pd.Series(fechas.array.take(codigos, allow_fill=True), index=serie.index, name=serie.name)
+
+
+def detect_date_columns(df):
+    """
+    Columnas de fechas del DataFrame: las que ya son datetime y las de
+    texto o número cuyo contenido se interpreta como fechas.
+
+    Returns:
+        list: nombres de columnas
+    """
+    return [
+        col for posicion, col in enumerate(df.columns)
+        if pd.api.types.is_datetime64_any_dtype(df.iloc[:, posicion])
+        or infer_date_format(df.iloc[:, posicion], col) is not None
+    ]
+
+
+def source_key(unidad_id, columnas):
+    """Clave de caché de una fuente: la unidad y los encabezados del archivo"""
+    firma = hashlib.sha256(json.dumps([str(col) for col in columnas]).encode('utf-8')).hexdigest()[:32]
+    return f'datalab:formatos_fecha:{unidad_id}:{firma}'
+
+
+def parse_dates(df, fuente=None):
+    """
+    Convierte a datetime las columnas de fechas del DataFrame (en el lugar).
+
+    Con `fuente` (ver source_key), los formatos se toman de la caché y solo
+    se infieren las columnas nuevas o cuyo formato guardado ya no
+    interpreta los datos; el resultado se vuelve a guardar.
+
+    Returns:
+        dict: {columna: formato} de las columnas convertidas
+    """
+    guardados = None
+    if fuente:
+        try:
+            guardados = get_cache().get(fuente)
+        except Exception as e:
+            print(f"Error al leer la caché: {e}")
+    guardados = guardados or {}
+
+    formatos = {}
+    for posicion, col in enumerate(df.columns):
+        serie = df.iloc[:, posicion]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            continue
+        if str(col) in guardados:
+            formato = guardados[str(col)]
+            if formato is None:
+                # Planilla conocida: la columna no es de fechas
+                formatos[str(col)] = None
+                continue
+            convertida = parse_date_column(serie, formato)
+            no_nulos = serie.notna().sum()
+            if not no_nulos or _proporcion(convertida, no_nulos) >= UMBRAL_FECHAS:
+                df[col] = convertida
+                formatos[str(col)] = formato
+                continue
+
+        formato = infer_date_format(serie, col)
+        if formato is not None:
+            df[col] = parse_date_column(serie, formato)
+        # Una columna vacía no dice nada sobre la planilla: no se recuerda
+        if formato is not None or serie.notna().any():
+            formatos[str(col)] = formato
+
+    if fuente and formatos != guardados:
+        try:
+            get_cache().set(fuente, formatos)
+        except Exception as e:
+            print(f"Error al escribir la caché: {e}")
+    return {col: formato for col, formato in formatos.items() if formato is not None}
+
+
+# Columnas de texto con a lo sumo esta proporción de valores distintos (sobre
+# los no nulos) se guardan como category
+PROPORCION_CATEGORIA = 0.5
+
+# Filas de muestra para descartar textos de muchos valores distintos y para
+# estimar la memoria de las columnas de texto
+MUESTRA_COMPACTAR = 10_000
+
+
+def _memoria(serie):
+    """Bytes de la columna; los textos se estiman con una muestra (medirlos recorre cada valor)"""
+    if not pd.api.types.is_object_dtype(serie.dtype) or len(serie) <= MUESTRA_COMPACTAR:
+        return int(serie.memory_usage(deep=True, index=False))
+    posiciones = np.linspace(0, len(serie) - 1, MUESTRA_COMPACTAR).astype(int)
+    muestra = serie.iloc[posiciones].memory_usage(deep=True, index=False)
+    return int(muestra / MUESTRA_COMPACTAR * len(serie))
+
+
+def _compactar_columna(serie):
+    """Versión compacta de la columna, o None si no se puede reducir sin perder datos"""
+    dtype = serie.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype) \
+            or pd.api.types.is_datetime64_any_dtype(dtype):
+        return None
+
+    if pd.api.types.is_integer_dtype(dtype):
+        compacta = pd.to_numeric(serie, downcast='integer')
+        return compacta if compacta.dtype != dtype else None
+
+    if pd.api.types.is_float_dtype(dtype):
+        valores = serie.to_numpy(dtype=float, na_value=np.nan)
+        no_nulos = valores[~np.isnan(valores)]
+        if not len(no_nulos):
+            return None
+        if np.all(np.isfinite(no_nulos)) and np.all(no_nulos == np.round(no_nulos)) \
+                and np.abs(no_nulos).max() < 2 ** 53:
+            # Enteros guardados como float por tener nulos: entero nullable
+            return pd.to_numeric(serie.astype('Int64'), downcast='integer')
+        reducida = valores.astype(np.float32)
+        if dtype != np.float32 and np.array_equal(reducida.astype(float), valores, equal_nan=True):
+            return pd.Series(reducida, index=serie.index, name=serie.name)
+        return None
+
+    if pd.api.types.is_object_dtype(dtype):
+        tipo = pd.api.types.infer_dtype(serie, skipna=True)
+        if tipo == 'boolean':
+            return serie.astype('boolean')
+        if tipo == 'string':
+            # Con muchos distintos ya en la muestra no vale la pena contarlos todos
+            muestra = _muestra(serie, MUESTRA_COMPACTAR)
+            if muestra.nunique() > PROPORCION_CATEGORIA * len(muestra):
+                return None
+            no_nulos = int(serie.notna().sum())
+            if no_nulos and serie.nunique(dropna=True) <= PROPORCION_CATEGORIA * no_nulos:
+                return serie.astype('category')
+    return None
+
+
+def compact_dtypes(df):
+    """
+    Reduce la memoria del DataFrame (en el lugar) sin perder datos:
+    enteros al menor tipo que los contiene, enteros con nulos (float64 de
+    pandas) a enteros nullable, decimales a float32 cuando no cambia
+    ningún valor, textos de pocos valores distintos a category y
+    booleanos con nulos a boolean nullable.
+
+    Returns:
+        dict: {'bytes_before', 'bytes_after', 'columns': {columna: dtype nuevo}}
+        (la memoria de las columnas de texto es estimada)
+    """
+    antes = despues = 0
+    convertidas = {}
+    for posicion, col in enumerate(df.columns):
+        serie = df.iloc[:, posicion]
+        memoria = _memoria(serie)
+        antes += memoria
+        compacta = _compactar_columna(serie)
+        if compacta is None:
+            despues += memoria
+            continue
+        df[col] = compacta
+        convertidas[str(col)] = str(compacta.dtype)
+        despues += _memoria(compacta)
+    return {
+        'bytes_before': antes,
+        'bytes_after': despues,
+        'columns': convertidas
+    }
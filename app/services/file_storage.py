@@ -2,17 +2,161 @@
 Servicio de almacenamiento de archivos
 """
 import os
+import hashlib
+import tempfile
 from werkzeug.utils import secure_filename
 from flask import current_app
+from app.extensions import db
+from app.models.subida import Subida
 from app.services.utils import get_safe_filename
 
 
+# Tamaño de los bloques al copiar (y hashear) un archivo subido
+TAMANO_BLOQUE = 1024 * 1024
+
+# Subcarpeta de cada unidad con los archivos direccionados por contenido
+CARPETA_CONTENIDO = 'contenido'
+
+MEGABYTE = 1024 * 1024
+
+
 def allowed_file(filename):
     """Verifica si la extensión del archivo está permitida"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
+def verificar_cuota(unidad_id, tamano):
+    """
+    Verifica que guardar `tamano` bytes más no exceda la cuota de disco de
+    la unidad (DATALAB_CUOTA_UNIDAD_MB), que cuenta sus archivos y lo que
+    falta recibir de sus subidas por partes en curso.
+    
+    Raises:
+        ValueError: la unidad superaría su cuota
+    """
+    cuota = int(current_app.config.get('DATALAB_CUOTA_UNIDAD_MB', 5120) * MEGABYTE)
+    pendiente = db.session.query(db.func.coalesce(db.func.sum(Subida.tamano - Subida.recibido), 0)) \
+        .filter(Subida.unidad_id == unidad_id).scalar()
+    if disk_usage(unidad_id) + int(pendiente) + tamano > cuota:
+        raise ValueError(f'La unidad superaría su cuota de almacenamiento ({cuota / MEGABYTE:.0f}MB)')
+
+
+def _validar_archivo(file, unidad_id):
+    """Extensión permitida, tamaño máximo y cuota de la unidad"""
+    if not file or not allowed_file(file.filename):
+        raise ValueError("Tipo de archivo no permitido")
+    
+    max_size = current_app.config['MAX_CONTENT_LENGTH']
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)
+    
+    if file_size > max_size:
+        raise ValueError(f"Archivo demasiado grande. Máximo: {max_size / (1024*1024):.1f}MB")
+    verificar_cuota(unidad_id, file_size)
+
+
+def _copiar_con_hash(file, destino):
+    """Copia el archivo subido a `destino` por bloques, calculando su SHA-256 en la misma pasada"""
+    sha256 = hashlib.sha256()
+    with open(destino, 'wb') as salida:
+        while True:
+            bloque = file.stream.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            sha256.update(bloque)
+            salida.write(bloque)
+    return sha256.hexdigest()
+
+
+def _mover_a_contenido(temporal, contenido_hash, extension, unidad_folder):
+    """
+    Mueve un archivo ya hasheado a su ruta direccionada por contenido; si
+    ya existía un archivo idéntico, descarta el temporal.
+    
+    Returns:
+        tuple: (ruta_completa, ya_existia)
+    """
+    carpeta = os.path.join(unidad_folder, CARPETA_CONTENIDO, contenido_hash[:2])
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f'{contenido_hash}.{extension}')
+    if os.path.exists(ruta):
+        os.remove(temporal)
+        return ruta, True
+    os.replace(temporal, ruta)
+    return ruta, False
+
+
+def save_content_addressed(file, unidad_id):
+    """
+    Guarda un archivo subido direccionado por su contenido:
+    UPLOAD_FOLDER/<unidad>/contenido/<ab>/<sha256>.<ext>. El hash se calcula
+    mientras el archivo se escribe; si la unidad ya tenía un archivo
+    idéntico, se descarta la copia nueva y se devuelve el existente.
+    
+    Returns:
+        tuple: (ruta_completa, sha256, ya_existia)
+    """
+    _validar_archivo(file, unidad_id)
+    
+    unidad_folder = unidad_upload_folder(unidad_id)
+    extension = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+    
+    descriptor, temporal = tempfile.mkstemp(dir=unidad_folder, suffix='.subiendo')
+    os.close(descriptor)
+    try:
+        contenido_hash = _copiar_con_hash(file, temporal)
+        ruta, ya_existia = _mover_a_contenido(temporal, contenido_hash, extension, unidad_folder)
+        return ruta, contenido_hash, ya_existia
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def store_content_addressed(path, unidad_id, extension):
+    """
+    Igual que save_content_addressed para un archivo que ya está en disco
+    (por ejemplo, una subida por partes completa): lo hashea por bloques y
+    lo mueve a su ruta por contenido.
+    
+    Returns:
+        tuple: (ruta_completa, sha256, ya_existia)
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as entrada:
+        for bloque in iter(lambda: entrada.read(TAMANO_BLOQUE), b''):
+            sha256.update(bloque)
+    contenido_hash = sha256.hexdigest()
+    ruta, ya_existia = _mover_a_contenido(path, contenido_hash, extension.lower(), unidad_upload_folder(unidad_id))
+    return ruta, contenido_hash, ya_existia
+
+
+def unidad_upload_folder(unidad_id):
+    """Carpeta de archivos de la unidad (se crea si no existe)"""
+    unidad_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(unidad_id))
+    os.makedirs(unidad_folder, exist_ok=True)
+    return unidad_folder
+
+
+def disk_usage(unidad_id):
+    """Bytes que ocupan en disco los archivos de la unidad (originales, Parquet y subidas en curso)"""
+    total = 0
+    pendientes = [os.path.join(current_app.config['UPLOAD_FOLDER'], str(unidad_id))]
+    while pendientes:
+        try:
+            entradas = list(os.scandir(pendientes.pop()))
+        except FileNotFoundError:
+            continue
+        for entrada in entradas:
+            if entrada.is_dir(follow_symlinks=False):
+                pendientes.append(entrada.path)
+            elif entrada.is_file(follow_symlinks=False):
+                total += entrada.stat(follow_symlinks=False).st_size
+    return total
+
+
 def save_uploaded_file(file, unidad_id):
     """
     Guarda un archivo subido en el sistema de archivos.
@@ -24,20 +168,10 @@ def save_uploaded_file(file, unidad_id):
     Returns:
         tuple: (ruta_completa, nombre_seguro)
     """
-    if not file or not allowed_file(file.filename):
-        raise ValueError("Tipo de archivo no permitido")
+    _validar_archivo(file, unidad_id)
     
     # Obtener configuración
     upload_folder = current_app.config['UPLOAD_FOLDER']
-    max_size = current_app.config['MAX_CONTENT_LENGTH']
-    
-    # Verificar tamaño
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)
-    
-    if file_size > max_size:
-        raise ValueError(f"Archivo demasiado grande. Máximo: {max_size / (1024*1024):.1f}MB")
     
     # Crear directorio de unidad si no existe
     unidad_folder = os.path.join(upload_folder, str(unidad_id))
@@ -0,0 +1,211 @@
+"""
+Servicio de subidas por partes
+
+Los archivos más grandes que MAX_CONTENT_LENGTH se suben en bloques: se
+inicia la subida (nombre y tamaño), se envía cada bloque con su posición
+y, al terminar, el formulario de carga se envía con el id de la subida en
+lugar del archivo. Cada bloque se escribe directo al disco, sin pasar por
+memoria, y si la conexión se corta la subida se retoma desde `recibido`.
+
+Cada unidad tiene una cuota de disco (DATALAB_CUOTA_UNIDAD_MB) que cuenta
+sus archivos y las subidas en curso; las subidas abandonadas se descartan
+pasado DATALAB_SUBIDA_VIGENCIA_HORAS.
+"""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models.subida import Subida
+from app.services.file_storage import (
+    allowed_file, get_safe_filename, unidad_upload_folder, store_content_addressed, verificar_cuota,
+    TAMANO_BLOQUE, MEGABYTE
+)
+
+
+# Subcarpeta de cada unidad con las subidas en curso
+CARPETA_SUBIDAS = 'subidas'
+
+
+class SubidaInvalida(ValueError):
+    """Subida rechazada (tipo, tamaño o cuota); el mensaje se muestra al usuario"""
+
+
+class PosicionIncorrecta(SubidaInvalida):
+    """El bloque no empieza donde termina lo recibido; `recibido` indica desde dónde seguir"""
+
+    def __init__(self, recibido):
+        super().__init__(f'El bloque debe empezar en la posición {recibido}')
+        self.recibido = recibido
+
+
+def _bytes_config(clave, por_defecto):
+    return int(current_app.config.get(clave, por_defecto) * MEGABYTE)
+
+
+def descartar_subida(subida):
+    """Elimina la subida y su archivo parcial"""
+    if subida.ruta and os.path.exists(subida.ruta):
+        os.remove(subida.ruta)
+    db.session.delete(subida)
+    db.session.commit()
+
+
+def purgar_subidas_vencidas(unidad_id):
+    """Descarta las subidas de la unidad sin actividad dentro de la vigencia"""
+    horas = current_app.config.get('DATALAB_SUBIDA_VIGENCIA_HORAS', 24)
+    limite = datetime.utcnow() - timedelta(hours=horas)
+    for subida in Subida.query.filter(Subida.unidad_id == unidad_id, Subida.updated_at < limite).all():
+        descartar_subida(subida)
+
+
+def iniciar_subida(unidad_id, user_id, filename, tamano):
+    """
+    Registra una subida nueva y reserva su archivo parcial.
+
+    Raises:
+        SubidaInvalida: tipo no permitido, tamaño inválido o cuota excedida
+
+    Returns:
+        Subida: subida creada (recibido = 0)
+    """
+    if not filename or not allowed_file(filename):
+        raise SubidaInvalida('Tipo de archivo no permitido')
+    try:
+        tamano = int(tamano)
+    except (TypeError, ValueError):
+        raise SubidaInvalida('Tamaño de archivo inválido')
+    if tamano <= 0:
+        raise SubidaInvalida('El archivo está vacío')
+
+    maximo = _bytes_config('DATALAB_SUBIDA_MAX_MB', 1024)
+    if tamano > maximo:
+        raise SubidaInvalida(f'Archivo demasiado grande. Máximo: {maximo / MEGABYTE:.0f}MB')
+
+    purgar_subidas_vencidas(unidad_id)
+
+    # Cuota: lo que ya ocupa la unidad más lo que falta recibir de sus subidas
+    try:
+        verificar_cuota(unidad_id, tamano)
+    except ValueError as e:
+        raise SubidaInvalida(str(e))
+
+    carpeta = os.path.join(unidad_upload_folder(unidad_id), CARPETA_SUBIDAS)
+    os.makedirs(carpeta, exist_ok=True)
+    descriptor, ruta = tempfile.mkstemp(dir=carpeta, suffix='.parcial')
+    os.close(descriptor)
+
+    subida = Subida(
+        unidad_id=unidad_id,
+        user_id=user_id,
+        filename=filename[:255],
+        tamano=tamano,
+        recibido=0,
+        ruta=ruta
+    )
+    db.session.add(subida)
+    db.session.commit()
+    return subida
+
+
+def obtener_subida(subida_id, unidad_id, user_id):
+    """Subida del usuario en su unidad (None si no existe o es de otro)"""
+    return Subida.query.filter_by(id=subida_id, unidad_id=unidad_id, user_id=user_id).first()
+
+
+def agregar_bloque(subida, offset, stream):
+    """
+    Escribe un bloque en la posición `offset` leyendo `stream` por partes.
+    Solo se acepta el bloque que continúa lo recibido, de modo que un
+    reintento de un bloque ya guardado o un envío desordenado no corrompe
+    el archivo.
+
+    El bloque se recibe primero en un archivo temporal. Después se reclama
+    la posición con un UPDATE condicionado a `recibido = offset`, que
+    bloquea la fila (o la base, en SQLite) hasta el commit: de dos envíos
+    simultáneos del mismo bloque solo uno escribe en el archivo parcial y
+    el otro recibe PosicionIncorrecta.
+
+    Raises:
+        PosicionIncorrecta: offset distinto de lo recibido
+        SubidaInvalida: el bloque excede el tamaño declarado
+
+    Returns:
+        int: bytes recibidos en total
+    """
+    if offset != subida.recibido:
+        raise PosicionIncorrecta(subida.recibido)
+
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(subida.ruta), suffix='.bloque')
+    try:
+        posicion = offset
+        with os.fdopen(descriptor, 'wb') as salida:
+            while True:
+                bloque = stream.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                posicion += len(bloque)
+                if posicion > subida.tamano:
+                    raise SubidaInvalida('El bloque excede el tamaño declarado del archivo')
+                salida.write(bloque)
+
+        reclamada = Subida.query.filter_by(id=subida.id, recibido=offset).update(
+            {'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        if not reclamada:
+            db.session.rollback()
+            raise PosicionIncorrecta(db.session.query(Subida.recibido).filter_by(id=subida.id).scalar())
+        try:
+            with open(subida.ruta, 'r+b') as salida, open(temporal, 'rb') as entrada:
+                salida.seek(offset)
+                # Descarta lo escrito por un intento anterior que no llegó a registrarse
+                salida.truncate()
+                for bloque in iter(lambda: entrada.read(TAMANO_BLOQUE), b''):
+                    salida.write(bloque)
+            Subida.query.filter_by(id=subida.id).update({'recibido': posicion}, synchronize_session=False)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    db.session.refresh(subida)
+    return subida.recibido
+
+
+def finalizar_subida(subida, extensiones, por_contenido=True):
+    """
+    Entrega el archivo completo para procesarlo: lo mueve a la carpeta de
+    la unidad y elimina la subida.
+
+    Args:
+        subida: subida completa
+        extensiones: extensiones aceptadas por el formulario que la usa
+        por_contenido: guardarlo direccionado por contenido (datasets) o con
+            nombre propio, como save_uploaded_file (archivos temporales)
+
+    Raises:
+        SubidaInvalida: subida incompleta o tipo de archivo no aceptado
+
+    Returns:
+        tuple: (ruta_completa, sha256 o None, ya_existia)
+    """
+    if not subida.completa:
+        raise SubidaInvalida(f'La subida está incompleta ({subida.recibido} de {subida.tamano} bytes)')
+    extension = subida.filename.rsplit('.', 1)[1].lower()
+    if extension not in extensiones:
+        raise SubidaInvalida('Tipo de archivo no permitido para esta carga')
+
+    if por_contenido:
+        resultado = store_content_addressed(subida.ruta, subida.unidad_id, extension)
+    else:
+        safe_name = get_safe_filename(subida.filename, int(time.time()))
+        ruta = os.path.join(unidad_upload_folder(subida.unidad_id), safe_name)
+        os.replace(subida.ruta, ruta)
+        resultado = (ruta, None, False)
+    db.session.delete(subida)
+    db.session.commit()
+    return resultado
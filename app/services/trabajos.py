@@ -0,0 +1,460 @@
+"""
+Servicio de trabajos en segundo plano
+
+Los procesamientos pesados (archivos subidos al DataLab y de denuncias) se
+ejecutan en un pool de procesos local, sin broker externo. Cada trabajo se
+registra en la tabla `trabajos` con su estado, avance y resultado, que la
+página que lo lanzó consulta periódicamente.
+
+La cantidad de trabajos simultáneos por proceso web está acotada por
+TRABAJOS_MAX_PROCESOS; los que exceden ese número esperan en cola. Cada
+proceso del pool ejecuta un trabajo por vez y su memoria está limitada a
+TRABAJOS_MEMORIA_MB: un archivo que la excede hace fallar solo su trabajo
+(MemoryError) en lugar de que el sistema termine el contenedor.
+
+Una tarea puede repartir su propio trabajo entre los núcleos con
+en_paralelo (por ejemplo, una hoja de Excel por proceso): se crea un pool
+temporal de hasta TRABAJOS_PROCESOS_POR_TAREA procesos con la misma app y
+el mismo tope de memoria por proceso.
+
+Cada trabajo sin terminar tiene un latido (`actualizado_at`): lo renuevan
+el avance de la tarea y, cada INTERVALO_LATIDO segundos, el proceso web
+que lo envió al pool mientras el trabajo espera en cola o se ejecuta. Si
+ese proceso muere sin registrar el final (reinicio del worker, contenedor
+terminado), el latido se detiene y, al consultarlos, los trabajos sin
+latido durante TRABAJOS_VENCIMIENTO_MINUTOS se marcan como fallidos y se
+descartan sus archivos subidos.
+"""
+import json
+import multiprocessing
+import pickle
+import resource
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models.trabajo import Trabajo
+
+
+# Tareas registradas: tipo -> función(trabajo, avance, **parametros) -> dict de resultado
+TAREAS = {}
+
+# Acciones al completar: tipo -> función(trabajo), ejecutada en el proceso web que lanzó el trabajo
+AL_COMPLETAR = {}
+
+# Acciones al vencer: tipo -> función(trabajo), por ejemplo descartar el archivo subido
+AL_VENCER = {}
+
+# Segundos entre latidos de los trabajos enviados al pool por este proceso web
+INTERVALO_LATIDO = 60
+
+_ejecutor = None
+_lock = threading.Lock()
+
+# Trabajos enviados al pool por este proceso web que todavía no terminaron
+_en_pool = set()
+_hilo_latidos = None
+
+# App Flask de cada proceso del pool (se crea en el inicializador)
+_app_proceso = None
+
+
+# Mensaje para el usuario cuando una tarea supera TRABAJOS_MEMORIA_MB
+MENSAJE_SIN_MEMORIA = 'El archivo requiere más memoria de la permitida por trabajo; divídalo en archivos más chicos'
+
+# Mensaje para el usuario cuando un trabajo supera TRABAJOS_VENCIMIENTO_MINUTOS sin terminar
+MENSAJE_VENCIDO = 'El trabajo no terminó en el tiempo esperado (el proceso que lo ejecutaba se detuvo); vuelva a subir el archivo'
+
+
+class TrabajoFallido(Exception):
+    """Error esperado de una tarea; el mensaje se muestra al usuario"""
+
+
+def tarea(tipo, al_completar=None, al_vencer=None):
+    """
+    Decorador que registra una función como tarea ejecutable en segundo plano.
+
+    Args:
+        al_completar: función(trabajo) que el proceso web que lanzó el
+            trabajo ejecuta cuando este termina bien (por ejemplo, para
+            precalentar su caché en memoria, que el pool no comparte)
+        al_vencer: función(trabajo) que se ejecuta cuando el trabajo se da
+            por fallido por falta de latido (ver vencer_trabajos), para
+            descartar lo que la tarea hubiera limpiado al terminar
+    """
+    def registrar(funcion):
+        TAREAS[tipo] = funcion
+        if al_completar:
+            AL_COMPLETAR[tipo] = al_completar
+        if al_vencer:
+            AL_VENCER[tipo] = al_vencer
+        return funcion
+    return registrar
+
+
+def sin_avance(progreso, etapa=None):
+    """Callback de avance vacío, para usar las tareas fuera de un trabajo"""
+
+
+# ==================== POOL DE PROCESOS ====================
+
+def _config_serializable(config):
+    """Configuración de la app que se puede pasar a los procesos del pool"""
+    valores = {}
+    for clave, valor in config.items():
+        if not clave.isupper():
+            continue
+        try:
+            pickle.dumps(valor)
+        except Exception:
+            continue
+        valores[clave] = valor
+    return valores
+
+
+def _limitar_memoria(megabytes):
+    """Tope de memoria (espacio de direcciones) del proceso actual; 0 = sin tope"""
+    if not megabytes:
+        return
+    limite = int(megabytes) * 1024 * 1024
+    _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    resource.setrlimit(resource.RLIMIT_AS, (limite, maximo))
+
+
+def _iniciar_proceso(config):
+    """Inicializador de cada proceso del pool: crea la app con la misma configuración"""
+    global _app_proceso
+    _limitar_memoria(config.get('TRABAJOS_MEMORIA_MB'))
+    from app import create_app
+    _app_proceso = create_app(type('ConfigTrabajos', (), config))
+
+
+def _ejecutar_en_proceso(trabajo_id):
+    """Punto de entrada de un trabajo dentro del pool"""
+    with _app_proceso.app_context():
+        ejecutar_trabajo(trabajo_id)
+
+
+def _llamar_en_proceso(funcion, argumentos):
+    """Punto de entrada de una llamada de en_paralelo dentro de su pool"""
+    with _app_proceso.app_context():
+        return funcion(*argumentos)
+
+
+def _nuevo_pool(procesos):
+    return ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_iniciar_proceso,
+        initargs=(_config_serializable(current_app.config),)
+    )
+
+
+def get_ejecutor():
+    """Pool de procesos del proceso web actual (se crea al primer uso)"""
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = _nuevo_pool(current_app.config.get('TRABAJOS_MAX_PROCESOS', 2))
+        return _ejecutor
+
+
+def _descartar_ejecutor(ejecutor):
+    """Descarta un pool roto (un proceso murió) para que el próximo envío cree otro"""
+    global _ejecutor
+    with _lock:
+        if _ejecutor is ejecutor:
+            _ejecutor = None
+    ejecutor.shutdown(wait=False)
+
+
+def _completar(trabajo_id):
+    """Ejecuta la acción al completar del tipo del trabajo, si terminó bien"""
+    trabajo = db.session.get(Trabajo, trabajo_id, populate_existing=True)
+    if trabajo is None or trabajo.estado != Trabajo.COMPLETADO or trabajo.tipo not in AL_COMPLETAR:
+        return
+    try:
+        AL_COMPLETAR[trabajo.tipo](trabajo)
+    except Exception as e:
+        print(f"Error al completar el trabajo {trabajo_id}: {e}")
+
+
+def _completar_en_hilo(app, trabajo_id):
+    with app.app_context():
+        _completar(trabajo_id)
+
+
+def _al_terminar(app, trabajo_id, ejecutor, futuro):
+    """
+    Marca como fallido un trabajo cuyo proceso terminó de forma anormal; si
+    terminó bien, ejecuta su acción al completar en un hilo de este proceso.
+    """
+    _en_pool.discard(trabajo_id)
+    error = futuro.exception()
+    if error is None:
+        if AL_COMPLETAR:
+            threading.Thread(target=_completar_en_hilo, args=(app, trabajo_id), daemon=True).start()
+        return
+    mensaje = f'El proceso del trabajo terminó inesperadamente: {error}'
+    if isinstance(error, BrokenProcessPool):
+        _descartar_ejecutor(ejecutor)
+        # Una biblioteca nativa que no obtiene memoria bajo el tope termina el proceso en lugar de fallar
+        if app.config.get('TRABAJOS_MEMORIA_MB'):
+            mensaje = f'El proceso del trabajo terminó inesperadamente (posiblemente por falta de memoria). {MENSAJE_SIN_MEMORIA}'
+    with app.app_context():
+        _actualizar(trabajo_id, _sin_terminar(), estado=Trabajo.FALLIDO, finalizado_at=datetime.utcnow(),
+                    error=mensaje)
+
+
+def _latidos(app):
+    """Hilo del proceso web: renueva el latido de sus trabajos en cola o en ejecución en el pool"""
+    tabla = Trabajo.__table__
+    while True:
+        time.sleep(INTERVALO_LATIDO)
+        ids = list(_en_pool)
+        if not ids:
+            continue
+        try:
+            with app.app_context(), db.engine.begin() as conexion:
+                conexion.execute(tabla.update().where(tabla.c.id.in_(ids), _sin_terminar())
+                                 .values(actualizado_at=datetime.utcnow()))
+        except Exception as e:
+            print(f"Error al renovar el latido de los trabajos: {e}")
+
+
+def _iniciar_latidos(app):
+    """Inicia el hilo de latidos de este proceso web (una vez)"""
+    global _hilo_latidos
+    with _lock:
+        if _hilo_latidos is None or not _hilo_latidos.is_alive():
+            _hilo_latidos = threading.Thread(target=_latidos, args=(app,), daemon=True)
+            _hilo_latidos.start()
+
+
+def en_paralelo(funcion, llamadas, procesos=None):
+    """
+    Ejecuta funcion(*argumentos) para cada tupla de `llamadas` repartiendo
+    las llamadas en un pool de procesos temporal. La función debe estar
+    definida a nivel de módulo y sus argumentos y resultado deben poder
+    serializarse (pickle); cada proceso tiene su app (current_app) y el
+    tope TRABAJOS_MEMORIA_MB. Con un solo proceso o una sola llamada se
+    ejecuta en el proceso actual, sin el costo de iniciar el pool.
+
+    Args:
+        procesos: máximo de procesos (por defecto TRABAJOS_PROCESOS_POR_TAREA)
+
+    Yields:
+        tuple: (índice de la llamada, resultado, excepción o None), en el
+        orden en que terminan
+    """
+    llamadas = list(llamadas)
+    if procesos is None:
+        procesos = current_app.config.get('TRABAJOS_PROCESOS_POR_TAREA', 4)
+    procesos = max(1, min(procesos or 1, len(llamadas)))
+
+    if procesos == 1:
+        for indice, argumentos in enumerate(llamadas):
+            try:
+                yield indice, funcion(*argumentos), None
+            except Exception as e:
+                yield indice, None, e
+        return
+
+    pool = _nuevo_pool(procesos)
+    try:
+        futuros = {pool.submit(_llamar_en_proceso, funcion, argumentos): indice
+                   for indice, argumentos in enumerate(llamadas)}
+        for futuro in as_completed(futuros):
+            error = futuro.exception()
+            yield futuros[futuro], None if error else futuro.result(), error
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ==================== TRABAJOS ====================
+
+def _sin_terminar():
+    """Condición SQL: trabajo pendiente o en curso"""
+    return Trabajo.__table__.c.estado.in_([Trabajo.PENDIENTE, Trabajo.EN_CURSO])
+
+
+def _actualizar(trabajo_id, condicion=None, **valores):
+    """
+    Actualiza la fila del trabajo en una conexión propia, para no
+    interferir con la transacción de la tarea, y renueva su latido.
+
+    Args:
+        condicion: condición SQL adicional (por ejemplo, sobre el estado
+            actual); si no se cumple, la fila no cambia
+
+    Returns:
+        bool: True si la fila se actualizó
+    """
+    tabla = Trabajo.__table__
+    valores.setdefault('actualizado_at', datetime.utcnow())
+    consulta = tabla.update().where(tabla.c.id == trabajo_id)
+    if condicion is not None:
+        consulta = consulta.where(condicion)
+    with db.engine.begin() as conexion:
+        return conexion.execute(consulta.values(**valores)).rowcount > 0
+
+
+def encolar_trabajo(tipo, unidad_id, user_id, **parametros):
+    """
+    Registra un trabajo y lo envía al pool de procesos.
+
+    Los parámetros deben ser serializables a JSON (por ejemplo, la ruta del
+    archivo ya guardado, nunca el archivo del request).
+
+    Returns:
+        Trabajo: el trabajo registrado (pendiente, o terminado si
+        TRABAJOS_SINCRONICOS está activo)
+    """
+    if tipo not in TAREAS:
+        raise ValueError(f'Tarea desconocida: {tipo}')
+
+    trabajo = Trabajo(unidad_id=unidad_id, user_id=user_id, tipo=tipo,
+                      estado=Trabajo.PENDIENTE, etapa='En cola')
+    trabajo.set_parametros(parametros)
+    db.session.add(trabajo)
+    db.session.commit()
+
+    if current_app.config.get('TRABAJOS_SINCRONICOS'):
+        ejecutar_trabajo(trabajo.id)
+        _completar(trabajo.id)
+        db.session.refresh(trabajo)
+        return trabajo
+
+    app = current_app._get_current_object()
+    _en_pool.add(trabajo.id)
+    _iniciar_latidos(app)
+    ejecutor = get_ejecutor()
+    try:
+        futuro = ejecutor.submit(_ejecutar_en_proceso, trabajo.id)
+    except BrokenProcessPool:
+        _descartar_ejecutor(ejecutor)
+        ejecutor = get_ejecutor()
+        futuro = ejecutor.submit(_ejecutar_en_proceso, trabajo.id)
+    futuro.add_done_callback(lambda f, trabajo_id=trabajo.id: _al_terminar(app, trabajo_id, ejecutor, f))
+
+    return trabajo
+
+
+def ejecutar_trabajo(trabajo_id):
+    """
+    Ejecuta la tarea de un trabajo pendiente y registra su resultado. Cada
+    cambio de estado es condicional al estado anterior: un trabajo que se
+    dio por vencido (ver vencer_trabajos) no se ejecuta ni se marca como
+    completado.
+    """
+    tabla = Trabajo.__table__
+    en_curso = tabla.c.estado == Trabajo.EN_CURSO
+    if not _actualizar(trabajo_id, tabla.c.estado == Trabajo.PENDIENTE, estado=Trabajo.EN_CURSO,
+                       iniciado_at=datetime.utcnow(), etapa='Iniciando'):
+        return
+    trabajo = db.session.get(Trabajo, trabajo_id, populate_existing=True)
+
+    ultimo = {}
+
+    def avance(progreso, etapa=None):
+        valores = {'progreso': max(0, min(100, int(progreso)))}
+        if etapa:
+            valores['etapa'] = etapa[:200]
+        if valores != ultimo:
+            _actualizar(trabajo_id, en_curso, **valores)
+            ultimo.clear()
+            ultimo.update(valores)
+
+    try:
+        resultado = TAREAS[trabajo.tipo](trabajo, avance, **trabajo.get_parametros())
+    except Exception as e:
+        db.session.rollback()
+        if isinstance(e, MemoryError):
+            e = TrabajoFallido(MENSAJE_SIN_MEMORIA)
+        elif not isinstance(e, TrabajoFallido):
+            traceback.print_exc()
+        _actualizar(trabajo_id, en_curso, estado=Trabajo.FALLIDO, finalizado_at=datetime.utcnow(), error=str(e))
+        return
+
+    if not _actualizar(trabajo_id, en_curso, estado=Trabajo.COMPLETADO, progreso=100, etapa='Completado',
+                       finalizado_at=datetime.utcnow(),
+                       resultado_json=json.dumps(resultado or {}, default=str, ensure_ascii=False)):
+        print(f"El trabajo {trabajo_id} terminó después de darse por vencido; no se marca como completado")
+
+
+def vencer_trabajos():
+    """
+    Marca como fallidos los trabajos pendientes o en curso sin latido
+    durante más de TRABAJOS_VENCIMIENTO_MINUTOS (el proceso web que los
+    lanzó murió sin registrar el final; si no, bloquearían nuevas subidas
+    del usuario) y ejecuta su acción al vencer, que descarta los archivos
+    subidos.
+
+    Returns:
+        int: cantidad de trabajos marcados
+    """
+    minutos = current_app.config.get('TRABAJOS_VENCIMIENTO_MINUTOS', 10)
+    if not minutos:
+        return 0
+    limite = datetime.utcnow() - timedelta(minutes=minutos)
+    tabla = Trabajo.__table__
+    sin_latido = db.and_(
+        _sin_terminar(),
+        db.func.coalesce(tabla.c.actualizado_at, tabla.c.iniciado_at, tabla.c.created_at) < limite
+    )
+    ids = [fila.id for fila in db.session.execute(db.select(tabla.c.id).where(sin_latido))]
+
+    vencidos = 0
+    for trabajo_id in ids:
+        # La condición se repite: el latido pudo renovarse después de la consulta
+        if not _actualizar(trabajo_id, sin_latido, estado=Trabajo.FALLIDO, finalizado_at=datetime.utcnow(),
+                           error=MENSAJE_VENCIDO):
+            continue
+        vencidos += 1
+        trabajo = db.session.get(Trabajo, trabajo_id, populate_existing=True)
+        if trabajo.tipo in AL_VENCER:
+            try:
+                AL_VENCER[trabajo.tipo](trabajo)
+            except Exception as e:
+                print(f"Error al descartar los archivos del trabajo vencido {trabajo_id}: {e}")
+    return vencidos
+
+
+def obtener_trabajo(trabajo_id, unidad_id, user_id):
+    """Trabajo del usuario (dentro de su unidad), o None"""
+    vencer_trabajos()
+    return Trabajo.query.filter_by(id=trabajo_id, unidad_id=unidad_id, user_id=user_id).first()
+
+
+def trabajo_activo(user_id, tipos):
+    """Último trabajo sin terminar del usuario entre los tipos dados, o None"""
+    vencer_trabajos()
+    return Trabajo.query.filter(
+        Trabajo.user_id == user_id,
+        Trabajo.tipo.in_(tipos),
+        Trabajo.estado.in_([Trabajo.PENDIENTE, Trabajo.EN_CURSO])
+    ).order_by(Trabajo.id.desc()).first()
+
+
+def trabajo_pendiente_con(unidad_id, tipo, **parametros):
+    """
+    Trabajo sin terminar de la unidad, del tipo dado y con esos parámetros
+    (por ejemplo, el mismo archivo ya en proceso), o None.
+    """
+    vencer_trabajos()
+    pendientes = Trabajo.query.filter(
+        Trabajo.unidad_id == unidad_id,
+        Trabajo.tipo == tipo,
+        Trabajo.estado.in_([Trabajo.PENDIENTE, Trabajo.EN_CURSO])
+    ).order_by(Trabajo.id.desc())
+    for trabajo in pendientes:
+        actuales = trabajo.get_parametros()
+        if all(actuales.get(clave) == valor for clave, valor in parametros.items()):
+            return trabajo
+    return None
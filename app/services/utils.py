@@ -41,21 +41,13 @@ def normalize_column_name(name):
 
 def detect_date_columns(df):
     """
-    Detecta columnas que parecen fechas basándose en el nombre.
+    Detecta columnas de fechas por su contenido (ver datalab_types).
     
     Returns:
-        list: Lista de nombres de columnas que parecen fechas
+        list: Lista de nombres de columnas que son fechas
     """
-    date_keywords = ['fecha', 'date', 'datetime', 'hora', 'time', 'timestamp', 
-                     'inicio', 'fin', 'desde', 'hasta', 'created', 'updated']
-    
-    date_columns = []
-    for col in df.columns:
-        col_lower = str(col).lower()
-        if any(keyword in col_lower for keyword in date_keywords):
-            date_columns.append(col)
-    
-    return date_columns
+    from app.services.datalab_types import detect_date_columns as detectar
+    return detectar(df)
 
 
 def get_safe_filename(original_filename, timestamp=None):
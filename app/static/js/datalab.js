@@ -2,51 +2,281 @@
 
 document.addEventListener('DOMContentLoaded', function() {
     initUploadForm();
+    initTrabajoActivo();
 });
 
+// Intervalo de consulta del avance de un trabajo en segundo plano (ms)
+const INTERVALO_TRABAJO = 1500;
+
+// Reintentos de un bloque de una subida por partes antes de abandonar
+const REINTENTOS_BLOQUE = 5;
+
 // Formulario de subida
 function initUploadForm() {
     const uploadForm = document.getElementById('uploadForm');
-    const uploadProgress = document.getElementById('uploadProgress');
     const submitBtn = document.getElementById('submitBtn');
-    
+
     if (!uploadForm) return;
-    
-    uploadForm.addEventListener('submit', function(e) {
+
+    uploadForm.addEventListener('submit', async function(e) {
+        e.preventDefault();
+
         // Validar archivo
         const fileInput = uploadForm.querySelector('input[type="file"]');
         if (!fileInput || !fileInput.files || fileInput.files.length === 0) {
-            e.preventDefault();
             alert('Por favor seleccione un archivo');
             return;
         }
-        
-        // Mostrar progreso
-        if (uploadProgress) {
-            uploadProgress.classList.remove('d-none');
-        }
-        
+
+        const textoBoton = submitBtn ? submitBtn.innerHTML : '';
         if (submitBtn) {
             submitBtn.disabled = true;
-            submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Procesando...';
+            submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Subiendo...';
+        }
+
+        // Enviar los archivos; el servidor responde enseguida con el trabajo creado
+        const files = Array.from(fileInput.files);
+        try {
+            const formData = new FormData(uploadForm);
+
+            // Archivos grandes: se suben antes por partes y el formulario lleva solo los ids de las subidas.
+            // Se decide por el total de la selección: varios archivos chicos también pueden superar el límite del envío
+            const tamanoBloque = Number(uploadForm.dataset.tamanoBloque);
+            const grandes = uploadForm.dataset.urlSubidas ? archivosPorPartes(files, tamanoBloque) : [];
+            if (grandes.length) {
+                const subidaIds = [];
+                for (const file of grandes) {
+                    subidaIds.push(await subirPorPartes(uploadForm, file));
+                }
+                formData.delete(fileInput.name);
+                files.filter(file => !grandes.includes(file)).forEach(file => formData.append(fileInput.name, file));
+                formData.set('subida_id', subidaIds.join(','));
+                if (submitBtn) {
+                    submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Enviando...';
+                }
+            }
+
+            const response = await fetch(uploadForm.action, {
+                method: 'POST',
+                body: formData,
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            });
+            const data = await response.json();
+            if (!response.ok || !data.success) {
+                throw new Error(data.message || 'No se pudo subir el archivo');
+            }
+            // Las subidas por partes (si las hubo) ya se usaron; un reenvío fallido las conserva para reintentar
+            files.forEach(olvidarSubida);
+
+            // Archivo ya cargado: se abre el dataset existente
+            if (data.duplicado) {
+                mostrarMensajeTrabajo('info', data.message);
+                setTimeout(() => { window.location.href = data.url; }, 1500);
+                return;
+            }
+
+            if (submitBtn) {
+                submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Procesando...';
+            }
+            seguirTrabajo(data.url_estado, function() {
+                if (submitBtn) {
+                    submitBtn.disabled = false;
+                    submitBtn.innerHTML = textoBoton;
+                }
+            });
+        } catch (error) {
+            mostrarMensajeTrabajo('danger', error.message);
+            if (submitBtn) {
+                submitBtn.disabled = false;
+                submitBtn.innerHTML = textoBoton;
+            }
         }
-        
-        // El formulario se enviará normalmente
     });
-    
+
     // Validar tamaño de archivo
     const fileInput = uploadForm.querySelector('input[type="file"]');
     if (fileInput) {
         fileInput.addEventListener('change', function() {
-            const file = this.files[0];
-            if (file) {
-                const maxSize = 20 * 1024 * 1024; // 20MB
-                if (file.size > maxSize) {
-                    alert('El archivo es demasiado grande. Máximo: 20MB');
-                    this.value = '';
-                }
+            const maxSize = Number(uploadForm.dataset.maxBytes);
+            if (maxSize && Array.from(this.files).some(file => file.size > maxSize)) {
+                alert('El archivo es demasiado grande. Máximo: ' + Math.round(maxSize / (1024 * 1024)) + 'MB');
+                this.value = '';
             }
         });
     }
 }
 
+// Sube un archivo por partes y devuelve el id de la subida. Si una subida
+// anterior del mismo archivo quedó cortada, la retoma desde lo recibido.
+async function subirPorPartes(form, file) {
+    const csrf = form.querySelector('input[name="csrf_token"]');
+    const headers = { 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': csrf ? csrf.value : '' };
+
+    let subida = null;
+    let urlSubida = localStorage.getItem(claveSubida(file));
+    let tamanoBloque = Number(form.dataset.tamanoBloque);
+    if (urlSubida) {
+        const response = await fetch(urlSubida, { headers: headers });
+        if (response.ok) subida = (await response.json()).subida;
+    }
+    if (!subida) {
+        const response = await fetch(form.dataset.urlSubidas, {
+            method: 'POST',
+            headers: Object.assign({ 'Content-Type': 'application/json' }, headers),
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const data = await response.json();
+        if (!response.ok || !data.success) throw new Error(data.message || 'No se pudo iniciar la subida');
+        subida = data.subida;
+        urlSubida = data.url;
+        tamanoBloque = data.tamano_bloque;
+        localStorage.setItem(claveSubida(file), urlSubida);
+    }
+
+    const contenedor = document.getElementById('trabajoProgreso');
+    if (contenedor) contenedor.classList.remove('d-none');
+
+    let recibido = subida.recibido;
+    let intentos = 0;
+    while (recibido < file.size) {
+        actualizarAvanceTrabajo(Math.floor(recibido * 100 / file.size), 'Subiendo archivo');
+        const bloque = file.slice(recibido, Math.min(recibido + tamanoBloque, file.size));
+        let response, data;
+        try {
+            response = await fetch(`${urlSubida}?offset=${recibido}`, {
+                method: 'PUT',
+                headers: Object.assign({ 'Content-Type': 'application/octet-stream' }, headers),
+                body: bloque
+            });
+            data = await response.json();
+        } catch (error) {
+            // Conexión cortada: se reintenta con espera creciente
+            if (++intentos > REINTENTOS_BLOQUE) {
+                throw new Error('Se interrumpió la subida; vuelva a enviar el archivo para continuar desde donde quedó');
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** intentos));
+            continue;
+        }
+        if (response.status === 409) {
+            // El servidor tiene otra posición (por ejemplo, un bloque que llegó pero cuya respuesta se perdió)
+            recibido = data.recibido;
+            continue;
+        }
+        if (!response.ok || !data.success) {
+            olvidarSubida(file);
+            throw new Error(data.message || 'La subida fue rechazada');
+        }
+        intentos = 0;
+        recibido = data.subida.recibido;
+    }
+    actualizarAvanceTrabajo(100, 'Archivo subido');
+    return subida.id;
+}
+
+// Archivos que se suben por partes para que el resto quepa en un solo envío de
+// hasta `limite` bytes: los más grandes primero, en el orden de la selección
+function archivosPorPartes(files, limite) {
+    let total = files.reduce((suma, file) => suma + file.size, 0);
+    const grandes = [];
+    for (const file of files.slice().sort((a, b) => b.size - a.size)) {
+        if (total <= limite) break;
+        grandes.push(file);
+        total -= file.size;
+    }
+    return files.filter(file => grandes.includes(file));
+}
+
+function claveSubida(file) {
+    return `datalab-subida:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+function olvidarSubida(file) {
+    localStorage.removeItem(claveSubida(file));
+}
+
+// Trabajo en curso al cargar la página (por ejemplo, después de recargar)
+function initTrabajoActivo() {
+    const contenedor = document.getElementById('trabajoProgreso');
+    if (contenedor && contenedor.dataset.urlEstado) {
+        const submitBtn = document.getElementById('submitBtn');
+        if (submitBtn) submitBtn.disabled = true;
+        seguirTrabajo(contenedor.dataset.urlEstado, function() {
+            if (submitBtn) submitBtn.disabled = false;
+        });
+    }
+}
+
+// Consulta periódicamente el estado de un trabajo y actualiza la barra de avance
+function seguirTrabajo(urlEstado, alTerminar) {
+    const contenedor = document.getElementById('trabajoProgreso');
+    if (contenedor) contenedor.classList.remove('d-none');
+    mostrarMensajeTrabajo(null, '');
+
+    async function consultar() {
+        let trabajo;
+        try {
+            const response = await fetch(urlEstado, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+            trabajo = await response.json();
+            if (!response.ok) throw new Error(trabajo.message || response.statusText);
+        } catch (error) {
+            mostrarMensajeTrabajo('danger', 'No se pudo consultar el avance: ' + error.message);
+            if (alTerminar) alTerminar();
+            return;
+        }
+
+        actualizarAvanceTrabajo(trabajo.progreso, trabajo.etapa);
+
+        if (trabajo.estado === 'completado') {
+            const resultado = trabajo.resultado || {};
+            let mensaje = escaparHtml(resultado.mensaje || 'Proceso completado');
+            if (resultado.advertencia) mensaje += '<br><small>' + escaparHtml(resultado.advertencia) + '</small>';
+            if (trabajo.url) mensaje += ` <a href="${trabajo.url}" class="alert-link">Continuar</a>`;
+            mostrarMensajeTrabajo('success', mensaje, true);
+            if (alTerminar) alTerminar();
+            if (trabajo.url) setTimeout(() => { window.location.href = trabajo.url; }, 2000);
+        } else if (trabajo.estado === 'fallido') {
+            mostrarMensajeTrabajo('danger', 'Error: ' + (trabajo.error || 'el procesamiento falló'));
+            if (alTerminar) alTerminar();
+        } else {
+            setTimeout(consultar, INTERVALO_TRABAJO);
+        }
+    }
+
+    consultar();
+}
+
+function actualizarAvanceTrabajo(progreso, etapa) {
+    const barra = document.getElementById('trabajoBarra');
+    const porcentaje = document.getElementById('trabajoPorcentaje');
+    const etapaEl = document.getElementById('trabajoEtapa');
+    if (barra) barra.style.width = `${progreso || 0}%`;
+    if (porcentaje) porcentaje.textContent = `${progreso || 0}%`;
+    if (etapaEl && etapa) etapaEl.textContent = etapa;
+}
+
+function mostrarMensajeTrabajo(tipo, mensaje, html) {
+    const contenedor = document.getElementById('trabajoMensaje');
+    if (!contenedor) {
+        if (mensaje) alert(mensaje);
+        return;
+    }
+    if (!tipo) {
+        contenedor.innerHTML = '';
+        return;
+    }
+    const alerta = document.createElement('div');
+    alerta.className = `alert alert-${tipo} mb-0`;
+    if (html) {
+        alerta.innerHTML = mensaje;
+    } else {
+        alerta.textContent = mensaje;
+    }
+    contenedor.replaceChildren(alerta);
+    document.getElementById('trabajoProgreso')?.classList.remove('d-none');
+}
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto;
+    return div.innerHTML;
+}
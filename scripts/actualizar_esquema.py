@@ -0,0 +1,116 @@
+"""
+Actualiza el esquema de una base de datos existente al de los modelos.
+
+`db.create_all()` (create_admin.py) crea las tablas que faltan pero no
+modifica las que ya existen. Este script crea las tablas nuevas y agrega
+a las existentes las columnas, claves foráneas e índices que definen los
+modelos y la base todavía no tiene, por ejemplo:
+
+    denuncias_web: carga_id, hash_fila e índices de sincronización y paginación
+    datasets:      content_hash, parquet_path, schema_json
+
+Solo agrega: no elimina ni modifica columnas. Se puede ejecutar varias veces.
+
+Uso (desde la raíz del proyecto, con la misma configuración .env de la app):
+    python scripts/actualizar_esquema.py            # aplica los cambios
+    python scripts/actualizar_esquema.py --mostrar  # solo muestra el SQL
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text  # noqa: E402
+from sqlalchemy.schema import CreateIndex  # noqa: E402
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+def tablas_faltantes(inspector):
+    """Tablas de los modelos que la base no tiene (las crea db.create_all)"""
+    existentes = set(inspector.get_table_names())
+    return [tabla.name for tabla in db.metadata.sorted_tables if tabla.name not in existentes]
+
+
+def sentencias_pendientes(engine, inspector):
+    """
+    Sentencias ALTER TABLE / CREATE INDEX para llevar las tablas existentes
+    al esquema de los modelos.
+
+    Returns:
+        tuple: (lista de sentencias SQL, lista de advertencias)
+    """
+    dialecto = engine.dialect
+    nombre = dialecto.identifier_preparer.quote
+    existentes = set(inspector.get_table_names())
+    sentencias = []
+    advertencias = []
+
+    for tabla in db.metadata.sorted_tables:
+        if tabla.name not in existentes:
+            continue
+
+        columnas = {columna['name'] for columna in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in columnas:
+                continue
+            if not columna.nullable and columna.server_default is None:
+                advertencias.append(f'{tabla.name}.{columna.name}: columna obligatoria sin valor por defecto, '
+                                    'agregarla manualmente')
+                continue
+            tipo = columna.type.compile(dialect=dialecto)
+            sentencias.append(f'ALTER TABLE {nombre(tabla.name)} ADD COLUMN {nombre(columna.name)} {tipo} NULL')
+            # SQLite no admite agregar restricciones a una tabla existente
+            if dialecto.name == 'sqlite':
+                continue
+            for clave in columna.foreign_keys:
+                destino = clave.column
+                sentencias.append(
+                    f'ALTER TABLE {nombre(tabla.name)} ADD CONSTRAINT {nombre(f"fk_{tabla.name}_{columna.name}")} '
+                    f'FOREIGN KEY ({nombre(columna.name)}) '
+                    f'REFERENCES {nombre(destino.table.name)} ({nombre(destino.name)})'
+                )
+
+        indices = {indice['name'] for indice in inspector.get_indexes(tabla.name)}
+        for indice in sorted(tabla.indexes, key=lambda i: i.name):
+            if indice.name not in indices:
+                sentencias.append(str(CreateIndex(indice).compile(dialect=dialecto)))
+
+    return sentencias, advertencias
+
+
+def actualizar_esquema(mostrar=False):
+    """Crea las tablas nuevas y aplica (o muestra) los cambios a las existentes"""
+    app = create_app()
+    with app.app_context():
+        inspector = inspect(db.engine)
+        nuevas = tablas_faltantes(inspector)
+        sentencias, advertencias = sentencias_pendientes(db.engine, inspector)
+
+        for tabla in nuevas:
+            print(f'-- Tabla nueva (db.create_all): {tabla}')
+        for sentencia in sentencias:
+            print(f'{sentencia};')
+        for advertencia in advertencias:
+            print(f'⚠️  {advertencia}')
+        if not nuevas and not sentencias:
+            print('✓ El esquema ya está actualizado')
+            return True
+        if mostrar:
+            return True
+
+        # Primero las tablas nuevas: las columnas agregadas pueden referenciarlas
+        db.create_all()
+        with db.engine.begin() as conexion:
+            for sentencia in sentencias:
+                conexion.execute(text(sentencia))
+        print(f'✓ Esquema actualizado: {len(nuevas)} tablas nuevas, {len(sentencias)} cambios')
+        return not advertencias
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mostrar', action='store_true', help='Solo mostrar el SQL, sin aplicarlo')
+    argumentos = parser.parse_args()
+    sys.exit(0 if actualizar_esquema(argumentos.mostrar) else 1)
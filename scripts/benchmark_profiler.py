@@ -0,0 +1,141 @@
+"""
+Benchmark del perfilador de datasets de DataLab.
+
+Compara `profile_dataset` con la implementación anterior (columna por
+columna, con nulos y distintos calculados dos veces) sobre un DataFrame
+sintético, y verifica que ambos produzcan el mismo perfil. Informa además
+el tiempo del perfil aproximado (sketches) y su error en la cantidad de
+valores distintos.
+
+Uso (desde la raíz del proyecto):
+    python scripts/benchmark_profiler.py --filas 500000 --columnas 60
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.datalab_profiler import profile_dataset  # noqa: E402
+from app.services.utils import detect_date_columns  # noqa: E402
+
+
+def profile_dataset_anterior(df):
+    """Implementación anterior del perfilador (referencia)"""
+    profile = {
+        'columns': {},
+        'summary': {
+            'total_rows': len(df),
+            'total_columns': len(df.columns),
+            'total_nulls': int(df.isnull().sum().sum())
+        }
+    }
+    date_columns = detect_date_columns(df)
+    for col in df.columns:
+        col_data = df[col]
+        col_profile = {
+            'type': str(col_data.dtype),
+            'nulls': int(col_data.isnull().sum()),
+            'null_percentage': float((col_data.isnull().sum() / len(df)) * 100) if len(df) > 0 else 0.0,
+            'unique_count': int(col_data.nunique())
+        }
+        if col in date_columns:
+            try:
+                pd.to_datetime(col_data.dropna(), errors='coerce')
+                col_profile['type'] = 'datetime64[ns]'
+                col_profile['is_date'] = True
+            except Exception:
+                pass
+        if pd.api.types.is_numeric_dtype(col_data):
+            col_profile['min'] = float(col_data.min()) if not col_data.empty else None
+            col_profile['max'] = float(col_data.max()) if not col_data.empty else None
+            col_profile['mean'] = float(col_data.mean()) if not col_data.empty else None
+            col_profile['median'] = float(col_data.median()) if not col_data.empty else None
+            col_profile['std'] = float(col_data.std()) if not col_data.empty else None
+        if col_data.nunique() <= 20 or not pd.api.types.is_numeric_dtype(col_data):
+            value_counts = col_data.value_counts().head(10)
+            col_profile['top_values'] = {str(k): int(v) for k, v in value_counts.items()}
+        profile['columns'][col] = col_profile
+    return profile
+
+
+def generar_dataframe(filas, columnas, semilla=0):
+    """DataFrame sintético con la mezcla típica de un Excel: números, categorías, textos y fechas"""
+    rng = np.random.default_rng(semilla)
+    datos = {}
+    for i in range(columnas):
+        tipo = i % 6
+        if tipo == 0:
+            valores = rng.normal(100, 15, filas)
+            valores[rng.random(filas) < 0.05] = np.nan
+            datos[f'monto_{i}'] = valores
+        elif tipo == 1:
+            datos[f'cantidad_{i}'] = rng.integers(0, 15, filas)
+        elif tipo == 2:
+            datos[f'categoria_{i}'] = rng.choice(['A', 'B', 'C', 'D', None], filas)
+        elif tipo == 3:
+            datos[f'codigo_{i}'] = pd.Series(rng.integers(0, filas, filas)).astype(str).radd('X').values
+        elif tipo == 4:
+            datos[f'fecha_{i}'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, filas), unit='D')
+        else:
+            datos[f'id_{i}'] = np.arange(filas)
+    return pd.DataFrame(datos)
+
+
+def iguales(a, b):
+    """Compara perfiles tolerando NaN y diferencias de redondeo en flotantes"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(iguales(a[k], b[k]) for k in a)
+    if isinstance(a, float) and isinstance(b, float):
+        return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+    return a == b
+
+
+def medir(funcion, df, repeticiones):
+    """Mejor tiempo de `repeticiones` ejecuciones"""
+    mejor = None
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(df)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=500_000)
+    parser.add_argument('--columnas', type=int, default=60)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'Generando DataFrame de {args.filas:,} x {args.columnas}...')
+    df = generar_dataframe(args.filas, args.columnas)
+
+    tiempo_anterior, perfil_anterior = medir(profile_dataset_anterior, df, args.repeticiones)
+    tiempo_nuevo, perfil_nuevo = medir(profile_dataset, df, args.repeticiones)
+
+    print(f'Perfilador anterior: {tiempo_anterior:8.2f} s')
+    print(f'Perfilador actual:   {tiempo_nuevo:8.2f} s')
+    print(f'Mejora:              {tiempo_anterior / tiempo_nuevo:8.2f}x')
+    print(f'Mismo perfil:        {"sí" if iguales(perfil_anterior, perfil_nuevo) else "NO"}')
+
+    tiempo_aproximado, perfil_aproximado = medir(
+        lambda datos: profile_dataset(datos, approximate=True), df, args.repeticiones
+    )
+    error_distintos = max(
+        abs(perfil_aproximado['columns'][col]['unique_count'] - info['unique_count']) / max(info['unique_count'], 1)
+        for col, info in perfil_nuevo['columns'].items()
+    )
+    print(f'Perfil aproximado:   {tiempo_aproximado:8.2f} s')
+    print(f'Error máx. únicos:   {error_distintos:8.2%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""
+Configuración común de las pruebas: app con SQLite en memoria
+"""
+import pytest
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+
+class ConfigPruebas(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    CACHE_BACKEND = 'memoria'
+
+
+@pytest.fixture
+def app():
+    app = create_app(ConfigPruebas)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,33 @@
+"""
+Pruebas del script de actualización del esquema
+"""
+import os
+import sys
+from sqlalchemy import inspect, text
+from app.extensions import db
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from actualizar_esquema import sentencias_pendientes  # noqa: E402
+
+
+def test_agrega_columnas_e_indices_faltantes(app):
+    assert sentencias_pendientes(db.engine, inspect(db.engine)) == ([], [])
+    
+    # Base anterior a las columnas nuevas
+    with db.engine.begin() as conexion:
+        conexion.execute(text('DROP INDEX ix_datasets_content_hash'))
+        conexion.execute(text('ALTER TABLE datasets DROP COLUMN content_hash'))
+        conexion.execute(text('ALTER TABLE denuncias_web DROP COLUMN hash_fila'))
+    
+    sentencias, advertencias = sentencias_pendientes(db.engine, inspect(db.engine))
+    assert advertencias == []
+    assert sentencias == [
+        'ALTER TABLE datasets ADD COLUMN content_hash VARCHAR(64) NULL',
+        'CREATE INDEX ix_datasets_content_hash ON datasets (content_hash)',
+        'ALTER TABLE denuncias_web ADD COLUMN hash_fila VARCHAR(16) NULL',
+    ]
+    with db.engine.begin() as conexion:
+        for sentencia in sentencias:
+            conexion.execute(text(sentencia))
+    assert sentencias_pendientes(db.engine, inspect(db.engine)) == ([], [])
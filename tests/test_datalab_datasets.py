@@ -0,0 +1,106 @@
+"""
+Pruebas de la creación de datasets: archivos compartidos por contenido,
+reutilización de subidas repetidas y agregado de filas
+"""
+import io
+import os
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.blueprints.datalab.services import (
+    agregar_filas, buscar_dataset_por_contenido, procesar_dataset, procesar_lote
+)
+from app.models.dataset import Dataset
+from app.services.file_storage import save_content_addressed
+
+
+@pytest.fixture
+def carpeta(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.config['TRABAJOS_PROCESOS_POR_TAREA'] = 1
+    return app
+
+
+def _guardar(contenido, nombre):
+    archivo = FileStorage(stream=io.BytesIO(contenido.encode('utf-8')), filename=nombre)
+    ruta, content_hash, _ = save_content_addressed(archivo, 1)
+    return {'file_path': ruta, 'original_filename': nombre, 'content_hash': content_hash}
+
+
+def test_subida_repetida_reutiliza_archivo_y_dataset(carpeta):
+    archivo = _guardar('a,b\n1,2\n', 'datos.csv')
+    dataset, _ = procesar_dataset(archivo['file_path'], 'datos.csv', 'Datos', 1, 1,
+                                  content_hash=archivo['content_hash'])
+
+    ruta, content_hash, ya_existia = save_content_addressed(
+        FileStorage(stream=io.BytesIO(b'a,b\n1,2\n'), filename='copia.csv'), 1)
+    assert (ruta, content_hash, ya_existia) == (archivo['file_path'], archivo['content_hash'], True)
+    assert buscar_dataset_por_contenido(1, content_hash).id == dataset.id
+    assert buscar_dataset_por_contenido(2, content_hash) is None
+
+
+def test_error_no_borra_un_archivo_compartido(carpeta):
+    archivo = _guardar('a,b\n1,2\n3,4\n', 'datos.csv')
+    dataset, error = procesar_dataset(archivo['file_path'], 'datos.csv', 'Datos', 1, 1,
+                                      content_hash=archivo['content_hash'])
+    assert error is None
+
+    # Otra subida del mismo contenido falla (extensión equivocada): el archivo sigue siendo del primero
+    _, error = procesar_dataset(archivo['file_path'], 'datos.xlsx', 'Otro', 1, 1)
+    assert error
+    assert os.path.exists(dataset.stored_path)
+
+
+def test_lote_separado_reutiliza_datasets_por_contenido(carpeta):
+    archivos = [_guardar('a,b\n1,2\n', 'uno.csv'), _guardar('c\n5\n6\n', 'dos.csv')]
+    datasets, _, error = procesar_lote(archivos, 'Lote', 1, 1)
+    assert error is None
+    assert [dataset.content_hash for dataset in datasets] == [archivo['content_hash'] for archivo in archivos]
+
+    # Subir solo uno de los archivos, o el lote de nuevo, reutiliza los datasets
+    assert buscar_dataset_por_contenido(1, archivos[1]['content_hash']).id == datasets[1].id
+    repetidos, _, error = procesar_lote(archivos, 'Lote', 1, 1)
+    assert error is None
+    assert sorted(dataset.id for dataset in repetidos) == sorted(dataset.id for dataset in datasets)
+    assert Dataset.query.count() == 2
+
+
+def test_lote_concatenado_reutiliza_la_misma_concatenacion(carpeta):
+    archivos = [_guardar('a\n1\n', 'uno.csv'), _guardar('a\n2\n', 'dos.csv')]
+    (dataset,), _, _ = procesar_lote(archivos, 'Juntos', 1, 1, concatenar=True)
+    assert dataset.content_hash not in {archivo['content_hash'] for archivo in archivos}
+
+    (repetido,), _, _ = procesar_lote(archivos, 'Juntos', 1, 1, concatenar=True)
+    assert repetido.id == dataset.id
+
+    # Otro orden da otra columna de origen: es otro dataset (se vuelven a subir, el
+    # dataset concatenado solo conserva el primer archivo)
+    archivos = [_guardar('a\n2\n', 'dos.csv'), _guardar('a\n1\n', 'uno.csv')]
+    (invertido,), _, _ = procesar_lote(archivos, 'Juntos', 1, 1, concatenar=True)
+    assert invertido.id != dataset.id
+
+
+def test_agregar_filas_combina_perfil_y_graficos(carpeta):
+    filas = ''.join(f'2024-01-{dia:02d},{dia},{"N" if dia % 2 else "S"}\n' for dia in range(1, 21))
+    archivo = _guardar('fecha,monto,zona\n' + filas, 'enero.csv')
+    dataset, _ = procesar_dataset(archivo['file_path'], 'enero.csv', 'Ventas', 1, 1,
+                                  content_hash=archivo['content_hash'])
+
+    filas = ''.join(f'2024-02-{dia:02d},{dia * 10},E\n' for dia in range(1, 11))
+    archivo = _guardar('fecha,monto,zona\n' + filas, 'febrero.csv')
+    dataset, agregadas, error = agregar_filas(dataset, archivo['file_path'], 'febrero.csv', 1, 1)
+    assert (agregadas, error) == (10, None)
+    assert dataset.rows_count == 30
+    # Ya no es el contenido de ningún archivo subido
+    assert dataset.content_hash is None
+
+    columnas = dataset.get_profile()['columns']
+    assert columnas['zona']['top_values'] == {'N': 10, 'S': 10, 'E': 10}
+    assert (columnas['monto']['min'], columnas['monto']['max']) == (1, 100)
+    assert columnas['monto']['mean'] == pytest.approx((210 + 550) / 30)
+    assert columnas['fecha']['unique_count'] == 30
+
+    graficos = {grafico['title']: grafico['data'] for grafico in dataset.get_charts().values()}
+    assert sum(graficos['Distribución: monto']['counts']) == 30
+    serie = graficos['Tendencia temporal: monto']
+    assert serie['x'][-1] == '2024-02-10' and serie['y'][-1] == 100
+    assert len(serie['x']) == 30
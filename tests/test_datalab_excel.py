@@ -0,0 +1,46 @@
+"""
+Pruebas de la lectura de Excel por bloques
+"""
+import pandas as pd
+from openpyxl import Workbook
+from app.services.datalab_excel import iter_excel_chunks, read_excel_chunked
+
+
+def _libro(path, filas):
+    libro = Workbook()
+    hoja = libro.active
+    for fila in filas:
+        hoja.append(fila)
+    libro.save(path)
+    return str(path)
+
+
+def test_indice_es_la_fila_de_la_hoja(tmp_path):
+    path = _libro(tmp_path / 'hoja.xlsx', [
+        ['ID', 'EDAD'], [1, 30], [None, None], [2, 41], [3, 25], [None, None], [4, 50], [None, None]
+    ])
+    bloques = list(iter_excel_chunks(path, chunk_rows=2))
+    assert [list(bloque.index) for bloque in bloques] == [[2, 4], [5, 7]]
+    
+    # Como read_excel: las filas vacías intermedias se conservan y las del final no
+    df = read_excel_chunked(path, chunk_rows=2)
+    assert list(df.index) == [0, 1, 2, 3, 4, 5]
+    pd.testing.assert_frame_equal(df, pd.read_excel(path))
+
+
+def test_dtype_estable_entre_bloques(tmp_path):
+    path = _libro(tmp_path / 'hoja.xlsx', [
+        ['DNI', 'MONTO', 'CODIGO'],
+        [30111222, 10, 'A1'],
+        [30111223, 11.5, 'B2'],
+        [None, 12, 7],
+        [30111224, None, 8],
+    ])
+    bloques = list(iter_excel_chunks(path, chunk_rows=2))
+    assert bloques[0]['DNI'].dtype == 'int64'
+    # Un nulo no convierte la columna a float64 solo en este bloque
+    assert bloques[1]['DNI'].astype(str).tolist() == ['None', '30111224']
+    assert bloques[1]['MONTO'].dtype == bloques[0]['MONTO'].dtype == 'float64'
+    assert bloques[1]['CODIGO'].dtype == object
+    
+    pd.testing.assert_frame_equal(read_excel_chunked(path, chunk_rows=2), pd.read_excel(path))
@@ -0,0 +1,60 @@
+"""
+Pruebas de la consola SQL de DataLab: solo consultas SELECT sobre los
+datasets de la unidad, sin acceso a archivos ni a la red
+"""
+import io
+import json
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.blueprints.datalab.services import procesar_dataset
+from app.services.datalab_sql import ConsultaInvalida, execute_query
+from app.services.file_storage import save_content_addressed
+
+
+@pytest.fixture
+def ventas(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    contenido = 'zona,monto\nN,10\nS,20\nN,5\n'
+    ruta, content_hash, _ = save_content_addressed(
+        FileStorage(stream=io.BytesIO(contenido.encode('utf-8')), filename='ventas.csv'), 1)
+    dataset, error = procesar_dataset(ruta, 'ventas.csv', 'Ventas', 1, 1, content_hash=content_hash)
+    assert error is None
+    return dataset
+
+
+def _consultar(sql, unidad_id=1):
+    return json.loads(''.join(execute_query(unidad_id, sql).iter_json()))
+
+
+def test_select_sobre_los_datasets_de_la_unidad(ventas):
+    resultado = _consultar('SELECT zona, sum(monto) AS total FROM ventas GROUP BY zona ORDER BY zona')
+    assert resultado['columnas'] == ['zona', 'total']
+    assert resultado['filas'] == [['N', 15], ['S', 20]]
+    assert resultado['error'] is None
+
+    # Otra unidad no ve la tabla
+    with pytest.raises(ConsultaInvalida):
+        execute_query(2, 'SELECT * FROM ventas')
+
+
+@pytest.mark.parametrize('sql, mensaje', [
+    ('DELETE FROM ventas', 'Solo se admiten consultas SELECT'),
+    ('CREATE TABLE copia AS SELECT * FROM ventas', 'Solo se admiten consultas SELECT'),
+    ("ATTACH 'otra.db'", 'Solo se admiten consultas SELECT'),
+    ('SET enable_external_access = true', 'Solo se admiten consultas SELECT'),
+    ('SELECT 1; DROP TABLE ventas', 'una sola consulta'),
+])
+def test_rechaza_lo_que_no_es_un_select(ventas, sql, mensaje):
+    with pytest.raises(ConsultaInvalida, match=mensaje):
+        execute_query(1, sql)
+
+
+def test_rechaza_el_acceso_a_archivos(ventas, tmp_path):
+    secreto = tmp_path / 'secreto.csv'
+    secreto.write_text('clave\n1234\n')
+    for sql in (f"SELECT * FROM read_csv('{secreto}')",
+                f"SELECT * FROM '{secreto}'",
+                f"SELECT * FROM read_parquet('{ventas.parquet_path}/*.parquet')",
+                "SELECT * FROM read_csv('https://example.com/datos.csv')"):
+        with pytest.raises(ConsultaInvalida, match='disabled'):
+            execute_query(1, sql)
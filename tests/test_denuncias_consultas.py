@@ -0,0 +1,104 @@
+"""
+Pruebas de las consultas de denuncias: resumen pre-agregado, paginación
+del drill-down y exportación
+"""
+import csv
+import io
+import random
+from datetime import datetime
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from app.blueprints.datalab.services_denuncias import (
+    COLUMNAS_EXCEL, FACETAS, SliceInvalido, _calcular_datos_resumen, aplicar_filtros, carga_publicada,
+    combinar_grupos, consulta_denuncias, exportar_csv, exportar_xlsx, listar_denuncias, medidas_dashboard,
+    sincronizar_archivo_denuncias, total_segmento
+)
+
+
+@pytest.fixture
+def denuncias(app, tmp_path):
+    """300 denuncias al azar publicadas en la unidad 1 (unas 4 por fecha de registro)"""
+    azar = random.Random(1)
+    filas = [{
+        'ID': i,
+        'FECHA DE REGISTRO': f'{azar.randint(1, 28):02d}/{azar.randint(1, 3):02d}/2024',
+        'DEPARTAMENTO': azar.choice(['Capital', 'Norte', 'Sur']),
+        'DIVISION': azar.choice(['A', 'B', None]),
+        'SINAR A CARGO': azar.choice(['S1', 'S2']),
+        'TIPO/ORIGEN': azar.choice(['Web', 'Fiscalía']),
+        'ESTADO_NOMBRE': azar.choice(['Abierta', 'Cerrada', 'Elevada']),
+        'AVANCE': azar.choice([None, 10, 35, 65, 90, 100]),
+        'NOMBRE DEL ACTUARIO': azar.choice(['Pérez', 'Gómez', None]),
+    } for i in range(1, 301)]
+    ruta = tmp_path / 'denuncias.xlsx'
+    pd.DataFrame(filas).to_excel(ruta, index=False)
+    _, error = sincronizar_archivo_denuncias(str(ruta), 1, 1)
+    assert error is None
+    return carga_publicada(1)
+
+
+def _datos_tabla_base(carga, filtros):
+    """Datos del dashboard calculados sobre denuncias_web, sin el resumen"""
+    query = aplicar_filtros(consulta_denuncias(1, carga), filtros)
+    columnas = [columna.label(clave) for clave, columna in FACETAS.items()]
+    columnas += [expresion.label(nombre) for nombre, expresion in medidas_dashboard()]
+    return combinar_grupos(query.with_entities(*columnas).group_by(*FACETAS.values()).all())
+
+
+@pytest.mark.parametrize('filtros', [
+    None,
+    {'departamentos': ['Norte']},
+    {'estados': ['Abierta', 'Elevada'], 'tipos': ['Web'], 'fecha_desde': datetime(2024, 2, 1)},
+])
+def test_resumen_igual_a_la_tabla_base(denuncias, filtros):
+    datos = _calcular_datos_resumen(denuncias, filtros)
+    datos.pop('opciones_filtros')
+    assert datos == _datos_tabla_base(denuncias, filtros)
+
+
+def test_paginacion_por_cursor_sin_huecos_ni_repetidas(denuncias):
+    filtros = {'departamentos': ['Capital', 'Sur']}
+    esperadas = {denuncia.id for denuncia in aplicar_filtros(consulta_denuncias(1, denuncias), filtros)}
+
+    vistas, cursor = [], None
+    while True:
+        pagina = listar_denuncias(1, filtros, limite=7, cursor=cursor)
+        vistas += [registro['id'] for registro in pagina['registros']]
+        if cursor is None:
+            assert pagina['total'] == len(esperadas)
+        cursor = pagina['siguiente']
+        if not cursor:
+            break
+
+    assert len(vistas) == len(set(vistas))
+    assert set(vistas) == esperadas
+
+
+def test_slice_no_soportado(denuncias):
+    assert total_segmento(1, None, 'estados', 'Abierta') == \
+        consulta_denuncias(1).filter_by(estado_nombre='Abierta').count()
+    with pytest.raises(SliceInvalido):
+        listar_denuncias(1, slice_tipo='provincias', slice_label='Norte')
+
+
+def test_exportar_csv(denuncias):
+    filtros = {'estados': ['Cerrada']}
+    partes = list(exportar_csv(1, filtros))
+
+    # El encabezado se envía solo, antes de las filas
+    assert partes[0] == '\ufeff' + ','.join(COLUMNAS_EXCEL) + '\r\n'
+    filas = list(csv.reader(io.StringIO(''.join(partes)[1:])))
+    assert filas[0] == list(COLUMNAS_EXCEL)
+    assert len(filas) - 1 == consulta_denuncias(1).filter_by(estado_nombre='Cerrada').count()
+    estado = filas[0].index('ESTADO_NOMBRE')
+    assert {fila[estado] for fila in filas[1:]} == {'Cerrada'}
+
+
+def test_exportar_xlsx(denuncias):
+    libro = load_workbook(io.BytesIO(b''.join(exportar_xlsx(1, {'departamentos': ['Norte']}))), read_only=True)
+    filas = list(libro['Denuncias'].iter_rows(values_only=True))
+    assert list(filas[0]) == list(COLUMNAS_EXCEL)
+    assert len(filas) - 1 == consulta_denuncias(1).filter_by(departamento='Norte').count()
+    departamento = filas[0].index('DEPARTAMENTO')
+    assert {fila[departamento] for fila in filas[1:]} == {'Norte'}
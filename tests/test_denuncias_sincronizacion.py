@@ -0,0 +1,47 @@
+"""
+Pruebas de la sincronización incremental de denuncias web
+"""
+import pandas as pd
+from app.extensions import db
+from app.models.denuncia_web import DenunciaWeb
+from app.blueprints.datalab.services_denuncias import sincronizar_archivo_denuncias
+
+
+def _excel(path, filas):
+    pd.DataFrame(filas).to_excel(path, index=False)
+    return str(path)
+
+
+def _fila(id_excel, edad):
+    return {'ID': id_excel, 'FECHA DE REGISTRO': '01/03/2024', 'DEPARTAMENTO': 'Capital', 'EDAD': edad}
+
+
+def test_mismo_archivo_no_actualiza_filas(app, tmp_path):
+    filas = [_fila(1, 30), _fila(2, 41), _fila(3, 25)]
+    resumen, error = sincronizar_archivo_denuncias(_excel(tmp_path / 'uno.xlsx', filas), 1, 1)
+    assert error is None
+    assert resumen['insertadas'] == 3
+    
+    resumen, error = sincronizar_archivo_denuncias(_excel(tmp_path / 'dos.xlsx', filas), 1, 1)
+    assert resumen == {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 3, 'retiradas': 0}
+
+
+def test_celda_vacia_no_cambia_el_hash(app, tmp_path):
+    filas = [_fila(1, 30), _fila(2, 41), _fila(3, 25)]
+    sincronizar_archivo_denuncias(_excel(tmp_path / 'uno.xlsx', filas), 1, 1)
+    
+    # Una fila nueva con EDAD vacía convierte la columna de int64 a float64
+    resumen, error = sincronizar_archivo_denuncias(_excel(tmp_path / 'dos.xlsx', filas + [_fila(4, None)]), 1, 1)
+    assert error is None
+    assert resumen == {'insertadas': 1, 'actualizadas': 0, 'sin_cambios': 3, 'retiradas': 0}
+
+
+def test_id_vacio_no_duplica_claves(app, tmp_path):
+    filas = [_fila(1, 30), _fila(2, 41), _fila(3, 25)]
+    sincronizar_archivo_denuncias(_excel(tmp_path / 'uno.xlsx', filas), 1, 1)
+    
+    # Una fila sin ID convierte la columna ID a float64 (1.0, 2.0, ...)
+    resumen, error = sincronizar_archivo_denuncias(_excel(tmp_path / 'dos.xlsx', filas + [_fila(None, 50)]), 1, 1)
+    assert resumen == {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 3, 'retiradas': 0}
+    assert 'ID vacío' in error
+    assert sorted(valor for (valor,) in db.session.query(DenunciaWeb.id_excel)) == ['1', '2', '3']
@@ -0,0 +1,89 @@
+"""
+Pruebas de la subida de archivos: cuota de la unidad y subidas por partes
+"""
+import hashlib
+import io
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.extensions import db
+from app.models.subida import Subida
+from app.services.file_storage import save_content_addressed, save_uploaded_file
+from app.services.subidas import (
+    PosicionIncorrecta, SubidaInvalida, agregar_bloque, finalizar_subida, iniciar_subida, obtener_subida
+)
+
+
+MEGABYTE = 1024 * 1024
+
+
+@pytest.fixture
+def cuota(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.config['DATALAB_CUOTA_UNIDAD_MB'] = 1
+    return app
+
+
+def _archivo(tamano, nombre='datos.csv'):
+    return FileStorage(stream=io.BytesIO(b'a' * tamano), filename=nombre)
+
+
+def test_cuota_en_todas_las_formas_de_guardar(cuota):
+    save_uploaded_file(_archivo(600 * 1024), 1)
+    
+    with pytest.raises(ValueError, match='cuota'):
+        save_uploaded_file(_archivo(600 * 1024), 1)
+    with pytest.raises(ValueError, match='cuota'):
+        save_content_addressed(_archivo(600 * 1024), 1)
+    with pytest.raises(SubidaInvalida, match='cuota'):
+        iniciar_subida(1, 1, 'grande.csv', 600 * 1024)
+    
+    # Otra unidad tiene su propia cuota
+    save_content_addressed(_archivo(600 * 1024), 2)
+
+
+def test_subida_en_curso_reserva_cuota(cuota):
+    iniciar_subida(1, 1, 'grande.csv', 800 * 1024)
+    with pytest.raises(ValueError, match='cuota'):
+        save_uploaded_file(_archivo(300 * 1024), 1)
+
+
+def test_subida_por_partes_se_retoma(cuota):
+    contenido = b'a,b\n1,2\n3,4\n'
+    subida = iniciar_subida(1, 1, 'datos.csv', len(contenido))
+    assert agregar_bloque(subida, 0, io.BytesIO(contenido[:4])) == 4
+    
+    # Reintento de un bloque ya guardado y bloque adelantado: se indica desde dónde seguir
+    for offset in (0, 8):
+        with pytest.raises(PosicionIncorrecta) as error:
+            agregar_bloque(subida, offset, io.BytesIO(contenido[offset:offset + 4]))
+        assert error.value.recibido == 4
+    with pytest.raises(SubidaInvalida, match='incompleta'):
+        finalizar_subida(subida, ['csv'])
+    
+    # Se retoma en otra petición desde lo recibido
+    retomada = obtener_subida(subida.id, 1, 1)
+    assert retomada.recibido == 4
+    with pytest.raises(SubidaInvalida, match='excede'):
+        agregar_bloque(retomada, 4, io.BytesIO(contenido[4:] + b'5,6\n'))
+    assert agregar_bloque(retomada, 4, io.BytesIO(contenido[4:])) == len(contenido)
+    
+    ruta, content_hash, _ = finalizar_subida(retomada, ['csv'])
+    with open(ruta, 'rb') as archivo:
+        assert archivo.read() == contenido
+    assert content_hash == hashlib.sha256(contenido).hexdigest()
+    assert obtener_subida(subida.id, 1, 1) is None
+
+
+def test_bloque_simultaneo_no_pisa_el_archivo(cuota):
+    subida = iniciar_subida(1, 1, 'datos.csv', 8)
+    # Otra petición leyó la subida antes de que se registrara el primer bloque
+    obsoleta = Subida(id=subida.id, unidad_id=1, user_id=1, filename='datos.csv', tamano=8, recibido=0,
+                      ruta=subida.ruta)
+    
+    assert agregar_bloque(subida, 0, io.BytesIO(b'AAAA')) == 4
+    with pytest.raises(PosicionIncorrecta) as error:
+        agregar_bloque(obsoleta, 0, io.BytesIO(b'BBBBBB'))
+    assert error.value.recibido == 4
+    with open(subida.ruta, 'rb') as archivo:
+        assert archivo.read() == b'AAAA'
+    assert db.session.get(Subida, subida.id).recibido == 4
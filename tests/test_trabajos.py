@@ -0,0 +1,157 @@
+"""
+Pruebas de los trabajos en segundo plano
+"""
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from app.extensions import db
+from app.models.trabajo import Trabajo
+from app.services.trabajos import (
+    MENSAJE_SIN_MEMORIA, MENSAJE_VENCIDO, TrabajoFallido, _al_terminar, encolar_trabajo, ejecutar_trabajo,
+    tarea, trabajo_activo
+)
+
+
+completados = []
+completado = threading.Event()
+
+
+@tarea('prueba_avance', al_completar=lambda trabajo: (completados.append(trabajo.id), completado.set()))
+def tarea_avance(trabajo, avance, valor):
+    avance(50, 'Mitad')
+    fila = db.session.get(Trabajo, trabajo.id, populate_existing=True)
+    return {'valor': valor, 'progreso_visto': fila.progreso, 'etapa_vista': fila.etapa}
+
+
+@tarea('prueba_memoria')
+def tarea_memoria(trabajo, avance):
+    raise MemoryError()
+
+
+@tarea('prueba_falla')
+def tarea_falla(trabajo, avance):
+    raise TrabajoFallido('Archivo inválido')
+
+
+@tarea('prueba_vencida', al_vencer=lambda trabajo: open(trabajo.get_parametros()['marca'], 'w').close())
+def tarea_vencida(trabajo, avance, marca=None):
+    # Mientras corre, el trabajo se da por vencido (por ejemplo, desde otro worker)
+    Trabajo.query.filter_by(id=trabajo.id).update({'estado': Trabajo.FALLIDO, 'error': MENSAJE_VENCIDO})
+    db.session.commit()
+    return {'mensaje': 'terminó tarde'}
+
+
+def _trabajo(estado, minutos_sin_latido, creado_hace=None, tipo='prueba_avance', **parametros):
+    """Trabajo cuyo último latido fue hace `minutos_sin_latido` minutos"""
+    ahora = datetime.utcnow()
+    trabajo = Trabajo(unidad_id=1, user_id=1, tipo=tipo, estado=estado,
+                      created_at=ahora - timedelta(minutes=creado_hace or minutos_sin_latido),
+                      actualizado_at=ahora - timedelta(minutes=minutos_sin_latido))
+    trabajo.set_parametros(parametros)
+    db.session.add(trabajo)
+    db.session.commit()
+    return trabajo.id
+
+
+def _estado(trabajo_id):
+    return db.session.get(Trabajo, trabajo_id, populate_existing=True)
+
+
+def test_encolar_sincronico_registra_avance_y_resultado(app):
+    app.config['TRABAJOS_SINCRONICOS'] = True
+    trabajo = encolar_trabajo('prueba_avance', 1, 1, valor=7)
+
+    assert trabajo.estado == Trabajo.COMPLETADO
+    assert trabajo.progreso == 100
+    assert trabajo.get_resultado() == {'valor': 7, 'progreso_visto': 50, 'etapa_vista': 'Mitad'}
+    assert trabajo.id in completados
+
+
+def test_errores_de_la_tarea(app):
+    app.config['TRABAJOS_SINCRONICOS'] = True
+    assert encolar_trabajo('prueba_memoria', 1, 1).error == MENSAJE_SIN_MEMORIA
+    fallido = encolar_trabajo('prueba_falla', 1, 1)
+    assert (fallido.estado, fallido.error) == (Trabajo.FALLIDO, 'Archivo inválido')
+
+
+def test_tope_de_memoria_del_proceso():
+    codigo = ('from app.services.trabajos import _limitar_memoria\n'
+              '_limitar_memoria(512)\n'
+              'try:\n'
+              '    bytearray(1024 * 1024 * 1024)\n'
+              'except MemoryError:\n'
+              '    print("MemoryError")\n')
+    salida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, timeout=60)
+    assert 'MemoryError' in salida.stdout
+
+
+def test_al_terminar_marca_fallido_si_el_pool_se_rompe(app):
+    app.config['TRABAJOS_MEMORIA_MB'] = 2048
+    trabajo_id = _trabajo(Trabajo.EN_CURSO, 0)
+    futuro = Future()
+    futuro.set_exception(BrokenProcessPool('proceso terminado'))
+
+    class Ejecutor:
+        def shutdown(self, wait=True):
+            pass
+
+    _al_terminar(app, trabajo_id, Ejecutor(), futuro)
+    trabajo = _estado(trabajo_id)
+    assert trabajo.estado == Trabajo.FALLIDO
+    assert MENSAJE_SIN_MEMORIA in trabajo.error
+
+
+def test_al_terminar_ejecuta_la_accion_al_completar(app):
+    trabajo_id = _trabajo(Trabajo.COMPLETADO, 0)
+    futuro = Future()
+    futuro.set_result(None)
+    completado.clear()
+
+    _al_terminar(app, trabajo_id, None, futuro)
+    assert completado.wait(5)
+    assert trabajo_id in completados
+
+
+def test_trabajo_sin_latido_vence_y_descarta_su_archivo(app, tmp_path):
+    app.config['TRABAJOS_VENCIMIENTO_MINUTOS'] = 10
+    marca = tmp_path / 'descartado'
+    en_curso = _trabajo(Trabajo.EN_CURSO, 30, tipo='prueba_vencida', marca=str(marca))
+    pendiente = _trabajo(Trabajo.PENDIENTE, 30)
+
+    assert trabajo_activo(1, ['prueba_avance', 'prueba_vencida']) is None
+    for trabajo_id in (en_curso, pendiente):
+        trabajo = _estado(trabajo_id)
+        assert trabajo.estado == Trabajo.FALLIDO
+        assert trabajo.error == MENSAJE_VENCIDO
+    assert marca.exists()
+
+
+def test_trabajo_en_cola_con_latido_no_vence(app):
+    app.config['TRABAJOS_VENCIMIENTO_MINUTOS'] = 10
+    # Espera en un pool ocupado desde hace horas, pero su worker sigue vivo
+    trabajo_id = _trabajo(Trabajo.PENDIENTE, 1, creado_hace=300)
+
+    assert trabajo_activo(1, ['prueba_avance']).id == trabajo_id
+
+    app.config['TRABAJOS_VENCIMIENTO_MINUTOS'] = 0
+    _trabajo(Trabajo.EN_CURSO, 10 * 24 * 60)
+    assert trabajo_activo(1, ['prueba_avance']).estado == Trabajo.EN_CURSO
+
+
+def test_trabajo_vencido_no_se_ejecuta(app):
+    trabajo_id = _trabajo(Trabajo.FALLIDO, 30, valor=1)
+    ejecutar_trabajo(trabajo_id)
+    trabajo = _estado(trabajo_id)
+    assert trabajo.estado == Trabajo.FALLIDO
+    assert trabajo.iniciado_at is None
+
+
+def test_completar_no_pisa_un_trabajo_vencido(app):
+    trabajo_id = _trabajo(Trabajo.PENDIENTE, 0, tipo='prueba_vencida')
+    ejecutar_trabajo(trabajo_id)
+    trabajo = _estado(trabajo_id)
+    assert trabajo.estado == Trabajo.FALLIDO
+    assert trabajo.get_resultado() == {}